@@ -1,9 +1,10 @@
-from typing import List, Optional
+import datetime as dt
+from typing import List, Optional, Tuple
 
-from sqlalchemy import text
+from sqlalchemy import func, insert, text, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
 from . import models, schemas
 from .auth import get_password_hash
@@ -49,6 +50,17 @@ async def get_piles(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[m
     return result.scalars().all()
 
 
+async def get_piles_by_ids(db: AsyncSession, pile_ids: List[int]) -> List[models.ChargingPile]:
+    result = await db.execute(select(models.ChargingPile).filter(models.ChargingPile.pile_id.in_(pile_ids)))
+    return result.scalars().all()
+
+
+async def update_piles_bulk(db: AsyncSession, rows: List[dict]) -> None:
+    """Updates many piles, one dict of columns (including pile_id) per pile, as a batched UPDATE. Does not commit."""
+    if rows:
+        await db.execute(update(models.ChargingPile), rows)
+
+
 async def create_pile(db: AsyncSession, pile: schemas.ChargingPileCreate) -> models.ChargingPile:
     db_pile = models.ChargingPile(**pile.dict())
     db.add(db_pile)
@@ -127,6 +139,51 @@ async def create_request(db: AsyncSession, request: schemas.ChargingRequestCreat
     return db_request
 
 
+async def insert_requests_returning(db: AsyncSession, rows: List[dict]) -> List[models.ChargingRequest]:
+    """Inserts many requests with one INSERT ... RETURNING, in the order of `rows`. Does not commit."""
+    result = await db.scalars(
+        insert(models.ChargingRequest).returning(models.ChargingRequest, sort_by_parameter_order=True), rows
+    )
+    return list(result.all())
+
+
+async def update_request_fields(db: AsyncSession, request_id: int, **values) -> None:
+    """Updates the given columns of a request with a single UPDATE. Does not commit."""
+    await db.execute(
+        update(models.ChargingRequest).where(models.ChargingRequest.request_id == request_id).values(**values)
+    )
+
+
+async def update_requests_bulk(db: AsyncSession, rows: List[dict]) -> None:
+    """
+    Updates many requests, one dict of columns (including request_id) per request, as a
+    batched UPDATE by primary key. Does not commit.
+    """
+    if rows:
+        await db.execute(update(models.ChargingRequest), rows)
+
+
+async def update_request_returning(db: AsyncSession, request_id: int, **values) -> Optional[models.ChargingRequest]:
+    """Like update_request_fields, but returns the updated row (UPDATE ... RETURNING). Does not commit."""
+    result = await db.execute(
+        update(models.ChargingRequest)
+        .where(models.ChargingRequest.request_id == request_id)
+        .values(**values)
+        .returning(models.ChargingRequest)
+    )
+    return result.scalars().first()
+
+
+async def get_request_watermark(db: AsyncSession) -> Tuple[int, int]:
+    """Highest request_id and number of active (WAITING/CHARGING) requests, in a single query."""
+    active = models.ChargingRequest.status.in_([models.RequestStatus.WAITING, models.RequestStatus.CHARGING])
+    result = await db.execute(
+        select(func.coalesce(func.max(models.ChargingRequest.request_id), 0), func.count().filter(active))
+    )
+    max_request_id, active_count = result.one()
+    return max_request_id, active_count
+
+
 async def get_user_active_request(db: AsyncSession, user_id: int) -> Optional[models.ChargingRequest]:
     result = await db.execute(
         select(models.ChargingRequest)
@@ -163,6 +220,14 @@ async def create_order(db: AsyncSession, order: schemas.ChargingOrderCreate) ->
     return db_order
 
 
+async def insert_orders_returning(db: AsyncSession, rows: List[dict]) -> List[models.ChargingOrder]:
+    """Inserts many orders with one INSERT ... RETURNING, in the order of `rows`. Does not commit."""
+    result = await db.scalars(
+        insert(models.ChargingOrder).returning(models.ChargingOrder, sort_by_parameter_order=True), rows
+    )
+    return list(result.all())
+
+
 async def get_order(db: AsyncSession, order_id: int) -> Optional[models.ChargingOrder]:
     result = await db.execute(select(models.ChargingOrder).filter(models.ChargingOrder.order_id == order_id))
     return result.scalars().first()
@@ -194,6 +259,45 @@ async def get_order_details(db: AsyncSession, order_id: int, user_id: int) -> Op
     return result.scalars().first()
 
 
+async def get_orders_for_rebilling(
+    db: AsyncSession,
+    after_order_id: int,
+    limit: int,
+    start_time: Optional[dt.datetime] = None,
+    end_time: Optional[dt.datetime] = None,
+    pile_type: Optional[models.PileType] = None,
+) -> list:
+    """
+    One keyset page of orders after `after_order_id`, by order_id, as plain rows with the
+    pile's type and power rate, for bulk re-billing. Orders are selected by their start
+    time, in [start_time, end_time).
+    """
+    query = (
+        select(
+            models.ChargingOrder.order_id,
+            models.ChargingOrder.pile_id,
+            models.ChargingPile.type.label("pile_type"),
+            models.ChargingPile.power_rate,
+            models.ChargingOrder.start_time,
+            models.ChargingOrder.end_time,
+            models.ChargingOrder.actual_charge_amount,
+            models.ChargingOrder.charge_fee,
+            models.ChargingOrder.service_fee,
+            models.ChargingOrder.total_fee,
+        )
+        .join(models.ChargingPile, models.ChargingOrder.pile_id == models.ChargingPile.pile_id)
+        .filter(models.ChargingOrder.order_id > after_order_id)
+    )
+    if start_time is not None:
+        query = query.filter(models.ChargingOrder.start_time >= start_time)
+    if end_time is not None:
+        query = query.filter(models.ChargingOrder.start_time < end_time)
+    if pile_type is not None:
+        query = query.filter(models.ChargingPile.type == pile_type)
+    result = await db.execute(query.order_by(models.ChargingOrder.order_id).limit(limit))
+    return result.all()
+
+
 # ===================
 # 报表 CRUD
 # ===================
@@ -205,6 +309,50 @@ async def create_report(db: AsyncSession, report: schemas.OperationalReportCreat
     return db_report
 
 
+# ===================
+# 电价 CRUD
+# ===================
+async def get_tariff_versions(db: AsyncSession) -> List[models.TariffVersion]:
+    """Every tariff version with its periods, in effective order."""
+    result = await db.execute(
+        select(models.TariffVersion)
+        .options(selectinload(models.TariffVersion.periods))
+        .order_by(models.TariffVersion.effective_from, models.TariffVersion.tariff_id)
+    )
+    return result.scalars().all()
+
+
+async def create_tariff_version(db: AsyncSession, version: schemas.TariffVersionCreate) -> models.TariffVersion:
+    db_version = models.TariffVersion(
+        **version.dict(exclude={"periods"}),
+        periods=[models.TariffPeriod(**period.dict()) for period in version.periods],
+    )
+    db.add(db_version)
+    await db.commit()
+    await db.refresh(db_version, ["periods"])
+    return db_version
+
+
+async def get_tariff_holidays(db: AsyncSession) -> List[models.TariffHoliday]:
+    result = await db.execute(select(models.TariffHoliday).order_by(models.TariffHoliday.holiday_date))
+    return result.scalars().all()
+
+
+async def set_tariff_holiday(db: AsyncSession, holiday: schemas.TariffHoliday) -> models.TariffHoliday:
+    db_holiday = await db.merge(models.TariffHoliday(**holiday.dict()))
+    await db.commit()
+    return db_holiday
+
+
+async def delete_tariff_holiday(db: AsyncSession, holiday_date: dt.date) -> bool:
+    db_holiday = await db.get(models.TariffHoliday, holiday_date)
+    if db_holiday is None:
+        return False
+    await db.delete(db_holiday)
+    await db.commit()
+    return True
+
+
 # ===================
 # 日志 CRUD
 # ===================
@@ -401,3 +549,11 @@ async def get_available_piles_by_type(db: AsyncSession, pile_type: models.PileTy
 async def get_pile_by_code(db: AsyncSession, pile_code: str) -> Optional[models.ChargingPile]:
     result = await db.execute(select(models.ChargingPile).where(models.ChargingPile.pile_code == pile_code))
     return result.scalars().first()
+
+
+async def get_all_piles(db: AsyncSession) -> List[models.ChargingPile]:
+    """
+    Get every charging pile in a single query, ordered by id.
+    """
+    result = await db.execute(select(models.ChargingPile).order_by(models.ChargingPile.pile_id))
+    return result.scalars().all()
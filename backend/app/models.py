@@ -1,6 +1,6 @@
 import enum
 
-from sqlalchemy import BigInteger, Column, Date, DateTime, Enum, ForeignKey, Integer, Numeric, String
+from sqlalchemy import BigInteger, Column, Date, DateTime, Enum, ForeignKey, Integer, Numeric, Sequence, String
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 
@@ -36,6 +36,12 @@ class RequestStatus(str, enum.Enum):
     CANCELLED = "CANCELLED"
 
 
+class TariffDayKind(str, enum.Enum):
+    WEEKDAY = "WEEKDAY"
+    WEEKEND = "WEEKEND"
+    HOLIDAY = "HOLIDAY"
+
+
 class ReportType(str, enum.Enum):
     DAILY = "DAILY"
     WEEKLY = "WEEKLY"
@@ -85,6 +91,17 @@ class ChargingRequest(Base):
     order = relationship("ChargingOrder", back_populates="request", uselist=False)
 
 
+# Queue numbers are allocated per charge type from these sequences. Each nextval()
+# reserves a block of INCREMENT numbers that a worker then hands out locally.
+QUEUE_NUMBER_BLOCK_SIZE = 20
+queue_number_sequences = {
+    RequestType.FAST: Sequence("queue_number_fast_seq", increment=QUEUE_NUMBER_BLOCK_SIZE, metadata=Base.metadata),
+    RequestType.TRICKLE: Sequence(
+        "queue_number_trickle_seq", increment=QUEUE_NUMBER_BLOCK_SIZE, metadata=Base.metadata
+    ),
+}
+
+
 class ChargingOrder(Base):
     __tablename__ = "chargingorders"
     order_id = Column(Integer, primary_key=True, index=True)
@@ -104,6 +121,43 @@ class ChargingOrder(Base):
     pile = relationship("ChargingPile", back_populates="orders")
 
 
+class TariffVersion(Base):
+    """
+    A time-of-use tariff in effect from `effective_from` until the next version for the
+    same pile type. Versions are never edited; a price change is a new version.
+    """
+
+    __tablename__ = "tariffversions"
+    tariff_id = Column(Integer, primary_key=True, index=True)
+    pile_type = Column(Enum(PileType, native_enum=False))  # NULL: every pile type
+    effective_from = Column(DateTime(timezone=True), nullable=False, index=True)
+    service_fee_per_kwh = Column(Numeric(10, 2), nullable=False)
+    description = Column(String(255))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    periods = relationship("TariffPeriod", back_populates="tariff", cascade="all, delete-orphan")
+
+
+class TariffPeriod(Base):
+    __tablename__ = "tariffperiods"
+    period_id = Column(Integer, primary_key=True, index=True)
+    tariff_id = Column(Integer, ForeignKey("tariffversions.tariff_id"), nullable=False, index=True)
+    day_kind = Column(Enum(TariffDayKind, native_enum=False), nullable=False)
+    start_minute = Column(Integer, nullable=False)  # Minute of the day, 0-1439
+    end_minute = Column(Integer, nullable=False)  # Exclusive, 1-1440
+    rate = Column(Numeric(10, 2), nullable=False)  # Yuan per kWh
+
+    tariff = relationship("TariffVersion", back_populates="periods")
+
+
+class TariffHoliday(Base):
+    """A date billed with the HOLIDAY periods of the tariff in effect."""
+
+    __tablename__ = "tariffholidays"
+    holiday_date = Column(Date, primary_key=True)
+    description = Column(String(255))
+
+
 class OperationalReport(Base):
     __tablename__ = "operationalreports"
     report_id = Column(Integer, primary_key=True, index=True)
@@ -0,0 +1,152 @@
+import json
+import os
+from pathlib import Path
+from typing import IO, Any, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Where the QueueManager keeps its snapshot and journal; can be overridden per deployment.
+# Only one process at a time may own a directory (see QueueJournal.acquire).
+QUEUE_STATE_DIR = Path(os.getenv("QUEUE_STATE_DIR", "queue_state"))
+
+
+class QueueJournal:
+    """
+    On-disk persistence of the QueueManager's in-memory state: a compact JSON snapshot
+    plus an append-only JSON-lines journal of the queue mutations made since it.
+
+    Every snapshot gets a new generation number and starts a new journal whose first
+    line carries that generation, so a journal is only ever replayed on top of the
+    snapshot it belongs to. Writing the snapshot is atomic (write then rename); a torn
+    last journal line, e.g. after a crash, is ignored.
+
+    The queues live in the memory of one process, so a state directory belongs to a
+    single process: the owner holds an exclusive lock on a lock file in it. With several
+    workers (uvicorn --workers N) only the first one to start gets the journal; the
+    others run without one and would not recover their queues after a restart. Run the
+    application as a single worker.
+    """
+
+    SNAPSHOT_FILE = "queue_snapshot.json"
+    JOURNAL_FILE = "queue_journal.jsonl"
+    LOCK_FILE = "queue_state.lock"
+
+    def __init__(self, directory: Path = QUEUE_STATE_DIR, snapshot_every: int = 1000, fsync: bool = False):
+        self.directory = Path(directory)
+        self.snapshot_path = self.directory / self.SNAPSHOT_FILE
+        self.journal_path = self.directory / self.JOURNAL_FILE
+        self.lock_path = self.directory / self.LOCK_FILE
+        # Number of journal records after which the owner should write a new snapshot
+        self.snapshot_every = snapshot_every
+        # Also fsync every journal record, not only snapshots (survives power loss, slower)
+        self.fsync = fsync
+        self.generation = 0
+        self.records_since_snapshot = 0
+        self._file: Optional[IO[str]] = None
+        self._lock_file: Optional[IO[bytes]] = None
+
+    def acquire(self) -> bool:
+        """
+        Takes the exclusive lock on the state directory without waiting. Returns False if
+        another process holds it; the lock is released by release() or when the process exits.
+        """
+        if self._lock_file is not None:
+            return True
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.lock_path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def release(self):
+        """Closes the journal and releases the lock on the state directory."""
+        self.close()
+        if self._lock_file is not None:
+            # Closing the file drops the lock
+            self._lock_file.close()
+            self._lock_file = None
+
+    def load(self) -> Optional[Tuple[Any, List[list]]]:
+        """
+        Reads the latest snapshot and the journal records written after it.
+        Returns None when there is no readable snapshot.
+        """
+        try:
+            snapshot = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            generation = snapshot["generation"]
+            state = snapshot["state"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        records = []
+        try:
+            with open(self.journal_path, encoding="utf-8") as journal:
+                header = json.loads(journal.readline() or "{}")
+                if header.get("generation") == generation:
+                    for line in journal:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            break  # Torn write at the end of the journal
+        except (OSError, ValueError):
+            pass  # No journal yet: the snapshot alone is the state
+
+        self.generation = generation
+        return state, records
+
+    def write_snapshot(self, state: Any):
+        """Atomically replaces the snapshot and starts an empty journal for it."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.generation += 1
+
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as snapshot:
+            json.dump({"generation": self.generation, "state": state}, snapshot, separators=(",", ":"))
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        self.close()
+        self._file = open(self.journal_path, "w", encoding="utf-8")
+        self._file.write(json.dumps({"generation": self.generation}) + "\n")
+        self._file.flush()
+        self.records_since_snapshot = 0
+
+    def append(self, record: list):
+        """Appends one mutation record. Records are only written once a snapshot exists."""
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.records_since_snapshot += 1
+
+    def needs_snapshot(self) -> bool:
+        return self.records_since_snapshot >= self.snapshot_every
+
+    def discard(self):
+        """Closes the journal and removes the snapshot, so that it is never restored."""
+        self.close()
+        for path in (self.snapshot_path, self.journal_path):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
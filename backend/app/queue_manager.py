@@ -1,59 +1,571 @@
-from collections import deque
-from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
+import contextlib
+import datetime as dt
+import heapq
+import itertools
+import time
+from collections import OrderedDict, deque
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import sqlalchemy as sa
-from sqlalchemy import func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from . import crud, models, schemas
+from .queue_journal import QueueJournal
+from .services.admission_service import admission_service
+from .services.clock_service import clock_service
+from .services.fixed_point import US_PER_HOUR, charge_duration_us, kw_to_w, kwh_to_wh, timedelta_to_us, w_to_kw
+from .services.queue_number_service import queue_number_service
+from .services.scheduler_trigger import scheduler_trigger
+
+
+WAITING_AREA_FULL = "Waiting area is full."
+
+
+class QueueEntry:
+    """
+    Compact in-memory record of a queued request, detached from any database session.
+    Holds only what scheduling, monitoring and the waiting-queue API need; the amount is
+    also kept as integer Wh for the engines. Changes are written to the database with
+    targeted UPDATEs rather than by merging ORM objects back into a session.
+    """
+
+    __slots__ = (
+        "request_id",
+        "user_id",
+        "queue_number",
+        "requested_charge_type",
+        "_requested_charge_amount",
+        "amount_wh",
+        "status",
+        "request_time",
+        "assigned_pile_id",
+        "start_time",
+    )
+
+    def __init__(
+        self,
+        request_id: int,
+        user_id: int,
+        queue_number: Optional[str],
+        requested_charge_type: models.RequestType,
+        requested_charge_amount: Decimal,
+        status: models.RequestStatus,
+        request_time: Optional[dt.datetime] = None,
+        assigned_pile_id: Optional[int] = None,
+        start_time: Optional[dt.datetime] = None,
+    ):
+        self.request_id = request_id
+        self.user_id = user_id
+        self.queue_number = queue_number
+        self.requested_charge_type = requested_charge_type
+        self.requested_charge_amount = requested_charge_amount
+        self.status = status
+        self.request_time = request_time
+        self.assigned_pile_id = assigned_pile_id
+        self.start_time = start_time
+
+    @classmethod
+    def from_model(cls, request: models.ChargingRequest) -> "QueueEntry":
+        return cls(
+            request_id=request.request_id,
+            user_id=request.user_id,
+            queue_number=request.queue_number,
+            requested_charge_type=request.requested_charge_type,
+            requested_charge_amount=request.requested_charge_amount,
+            status=request.status,
+            request_time=request.request_time,
+            assigned_pile_id=request.assigned_pile_id,
+            start_time=request.start_time,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready form used by the queue snapshot and journal."""
+        return {
+            "request_id": self.request_id,
+            "user_id": self.user_id,
+            "queue_number": self.queue_number,
+            "type": self.requested_charge_type.value,
+            "amount": str(self.requested_charge_amount),
+            "status": self.status.value,
+            "request_time": self.request_time.isoformat() if self.request_time else None,
+            "pile_id": self.assigned_pile_id,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QueueEntry":
+        return cls(
+            request_id=data["request_id"],
+            user_id=data["user_id"],
+            queue_number=data["queue_number"],
+            requested_charge_type=models.RequestType(data["type"]),
+            requested_charge_amount=Decimal(data["amount"]),
+            status=models.RequestStatus(data["status"]),
+            request_time=dt.datetime.fromisoformat(data["request_time"]) if data["request_time"] else None,
+            assigned_pile_id=data["pile_id"],
+            start_time=dt.datetime.fromisoformat(data["start_time"]) if data["start_time"] else None,
+        )
+
+    def update_from(self, other: "QueueEntry"):
+        """Copies the mutable fields of another entry for the same request."""
+        self.queue_number = other.queue_number
+        self.requested_charge_type = other.requested_charge_type
+        self.requested_charge_amount = other.requested_charge_amount
+        self.status = other.status
+        self.assigned_pile_id = other.assigned_pile_id
+        self.start_time = other.start_time
+
+    @property
+    def requested_charge_amount(self) -> Decimal:
+        return self._requested_charge_amount
+
+    @requested_charge_amount.setter
+    def requested_charge_amount(self, amount: Decimal):
+        self._requested_charge_amount = amount
+        self.amount_wh = kwh_to_wh(amount)
+
+    def __repr__(self) -> str:
+        return f"<QueueEntry {self.request_id} {self.queue_number} {self.status.value}>"
+
+
+class PileBacklog:
+    """
+    Running total of the work committed to a single pile, kept up to date on every
+    pile queue mutation so that wait-time lookups do not have to walk the queue.
+    Energy and power are kept as integer Wh / W.
+
+    - charging_end: projected end of the session currently charging, if any.
+    - queued_wh: energy requested by the vehicles at the pile that have not started yet.
+    """
+
+    def __init__(self, power_rate: Decimal):
+        self.power_w = kw_to_w(power_rate)
+        self.charging_end: Optional[dt.datetime] = None
+        self.queued_wh = 0
+
+    def duration_us(self, amount_wh: int) -> int:
+        if self.power_w <= 0:
+            return 0
+        return charge_duration_us(amount_wh, self.power_w)
+
+    def charging_end_for(self, request: QueueEntry) -> dt.datetime:
+        duration_us = self.duration_us(request.amount_wh)
+        return request.start_time + dt.timedelta(microseconds=duration_us)
+
+    def wait_us(self, now: dt.datetime) -> int:
+        """Time until a vehicle joining the pile queue now would start charging, in microseconds."""
+        wait_us = self.duration_us(self.queued_wh)
+        if self.charging_end and self.charging_end > now:
+            wait_us += timedelta_to_us(self.charging_end - now)
+        return wait_us
+
+    def wait_hours(self, now: dt.datetime) -> Decimal:
+        return Decimal(self.wait_us(now)) / Decimal(US_PER_HOUR)
+
+    def projected_free_at(self, now: dt.datetime) -> dt.datetime:
+        """Time at which the pile is projected to have worked through its whole queue."""
+        free_at = max(now, self.charging_end) if self.charging_end else now
+        return free_at + dt.timedelta(microseconds=self.duration_us(self.queued_wh))
+
+    def reset(self):
+        self.charging_end = None
+        self.queued_wh = 0
+
+
+class WaitingQueue:
+    """
+    FIFO queue of waiting requests indexed by request_id. Supports the deque operations
+    the scheduler uses (append, appendleft, popleft, remove, iteration) plus lookup and
+    removal by request_id, all in O(1). Membership is reported to the owning WaitingArea
+    so that its request index (and the queue journal) stay in sync.
+    """
+
+    def __init__(self, area: Optional["WaitingArea"] = None, name: str = ""):
+        self._entries: "OrderedDict[int, QueueEntry]" = OrderedDict()
+        self._area = area
+        self.name = name
+        # Held by operations that read this queue, await, and then mutate it
+        self.lock = asyncio.Lock()
+
+    def _added(self, request: QueueEntry, op: str):
+        if self._area is not None:
+            self._area._index(request, self)
+            self._area._record(op, self.name, request)
+
+    def _removed(self, request: QueueEntry):
+        if self._area is not None:
+            self._area._unindex(request)
+            self._area._record("waiting_remove", request.request_id)
+
+    def append(self, request: QueueEntry):
+        self._entries[request.request_id] = request
+        self._entries.move_to_end(request.request_id)
+        self._added(request, "waiting_append")
+
+    def appendleft(self, request: QueueEntry):
+        self._entries[request.request_id] = request
+        self._entries.move_to_end(request.request_id, last=False)
+        self._added(request, "waiting_appendleft")
+
+    def popleft(self) -> QueueEntry:
+        if not self._entries:
+            raise IndexError("pop from an empty waiting queue")
+        _, request = self._entries.popitem(last=False)
+        self._removed(request)
+        return request
+
+    def remove(self, request: QueueEntry):
+        if self.pop(request.request_id) is None:
+            raise ValueError("request is not in the waiting queue")
+
+    def pop(self, request_id: int) -> Optional[QueueEntry]:
+        """Removes and returns the request with this id, or None if it is not queued here."""
+        request = self._entries.pop(request_id, None)
+        if request is not None:
+            self._removed(request)
+        return request
+
+    def get(self, request_id: int) -> Optional[QueueEntry]:
+        return self._entries.get(request_id)
+
+    def head(self, count: int) -> List[QueueEntry]:
+        """The first `count` requests in queue order."""
+        return list(itertools.islice(self._entries.values(), count))
+
+    def clear(self):
+        for request in self._entries.values():
+            self._removed(request)
+        self._entries.clear()
+
+    def __contains__(self, request: QueueEntry) -> bool:
+        return request.request_id in self._entries
+
+    def __iter__(self) -> Iterator[QueueEntry]:
+        return iter(self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+
+class WaitingSlot:
+    """
+    A place in the waiting area, or in its overflow list, reserved for a request that is
+    still being written to the database. Used as a context manager: the slot is handed
+    back on exit unless fill() has put the request into its queue.
+    """
+
+    def __init__(self, area: "WaitingArea", overflow: bool = False):
+        self._area = area
+        self.overflow = overflow
+        self._held = True
+
+    def fill(self, request: QueueEntry):
+        self.release()
+        queue = self._area.overflow if self.overflow else self._area.queue_for(request.requested_charge_type)
+        queue.append(request)
+
+    def release(self):
+        if self._held:
+            self._held = False
+            if self.overflow:
+                self._area.overflow_reserved -= 1
+            else:
+                self._area.reserved -= 1
+
+    def __enter__(self) -> "WaitingSlot":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class WaitingArea:
+    """
+    The station's waiting area: one WaitingQueue per charge type plus an index from
+    request_id to its queue. Every membership change is passed to `recorder`, if set.
+
+    Capacity counts both the waiting requests and the slots reserved by admissions in
+    flight, so concurrent admissions cannot overfill the area while they await the database.
+
+    When the area is full, up to `overflow_capacity` further requests are admitted into
+    an overflow list. The scheduler does not see it; its requests move into their
+    waiting queues in arrival order as places free up, and while it is not empty every
+    new request joins its end, so nobody overtakes a request in the overflow list.
+    """
+
+    OVERFLOW = "OVERFLOW"
+
+    def __init__(self, capacity: int, overflow_capacity: int = 0):
+        self.capacity = capacity
+        self.reserved = 0
+        self.overflow_capacity = overflow_capacity
+        self.overflow_reserved = 0
+        self._queue_of: Dict[int, WaitingQueue] = {}
+        self.recorder: Optional[Callable[..., None]] = None
+        self.fast = WaitingQueue(self, models.RequestType.FAST.value)
+        self.trickle = WaitingQueue(self, models.RequestType.TRICKLE.value)
+        self.overflow = WaitingQueue(self, self.OVERFLOW)
+
+    def _record(self, op: str, *args):
+        if self.recorder is not None:
+            self.recorder(op, *args)
+
+    def _index(self, request: QueueEntry, queue: WaitingQueue):
+        previous = self._queue_of.get(request.request_id)
+        if previous is not None and previous is not queue:
+            # A request lives in a single queue
+            previous._entries.pop(request.request_id, None)
+        self._queue_of[request.request_id] = queue
+
+    def _unindex(self, request: QueueEntry):
+        self._queue_of.pop(request.request_id, None)
+
+    def queue_for(self, charge_type: models.RequestType) -> WaitingQueue:
+        return self.fast if charge_type == models.RequestType.FAST else self.trickle
+
+    def queue_named(self, name: str) -> WaitingQueue:
+        return self.overflow if name == self.OVERFLOW else self.queue_for(models.RequestType(name))
+
+    @property
+    def queues(self) -> Tuple[WaitingQueue, WaitingQueue, WaitingQueue]:
+        return self.fast, self.trickle, self.overflow
+
+    def find(self, request_id: int) -> Tuple[Optional[QueueEntry], Optional[WaitingQueue]]:
+        """Returns a waiting request and the queue holding it."""
+        queue = self._queue_of.get(request_id)
+        if queue is None:
+            return None, None
+        return queue.get(request_id), queue
+
+    def is_full(self) -> bool:
+        return len(self) + self.reserved >= self.capacity
+
+    def occupied(self) -> int:
+        """Places taken or reserved in the waiting area and the overflow list together."""
+        return len(self) + self.reserved + len(self.overflow) + self.overflow_reserved
+
+    def reserve(self) -> Optional[WaitingSlot]:
+        """
+        Reserves a place for a new request: in the waiting area if it has room and no
+        one is in the overflow list, else at the end of the overflow list. Returns None
+        if both are full.
+        """
+        overflow_in_use = bool(self.overflow) or self.overflow_reserved > 0
+        if not overflow_in_use and not self.is_full():
+            self.reserved += 1
+            return WaitingSlot(self)
+        if len(self.overflow) + self.overflow_reserved < self.overflow_capacity:
+            self.overflow_reserved += 1
+            return WaitingSlot(self, overflow=True)
+        return None
+
+    @contextlib.contextmanager
+    def holding(self, count: int) -> Iterator[None]:
+        """
+        Keeps `count` places taken, without checking the capacity, for requests that have
+        left their queues but may come back, e.g. a scheduler tick's dispatches until its
+        commit: admissions cannot take those places in the meantime.
+        """
+        self.reserved += count
+        try:
+            yield
+        finally:
+            self.reserved -= count
+
+    def promote_overflow(self) -> int:
+        """Moves requests from the overflow list into their waiting queues while there is room."""
+        promoted = 0
+        while self.overflow and not self.is_full():
+            request = self.overflow.popleft()
+            self.queue_for(request.requested_charge_type).append(request)
+            promoted += 1
+        return promoted
+
+    def __len__(self) -> int:
+        """Number of requests in the waiting queues, not counting the overflow list."""
+        return len(self.fast) + len(self.trickle)
 
 
 class QueueManager:
     """
     Manages the waiting area and charging pile queues in memory.
+
+    Concurrency: the queues are only mutated from the event loop, so each synchronous
+    step is atomic. Operations that read the queues, await the database and then act
+    on what they read hold the lock of every waiting queue and pile they touch, taken
+    through locked() in a fixed order (FAST before TRICKLE, then piles by id).
+    Operations on other queues and piles proceed in parallel. Admissions reserve
+    their waiting-area slot before awaiting instead of locking.
     """
 
     def __init__(self, waiting_area_capacity: int = 6, pile_queue_capacity: int = 2):
-        self.waiting_area_capacity = waiting_area_capacity
         self.pile_queue_capacity = pile_queue_capacity
 
         # In-memory queues for requests waiting for a pile
-        self.waiting_queue_fast: Deque[models.ChargingRequest] = deque()
-        self.waiting_queue_trickle: Deque[models.ChargingRequest] = deque()
+        self.waiting_area = WaitingArea(waiting_area_capacity)
+        self.waiting_queue_fast = self.waiting_area.fast
+        self.waiting_queue_trickle = self.waiting_area.trickle
 
         # In-memory queues for each pile (1 charging + 1 waiting)
-        self.pile_queues: Dict[int, Deque[models.ChargingRequest]] = {}
+        self.pile_queues: Dict[int, Deque[QueueEntry]] = {}
+        # Committed work per pile, maintained alongside pile_queues
+        self.pile_backlogs: Dict[int, PileBacklog] = {}
+        # One lock per pile queue, created on first use
+        self.pile_locks: Dict[int, asyncio.Lock] = {}
+        # Min-heap of (charging_end, pile_id) of the sessions being charged, pushed whenever
+        # a pile's charging_end is set. Entries are not removed when a session stops or
+        # its end moves; such stale entries no longer match the pile's backlog and are
+        # dropped when they reach the top.
+        self.completion_deadlines: List[Tuple[dt.datetime, int]] = []
+        # Set when a new earliest deadline is pushed, so the monitor can sleep until it
+        self.completions_changed = asyncio.Event()
+
+        # Incremented on every mutation of the queues (see _journal), so that projections
+        # built from them, e.g. for quotes, can tell when they are stale
+        self.version = 0
+
+        # Optional on-disk snapshot + journal of the state above, used for fast restarts
+        self.journal: Optional[QueueJournal] = None
+        self._journal_paused = False
+        # Highest request_id seen by the queues; checked against the database on restore
+        self.max_request_id = 0
+        self.waiting_area.recorder = self._journal
+
+    @property
+    def waiting_area_capacity(self) -> int:
+        return self.waiting_area.capacity
+
+    @waiting_area_capacity.setter
+    def waiting_area_capacity(self, capacity: int):
+        self.waiting_area.capacity = capacity
+        self.promote_overflow()
+
+    def promote_overflow(self):
+        """Moves overflow requests into the waiting queues if there is room, waking the scheduler."""
+        if self.waiting_area.promote_overflow():
+            scheduler_trigger.notify()
+
+    def record_departures(self, requests: Iterable[QueueEntry]):
+        """
+        Records requests that have left the waiting area for good (dispatched to a pile
+        or cancelled) in the drain rates, and lets overflow requests take their places.
+        """
+        now = clock_service.now()
+        for request in requests:
+            admission_service.record_departures(request.requested_charge_type, now)
+        self.promote_overflow()
+
+    def admission_estimate(self) -> dt.timedelta:
+        """How long a request rejected now should wait before it can expect to be admitted."""
+        area = self.waiting_area
+        places_needed = area.occupied() - (area.capacity + area.overflow_capacity) + 1
+        # A session ending only frees a place if vehicles of its type are waiting; the
+        # charging vehicle tells the pile's type
+        waiting_types = {queue.name for queue in (self.waiting_queue_fast, self.waiting_queue_trickle) if queue}
+        session_ends = [
+            backlog.charging_end
+            for pile_id, backlog in self.pile_backlogs.items()
+            if backlog.charging_end
+            and self.pile_queues.get(pile_id)
+            and self.pile_queues[pile_id][0].requested_charge_type.value in waiting_types
+        ]
+        return admission_service.estimate_wait(clock_service.now(), places_needed, session_ends)
 
-        # Queue number counters
-        self.fast_queue_counter = 1
-        self.trickle_queue_counter = 1
+    def waiting_queue_for(self, charge_type: models.RequestType) -> WaitingQueue:
+        return self.waiting_area.queue_for(charge_type)
+
+    def pile_lock(self, pile_id: int) -> asyncio.Lock:
+        lock = self.pile_locks.get(pile_id)
+        if lock is None:
+            lock = self.pile_locks[pile_id] = asyncio.Lock()
+        return lock
+
+    @contextlib.asynccontextmanager
+    async def locked(
+        self, waiting_queues: Iterable[WaitingQueue] = (), pile_ids: Iterable[int] = ()
+    ) -> AsyncIterator[None]:
+        """Holds the locks of the given waiting queues and piles, acquired in the global order."""
+        queues = set(waiting_queues)
+        async with contextlib.AsyncExitStack() as stack:
+            for queue in self.waiting_area.queues:
+                if queue in queues:
+                    await stack.enter_async_context(queue.lock)
+            for pile_id in sorted(set(pile_ids)):
+                await stack.enter_async_context(self.pile_lock(pile_id))
+            yield
+
+    @contextlib.asynccontextmanager
+    async def _locked_waiting_request(
+        self, request_id: int, also: Iterable[WaitingQueue] = ()
+    ) -> AsyncIterator[Tuple[Optional[QueueEntry], Optional[WaitingQueue]]]:
+        """
+        Locks the waiting queue holding a request (plus the queues in `also`) and yields
+        the request and its queue, or (None, None) if the request is not waiting.
+
+        A request the scheduler tick is dispatching is in no queue until the tick has
+        committed (or put it back on failure), so a request found nowhere waits for every
+        waiting-queue lock, i.e. for any running tick, before it is reported as not waiting.
+        """
+        while True:
+            _, queue = self.waiting_area.find(request_id)
+            queues = set(also) | ({queue} if queue is not None else set(self.waiting_area.queues))
+            async with self.locked(queues):
+                request, current = self.waiting_area.find(request_id)
+                # Retry if the request moved to another queue while we were waiting for the lock
+                if current is None or current in queues:
+                    yield request, current
+                    return
+
+    def requeue_front(self, request: QueueEntry):
+        """Puts a request back at the front of its waiting queue, e.g. after a failed assignment."""
+        self.waiting_queue_for(request.requested_charge_type).appendleft(request)
 
     async def initialize(self, db: AsyncSession):
         """
-        Initialize queues and counters from the database state on startup.
-        This makes the queue manager resilient to server restarts.
+        Initialize the queues on startup. This makes the queue manager resilient
+        to server restarts: the state is restored from the snapshot and journal when one is
+        attached and it matches the database, and rebuilt from the database otherwise.
         """
         print("Initializing QueueManager...")
+        started = time.perf_counter()
+        queue_number_service.reset()
+        admission_service.reset(clock_service.now())
 
-        # Initialize pile queues from database
-        piles = await crud.get_piles(db, limit=100)
-        for pile in piles:
-            self.pile_queues[pile.pile_id] = deque(maxlen=self.pile_queue_capacity)
+        max_request_id, active_count = await crud.get_request_watermark(db)
+        self._journal_paused = True
+        try:
+            if self.journal is not None and self._restore_from_journal(max_request_id, active_count):
+                source = "snapshot and journal"
+            else:
+                await self._rebuild_from_database(db)
+                self.max_request_id = max_request_id
+                source = "the database"
+            print(f"QueueManager initialized from {source} in {(time.perf_counter() - started) * 1000:.1f} ms.")
+        finally:
+            self._journal_paused = False
 
-        # Correctly initialize counters by finding the max queue number from ALL requests
-        stmt_f = select(func.max(func.cast(func.substring(models.ChargingRequest.queue_number, 2), sa.Integer))).where(
-            models.ChargingRequest.queue_number.startswith("F")
-        )
-        stmt_t = select(func.max(func.cast(func.substring(models.ChargingRequest.queue_number, 2), sa.Integer))).where(
-            models.ChargingRequest.queue_number.startswith("T")
-        )
+        print(f"Waiting Fast: {len(self.waiting_queue_fast)}, Waiting Trickle: {len(self.waiting_queue_trickle)}")
+
+        # Start a fresh journal generation from the state we are running with
+        if self.journal is not None:
+            self.write_snapshot()
 
-        max_f_num = await db.scalar(stmt_f) or 0
-        max_t_num = await db.scalar(stmt_t) or 0
+    async def _rebuild_from_database(self, db: AsyncSession):
+        """
+        Full rebuild of the in-memory state from the database. Requests that were in the
+        overflow list go back into their waiting queues, still in arrival order.
+        """
+        for queue in self.waiting_area.queues:
+            queue.clear()
 
-        self.fast_queue_counter = max_f_num + 1
-        self.trickle_queue_counter = max_t_num + 1
+        # Initialize pile queues from database
+        piles = await crud.get_all_piles(db)
+        self.reset_piles(piles)
 
         # Load requests that are in 'WAITING' or 'CHARGING' state to populate in-memory queues
         stmt = (
@@ -65,33 +577,318 @@ class QueueManager:
         active_requests = result.scalars().all()
         self._process_active_requests(active_requests)
 
-        print("QueueManager initialized.")
-        print(f"Waiting Fast: {len(self.waiting_queue_fast)}, Waiting Trickle: {len(self.waiting_queue_trickle)}")
-        print(f"Next F#: {self.fast_queue_counter}, Next T#: {self.trickle_queue_counter}")
-
     def _process_active_requests(self, requests: List[models.ChargingRequest]):
         """Helper to populate in-memory queues from a list of active requests."""
-        for req in requests:
-            # Assign request to the correct queue
-            if req.status == models.RequestStatus.WAITING:
-                if req.requested_charge_type == models.RequestType.FAST:
-                    self.waiting_queue_fast.append(req)
-                else:
-                    self.waiting_queue_trickle.append(req)
-            elif req.status == models.RequestStatus.CHARGING and req.assigned_pile_id:
+        entries = [QueueEntry.from_model(req) for req in requests]
+        # The charging vehicle is the head of its pile queue, so place those first.
+        for req in entries:
+            if req.status == models.RequestStatus.CHARGING and req.assigned_pile_id:
                 if req.assigned_pile_id in self.pile_queues:
-                    self.pile_queues[req.assigned_pile_id].append(req)
-
-    def _generate_queue_number(self, charge_type: schemas.RequestType) -> str:
-        """Generates a sequential queue number based on charge type."""
-        if charge_type == schemas.RequestType.FAST:
-            num = self.fast_queue_counter
-            self.fast_queue_counter += 1
-            return f"F{num}"
-        else:  # TRICKLE
-            num = self.trickle_queue_counter
-            self.trickle_queue_counter += 1
-            return f"T{num}"
+                    self.enqueue_to_pile(req.assigned_pile_id, req)
+        for req in entries:
+            if req.status != models.RequestStatus.WAITING:
+                continue
+            if req.assigned_pile_id in self.pile_queues:
+                # Already waiting in a pile's queue behind the charging vehicle
+                self.enqueue_to_pile(req.assigned_pile_id, req)
+            else:
+                self.waiting_queue_for(req.requested_charge_type).append(req)
+
+    def active_request_count(self) -> int:
+        """Number of requests held in memory (waiting area, overflow list and pile queues)."""
+        in_piles = sum(len(pile_queue) for pile_queue in self.pile_queues.values())
+        return len(self.waiting_area) + len(self.waiting_area.overflow) + in_piles
+
+    # ===================
+    # Snapshot and journal
+    # ===================
+    def attach_journal(self, journal: QueueJournal):
+        """Persists queue mutations to `journal` from now on; call before initialize()."""
+        self.journal = journal
+
+    def _journal(self, op: str, *args):
+        """Appends one mutation record to the journal, writing a new snapshot when it is due."""
+        self.version += 1
+        for arg in args:
+            if isinstance(arg, QueueEntry):
+                self.max_request_id = max(self.max_request_id, arg.request_id)
+        if self.journal is None or self._journal_paused:
+            return
+        record = [op] + [arg.to_dict() if isinstance(arg, QueueEntry) else arg for arg in args]
+        try:
+            self.journal.append(record)
+            if self.journal.needs_snapshot():
+                self.journal.write_snapshot(self.export_state())
+        except OSError as e:
+            self._drop_journal(e)
+
+    def bump_version(self):
+        """Marks projections of the queues stale after a change made outside them, e.g. a pile's status."""
+        self.version += 1
+
+    def write_snapshot(self):
+        if self.journal is None:
+            return
+        try:
+            self.journal.write_snapshot(self.export_state())
+        except OSError as e:
+            self._drop_journal(e)
+
+    def _drop_journal(self, error: OSError):
+        # A journal with a gap must never be restored; the next start rebuilds from the database
+        print(f"Queue journal disabled after a write error: {error}")
+        self.journal.discard()
+        self.journal = None
+
+    def export_state(self) -> Dict[str, Any]:
+        """The complete in-memory queue state in JSON-ready form."""
+        return {
+            "max_request_id": self.max_request_id,
+            "waiting": {queue.name: [request.to_dict() for request in queue] for queue in self.waiting_area.queues},
+            "piles": [
+                [pile_id, self.pile_backlogs[pile_id].power_w, [request.to_dict() for request in pile_queue]]
+                for pile_id, pile_queue in self.pile_queues.items()
+            ],
+        }
+
+    def _import_state(self, state: Dict[str, Any]):
+        self.max_request_id = state["max_request_id"]
+        for queue in self.waiting_area.queues:
+            queue.clear()
+        for name, requests in state["waiting"].items():
+            waiting_queue = self.waiting_area.queue_named(name)
+            for request in requests:
+                waiting_queue.append(QueueEntry.from_dict(request))
+        self.pile_queues = {}
+        self.pile_backlogs = {}
+        self.completion_deadlines = []
+        for pile_id, power_w, requests in state["piles"]:
+            self._register_pile(pile_id, w_to_kw(power_w))
+            for request in requests:
+                self.enqueue_to_pile(pile_id, QueueEntry.from_dict(request))
+
+    def _apply_journal_record(self, op: str, args: list):
+        """Re-applies one journal record through the same methods that produced it."""
+        if op in ("waiting_append", "waiting_appendleft"):
+            waiting_queue = self.waiting_area.queue_named(args[0])
+            request = QueueEntry.from_dict(args[1])
+            if op == "waiting_append":
+                waiting_queue.append(request)
+            else:
+                waiting_queue.appendleft(request)
+        elif op == "waiting_remove":
+            _, waiting_queue = self.waiting_area.find(args[0])
+            if waiting_queue is not None:
+                waiting_queue.pop(args[0])
+        elif op == "waiting_update":
+            request, _ = self.waiting_area.find(args[0]["request_id"])
+            if request is not None:
+                request.update_from(QueueEntry.from_dict(args[0]))
+        elif op == "pile_register":
+            self.register_pile(args[0], w_to_kw(args[1]))
+        elif op == "piles_reset":
+            self.pile_queues = {}
+            self.pile_backlogs = {}
+            self.completion_deadlines = []
+            for pile_id, power_w in args[0]:
+                self._register_pile(pile_id, w_to_kw(power_w))
+        elif op == "pile_enqueue":
+            self.enqueue_to_pile(args[0], QueueEntry.from_dict(args[1]))
+        elif op == "pile_start":
+            started = QueueEntry.from_dict(args[1])
+            request = next((r for r in self.pile_queues[args[0]] if r.request_id == started.request_id), None)
+            if request is not None:
+                request.update_from(started)
+                self.start_charging(args[0], request)
+        elif op == "pile_remove":
+            self.remove_from_pile(args[0], args[1])
+        elif op == "pile_clear":
+            self.clear_pile(args[0])
+        else:
+            raise ValueError(f"Unknown queue journal record: {op}")
+
+    def _restore_from_journal(self, max_request_id: int, active_count: int) -> bool:
+        """
+        Loads the snapshot and replays the journal on top of it. The result is only kept
+        if it agrees with the database watermark (highest request_id and number of active
+        requests); otherwise the caller falls back to a full rebuild.
+        """
+        loaded = self.journal.load()
+        if loaded is None:
+            return False
+        state, records = loaded
+        try:
+            self._import_state(state)
+            for op, *args in records:
+                self._apply_journal_record(op, args)
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            print(f"Queue journal could not be replayed ({e}), rebuilding from the database.")
+            return False
+
+        if self.max_request_id != max_request_id or self.active_request_count() != active_count:
+            print(
+                f"Queue journal is stale (last request {self.max_request_id}, {self.active_request_count()} active; "
+                f"database has {max_request_id}, {active_count} active), rebuilding from the database."
+            )
+            return False
+        return True
+
+    # ===================
+    # Pile queue mutations
+    # ===================
+    def register_pile(self, pile_id: int, power_rate: Decimal):
+        """Makes sure a pile has an in-memory queue and backlog; keeps existing state."""
+        backlog = self.pile_backlogs.get(pile_id)
+        if backlog is None or backlog.power_w != kw_to_w(power_rate) or pile_id not in self.pile_queues:
+            self._register_pile(pile_id, power_rate)
+            self._journal("pile_register", pile_id, kw_to_w(power_rate))
+
+    def _register_pile(self, pile_id: int, power_rate: Decimal):
+        if pile_id not in self.pile_queues:
+            self.pile_queues[pile_id] = deque(maxlen=self.pile_queue_capacity)
+        if pile_id not in self.pile_backlogs:
+            self.pile_backlogs[pile_id] = PileBacklog(power_rate)
+            self.recompute_backlog(pile_id)
+        elif self.pile_backlogs[pile_id].power_w != kw_to_w(power_rate):
+            # A power change moves the end of the session being charged
+            self.pile_backlogs[pile_id].power_w = kw_to_w(power_rate)
+            self.recompute_backlog(pile_id)
+
+    def reset_piles(self, piles: List[models.ChargingPile]):
+        """Replaces all pile queues with empty ones for the given piles."""
+        self.pile_queues = {}
+        self.pile_backlogs = {}
+        self.completion_deadlines = []
+        for pile in piles:
+            self._register_pile(pile.pile_id, pile.power_rate)
+        self._journal("piles_reset", [[pile.pile_id, kw_to_w(pile.power_rate)] for pile in piles])
+
+    def enqueue_to_pile(self, pile_id: int, request: QueueEntry):
+        """Appends a request to a pile queue and adds its work to the pile's backlog."""
+        self.pile_queues[pile_id].append(request)
+        self._journal("pile_enqueue", pile_id, request)
+        backlog = self.pile_backlogs[pile_id]
+        if request.status == models.RequestStatus.CHARGING and request.start_time:
+            backlog.charging_end = backlog.charging_end_for(request)
+            self._track_completion(pile_id)
+        else:
+            backlog.queued_wh += request.amount_wh
+
+    def start_charging(self, pile_id: int, request: QueueEntry):
+        """Records that a request already in a pile queue has started charging."""
+        backlog = self.pile_backlogs[pile_id]
+        backlog.queued_wh = max(0, backlog.queued_wh - request.amount_wh)
+        backlog.charging_end = backlog.charging_end_for(request)
+        self._track_completion(pile_id)
+        self._journal("pile_start", pile_id, request)
+
+    def remove_from_pile(self, pile_id: int, request_id: int) -> Optional[QueueEntry]:
+        """Removes a request from a pile queue and takes its work off the pile's backlog."""
+        pile_queue = self.pile_queues.get(pile_id)
+        if not pile_queue:
+            return None
+        removed = next((r for r in pile_queue if r.request_id == request_id), None)
+        if removed is None:
+            return None
+
+        was_charging = pile_queue[0] is removed and removed.status in (
+            models.RequestStatus.CHARGING,
+            models.RequestStatus.FINISHED,
+        )
+        pile_queue.remove(removed)
+        self._journal("pile_remove", pile_id, request_id)
+        backlog = self.pile_backlogs[pile_id]
+        if was_charging:
+            backlog.charging_end = None
+        else:
+            backlog.queued_wh = max(0, backlog.queued_wh - removed.amount_wh)
+        return removed
+
+    def clear_pile(self, pile_id: int):
+        """Empties a pile queue, e.g. when the pile faults."""
+        if pile_id in self.pile_queues:
+            self.pile_queues[pile_id].clear()
+        if pile_id in self.pile_backlogs:
+            self.pile_backlogs[pile_id].reset()
+        self._journal("pile_clear", pile_id)
+
+    def recompute_backlog(self, pile_id: int) -> PileBacklog:
+        """Rebuilds a pile's backlog from scratch by walking its queue."""
+        backlog = self.compute_backlog(pile_id)
+        self.pile_backlogs[pile_id] = backlog
+        self._track_completion(pile_id)
+        return backlog
+
+    def compute_backlog(self, pile_id: int) -> PileBacklog:
+        """Full recomputation of a pile's backlog, without touching the maintained one."""
+        backlog = PileBacklog(Decimal(0))
+        if pile_id in self.pile_backlogs:
+            backlog.power_w = self.pile_backlogs[pile_id].power_w
+        for i, request in enumerate(self.pile_queues.get(pile_id) or []):
+            if i == 0 and request.status == models.RequestStatus.CHARGING and request.start_time:
+                backlog.charging_end = backlog.charging_end_for(request)
+            else:
+                backlog.queued_wh += request.amount_wh
+        return backlog
+
+    # ===================
+    # Completion deadlines
+    # ===================
+    def _track_completion(self, pile_id: int):
+        """Pushes the pile's current charging_end, if any, onto the deadline heap."""
+        backlog = self.pile_backlogs.get(pile_id)
+        if backlog is None or backlog.charging_end is None:
+            return
+        deadlines = self.completion_deadlines
+        if len(deadlines) > 2 * len(self.pile_backlogs) + 16:
+            # Mostly stale entries: rebuild from the live deadlines
+            deadlines[:] = [entry for entry in deadlines if self._is_current_deadline(*entry)]
+            heapq.heapify(deadlines)
+        entry = (backlog.charging_end, pile_id)
+        heapq.heappush(deadlines, entry)
+        if deadlines[0] == entry:
+            self.completions_changed.set()
+
+    def _is_current_deadline(self, end: dt.datetime, pile_id: int) -> bool:
+        backlog = self.pile_backlogs.get(pile_id)
+        return backlog is not None and backlog.charging_end == end and bool(self.pile_queues.get(pile_id))
+
+    def next_completion(self) -> Optional[dt.datetime]:
+        """Projected end of the earliest charging session, in O(log n) amortised."""
+        deadlines = self.completion_deadlines
+        while deadlines and not self._is_current_deadline(*deadlines[0]):
+            heapq.heappop(deadlines)
+        return deadlines[0][0] if deadlines else None
+
+    def due_completions(self, now: dt.datetime) -> List[Tuple[int, dt.datetime]]:
+        """
+        (pile_id, projected end) of every charging session that has ended by `now`,
+        earliest first. The deadlines stay tracked until the session is actually
+        removed from its pile, so a failed finalization is retried.
+        """
+        due = []
+        while True:
+            end = self.next_completion()
+            if end is None or end > now:
+                break
+            _, pile_id = heapq.heappop(self.completion_deadlines)
+            if (pile_id, end) not in due:
+                due.append((pile_id, end))
+        for pile_id, end in due:
+            heapq.heappush(self.completion_deadlines, (end, pile_id))
+        return due
+
+    def pile_wait_us(self, pile_id: int, now: dt.datetime) -> int:
+        """O(1) lookup of the time a new vehicle would wait at a pile, in microseconds."""
+        backlog = self.pile_backlogs.get(pile_id)
+        return backlog.wait_us(now) if backlog else 0
+
+    def pile_wait_hours(self, pile_id: int, now: dt.datetime) -> Decimal:
+        return Decimal(self.pile_wait_us(pile_id, now)) / Decimal(US_PER_HOUR)
+
+    async def _generate_queue_number(self, db: AsyncSession, charge_type: models.RequestType) -> str:
+        """Allocates the next queue number for a charge type from the database sequences."""
+        return await queue_number_service.allocate(db, charge_type)
 
     async def add_request_to_waiting_queue(
         self, db: AsyncSession, request: schemas.ChargingRequestCreate
@@ -100,29 +897,53 @@ class QueueManager:
         Adds a new charging request to the appropriate waiting queue.
         Returns the created request object and an error message if any.
         """
-        current_waiting_count = len(self.waiting_queue_fast) + len(self.waiting_queue_trickle)
-        if current_waiting_count >= self.waiting_area_capacity:
-            return None, "Waiting area is full."
+        return (await self.add_requests_to_waiting_queue(db, [request]))[0]
 
-        queue_number = self._generate_queue_number(request.requested_charge_type)
+    async def add_requests_to_waiting_queue(
+        self, db: AsyncSession, requests: List[schemas.ChargingRequestCreate]
+    ) -> List[Tuple[Optional[models.ChargingRequest], Optional[str]]]:
+        """
+        Admits a batch of requests in order, as many as the waiting area (and its overflow
+        list) has room for, with a single INSERT and commit, and wakes the scheduler once.
+        Returns (created request, error message) for every item.
+        """
+        with contextlib.ExitStack() as slots:
+            admissions = []
+            for request in requests:
+                slot = self.waiting_area.reserve()
+                if slot is None:
+                    break
+                admissions.append((request, slots.enter_context(slot)))
+            created = await self._admit_requests(db, admissions) if admissions else []
 
-        # Use the existing CRUD function to create the request
-        # We need to adapt the schema or the CRUD function. Let's create a full schema object.
-        full_request_data = models.ChargingRequest(
-            **request.dict(), queue_number=queue_number, status=models.RequestStatus.WAITING
-        )
+        results: List[Tuple[Optional[models.ChargingRequest], Optional[str]]] = [(request, None) for request in created]
+        results += [(None, WAITING_AREA_FULL)] * (len(requests) - len(created))
+        return results
 
-        db.add(full_request_data)
+    async def _admit_requests(
+        self, db: AsyncSession, admissions: List[Tuple[schemas.ChargingRequestCreate, WaitingSlot]]
+    ) -> List[models.ChargingRequest]:
+        now = clock_service.now()
+        rows = [
+            dict(
+                **request.dict(),
+                queue_number=await self._generate_queue_number(db, request.requested_charge_type),
+                status=models.RequestStatus.WAITING,
+                request_time=now,
+            )
+            for request, _ in admissions
+        ]
+        created = await crud.insert_requests_returning(db, rows)
         await db.commit()
-        await db.refresh(full_request_data)
 
-        # Add to the correct in-memory waiting queue
-        if full_request_data.requested_charge_type == models.RequestType.FAST:
-            self.waiting_queue_fast.append(full_request_data)
-        else:
-            self.waiting_queue_trickle.append(full_request_data)
+        # Add to the correct in-memory waiting queues, taking up the reserved places
+        for (_, slot), db_request in zip(admissions, created):
+            slot.fill(QueueEntry.from_model(db_request))
+        # Places may have freed up while the overflow admissions were being written
+        self.waiting_area.promote_overflow()
 
-        return full_request_data, None
+        scheduler_trigger.notify()
+        return created
 
     async def cancel_request(
         self, db: AsyncSession, request_id: int, user_id: int
@@ -130,28 +951,17 @@ class QueueManager:
         """
         Cancels a request that is currently in a waiting queue.
         """
-        # Find which queue the request is in and remove it
-        target_request = None
-
-        # Check fast queue
-        for req in self.waiting_queue_fast:
-            if req.request_id == request_id:
-                if req.user_id != user_id:
-                    return None, "Permission denied: You can only cancel your own requests."
-                target_request = req
-                self.waiting_queue_fast.remove(req)
-                break
-
-        # Check trickle queue if not found
-        if not target_request:
-            for req in self.waiting_queue_trickle:
-                if req.request_id == request_id:
-                    if req.user_id != user_id:
-                        return None, "Permission denied: You can only cancel your own requests."
-                    target_request = req
-                    self.waiting_queue_trickle.remove(req)
-                    break
+        async with self._locked_waiting_request(request_id) as (target_request, waiting_queue):
+            return await self._cancel_waiting_request(db, request_id, user_id, target_request, waiting_queue)
 
+    async def _cancel_waiting_request(
+        self,
+        db: AsyncSession,
+        request_id: int,
+        user_id: int,
+        target_request: Optional[QueueEntry],
+        waiting_queue: Optional[WaitingQueue],
+    ) -> Tuple[Optional[models.ChargingRequest], Optional[str]]:
         if not target_request:
             # Maybe the request is already charging or finished, check DB
             db_req = await crud.get_request(db, request_id)
@@ -162,13 +972,17 @@ class QueueManager:
                 )
             return None, "Request not found in any active queue."
 
+        if target_request.user_id != user_id:
+            return None, "Permission denied: You can only cancel your own requests."
+        waiting_queue.remove(target_request)
+
         # Update status in DB
         target_request.status = models.RequestStatus.CANCELLED
-        merged_request = await db.merge(target_request)
+        cancelled_request = await crud.update_request_returning(db, request_id, status=target_request.status)
         await db.commit()
-        await db.refresh(merged_request)
 
-        return merged_request, None
+        self.record_departures([target_request])
+        return cancelled_request, None
 
     async def modify_request(
         self,
@@ -182,22 +996,22 @@ class QueueManager:
         - Changing charge amount keeps the queue position.
         - Changing charge type moves the request to the end of the new queue.
         """
-        # Find the request in the waiting queues
-        original_request = None
-        original_queue = None
-
-        for req in self.waiting_queue_fast:
-            if req.request_id == request_id:
-                original_request = req
-                original_queue = self.waiting_queue_fast
-                break
-        if not original_request:
-            for req in self.waiting_queue_trickle:
-                if req.request_id == request_id:
-                    original_request = req
-                    original_queue = self.waiting_queue_trickle
-                    break
+        # A type change also locks the queue the request moves to
+        target_queues = [self.waiting_queue_for(updates.requested_charge_type)] if updates.requested_charge_type else []
+        async with self._locked_waiting_request(request_id, target_queues) as (original_request, original_queue):
+            return await self._modify_waiting_request(
+                db, request_id, user_id, updates, original_request, original_queue
+            )
 
+    async def _modify_waiting_request(
+        self,
+        db: AsyncSession,
+        request_id: int,
+        user_id: int,
+        updates: schemas.ChargingRequestUpdate,
+        original_request: Optional[QueueEntry],
+        original_queue: Optional[WaitingQueue],
+    ) -> Tuple[Optional[models.ChargingRequest], Optional[str]]:
         if not original_request or not original_queue:
             db_req = await crud.get_request(db, request_id)
             if db_req:
@@ -214,26 +1028,26 @@ class QueueManager:
             and update_data["requested_charge_type"] != original_request.requested_charge_type
         )
 
-        for key, value in update_data.items():
-            setattr(original_request, key, value)
-
         if type_changed:
-            # Type has changed, so move to the other queue with a new number
-            original_queue.remove(original_request)
-            new_queue_number = self._generate_queue_number(original_request.requested_charge_type)
-            original_request.queue_number = new_queue_number
-
-            if original_request.requested_charge_type == models.RequestType.FAST:
-                self.waiting_queue_fast.append(original_request)
-            else:
-                self.waiting_queue_trickle.append(original_request)
+            update_data["queue_number"] = await self._generate_queue_number(db, update_data["requested_charge_type"])
 
-        # Persist changes to DB
-        merged_request = await db.merge(original_request)
+        # Persist changes to DB first: memory and the journal only follow a committed change,
+        # so a failed commit or a crash before it cannot leave them ahead of the database
+        updated_request = await crud.update_request_returning(db, request_id, **update_data)
         await db.commit()
-        await db.refresh(merged_request)
 
-        return merged_request, None
+        for key, value in update_data.items():
+            setattr(original_request, key, value)
+        if type_changed and original_queue is not self.waiting_area.overflow:
+            # Type has changed, so move to the end of the other queue with the new number
+            original_queue.remove(original_request)
+            self.waiting_queue_for(original_request.requested_charge_type).append(original_request)
+        else:
+            # Keeps its place (in the overflow list a type change only changes the number)
+            self._journal("waiting_update", original_request)
+
+        scheduler_trigger.notify()
+        return updated_request, None
 
 
 # Create a single, globally accessible instance of the QueueManager
@@ -1,3 +1,5 @@
+import datetime as dt
+from decimal import Decimal
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -5,8 +7,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud, models, schemas
 from ..database import get_db
+from ..queue_manager import queue_manager
+from ..services.admission_service import admission_service
+from ..services.clock_service import clock_service
 from ..services.config_service import SchedulingStrategy, config_service
+from ..services.metrics_service import metrics_service
 from ..services.pile_simulator_service import pile_simulator_service
+from ..services.scheduler_trigger import scheduler_trigger
+from ..services.scheduling_service import scheduling_service
+from ..services.tariff_service import tariff_service
 
 router = APIRouter(
     prefix="/admin",
@@ -30,6 +39,8 @@ async def setup_charging_piles(pile_setup: schemas.PileSetup, db: AsyncSession =
         )
 
     await crud.reset_charging_piles(db, fast_piles=pile_setup.fast_piles, trickle_piles=pile_setup.trickle_piles)
+    queue_manager.reset_piles(await crud.get_all_piles(db))
+    scheduler_trigger.notify()
     return
 
 
@@ -153,3 +164,168 @@ async def set_scheduling_strategy(strategy_update: schemas.SchedulingStrategyUpd
         return {"strategy": config_service.scheduling_strategy.value}
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid strategy value")
+
+
+@router.get("/scheduler-mode", response_model=schemas.SchedulerMode)
+async def get_scheduler_mode():
+    """
+    Get the scheduler mode (drain-until-saturated and the per-tick dispatch cap).
+    """
+    return {
+        "drain_until_saturated": config_service.drain_until_saturated,
+        "max_dispatch_per_tick": config_service.max_dispatch_per_tick,
+    }
+
+
+@router.put("/scheduler-mode", response_model=schemas.SchedulerMode)
+async def set_scheduler_mode(mode_update: schemas.SchedulerMode):
+    """
+    Set the scheduler mode.
+    """
+    try:
+        config_service.set_scheduler_mode(mode_update.drain_until_saturated, mode_update.max_dispatch_per_tick)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await get_scheduler_mode()
+
+
+@router.get("/waiting-area", response_model=schemas.WaitingAreaConfig)
+async def get_waiting_area_config():
+    """
+    Get the waiting area and overflow list capacities, the number of vehicles in each,
+    the places reserved by requests being admitted and the observed drain rates.
+    """
+    waiting_area = queue_manager.waiting_area
+    return {
+        "capacity": waiting_area.capacity,
+        "overflow_capacity": waiting_area.overflow_capacity,
+        "waiting": len(waiting_area),
+        "reserved": waiting_area.reserved,
+        "overflow": len(waiting_area.overflow),
+        "drain_per_hour": admission_service.drain_per_hour(clock_service.now()),
+    }
+
+
+@router.put("/waiting-area", response_model=schemas.WaitingAreaConfig)
+async def set_waiting_area_config(config_update: schemas.WaitingAreaCapacityUpdate):
+    """
+    Set the waiting area capacity and, optionally, the overflow list capacity. Lowering
+    either below the number of vehicles already in it only stops new admissions until
+    it has drained.
+    """
+    if config_update.capacity < 1:
+        raise HTTPException(status_code=400, detail="capacity must be at least 1")
+    if config_update.overflow_capacity is not None:
+        if config_update.overflow_capacity < 0:
+            raise HTTPException(status_code=400, detail="overflow_capacity cannot be negative")
+        queue_manager.waiting_area.overflow_capacity = config_update.overflow_capacity
+    queue_manager.waiting_area_capacity = config_update.capacity
+    return await get_waiting_area_config()
+
+
+@router.get("/tariffs", response_model=List[schemas.TariffVersion])
+async def list_tariff_versions(db: AsyncSession = Depends(get_db)):
+    """
+    (Admin) Get every tariff version, in effective order. The built-in tariff applies
+    before the first one.
+    """
+    return await crud.get_tariff_versions(db)
+
+
+@router.post("/tariffs", response_model=schemas.TariffVersion, status_code=status.HTTP_201_CREATED)
+async def create_tariff_version(version: schemas.TariffVersionCreate, db: AsyncSession = Depends(get_db)):
+    """
+    (Admin) Add a tariff version taking effect at `effective_from`, for one pile type or
+    for all of them. Versions are immutable; publish a new one to change prices. The
+    compiled tariff tables are swapped in at once, so sessions are billed entirely
+    against the old or the new tables.
+    """
+    try:
+        tariff_service.validate(version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db_version = await crud.create_tariff_version(db, version)
+    await tariff_service.load(db)
+    return db_version
+
+
+@router.get("/tariff-holidays", response_model=List[schemas.TariffHoliday])
+async def list_tariff_holidays(db: AsyncSession = Depends(get_db)):
+    """
+    (Admin) Get the holiday calendar on which the HOLIDAY tariff periods apply.
+    """
+    return await crud.get_tariff_holidays(db)
+
+
+@router.put("/tariff-holidays", response_model=schemas.TariffHoliday)
+async def set_tariff_holiday(holiday: schemas.TariffHoliday, db: AsyncSession = Depends(get_db)):
+    """
+    (Admin) Add a holiday to the calendar, or update its description.
+    """
+    db_holiday = await crud.set_tariff_holiday(db, holiday)
+    await tariff_service.load(db)
+    return db_holiday
+
+
+@router.delete("/tariff-holidays/{holiday_date}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_tariff_holiday(holiday_date: dt.date, db: AsyncSession = Depends(get_db)):
+    """
+    (Admin) Remove a holiday from the calendar.
+    """
+    if not await crud.delete_tariff_holiday(db, holiday_date):
+        raise HTTPException(status_code=404, detail="Holiday not found")
+    await tariff_service.load(db)
+
+
+@router.get("/scheduler/dispatch-stats", response_model=schemas.SchedulerDispatchStats)
+async def get_scheduler_dispatch_stats():
+    """
+    (Admin) Get the number of vehicles dispatched per scheduler run.
+    """
+    stats = scheduling_service.dispatch_stats
+    mean_dispatched = stats["total_dispatched"] / stats["ticks"] if stats["ticks"] else 0.0
+    return schemas.SchedulerDispatchStats(**stats, mean_dispatched=mean_dispatched)
+
+
+@router.get("/metrics/loops", response_model=List[schemas.LoopTickMetrics])
+async def get_loop_metrics():
+    """
+    (Admin) Get tick duration histograms, per-phase timings, SQL statement counts and
+    vehicles handled per tick for the scheduler (per strategy) and charging monitor loops.
+    """
+    return metrics_service.snapshot()
+
+
+@router.delete("/metrics/loops", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_loop_metrics():
+    """
+    (Admin) Reset the loop metrics, e.g. before a measurement run.
+    """
+    metrics_service.reset()
+
+
+@router.get("/debug/pile-backlogs", response_model=List[schemas.PileBacklogCheck])
+async def check_pile_backlogs():
+    """
+    (Admin) Check every pile's incrementally maintained backlog against a full
+    recomputation from its in-memory queue.
+    """
+    now = clock_service.now()
+    tolerance_hours = Decimal("0.000001")
+    checks = []
+    for pile_id, pile_queue in queue_manager.pile_queues.items():
+        wait_hours = queue_manager.pile_wait_hours(pile_id, now)
+        recomputed = queue_manager.compute_backlog(pile_id)
+        recomputed_wait_hours = recomputed.wait_hours(now)
+        checks.append(
+            schemas.PileBacklogCheck(
+                pile_id=pile_id,
+                queue_length=len(pile_queue),
+                wait_hours=wait_hours,
+                recomputed_wait_hours=recomputed_wait_hours,
+                projected_free_at=queue_manager.pile_backlogs[pile_id].projected_free_at(now),
+                recomputed_free_at=recomputed.projected_free_at(now),
+                consistent=abs(wait_hours - recomputed_wait_hours) <= tolerance_hours,
+            )
+        )
+    return checks
@@ -1,5 +1,5 @@
 import datetime as dt
-from decimal import Decimal
+import math
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -8,8 +8,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from .. import crud, models, schemas
 from ..auth import get_current_active_user
 from ..database import get_db
-from ..queue_manager import queue_manager
+from ..queue_manager import WAITING_AREA_FULL, queue_manager
 from ..services.billing_service import billing_service
+from ..services.clock_service import clock_service
+from ..services.fixed_point import energy_mwh_for_duration, kw_to_w, mwh_to_kwh, timedelta_to_us
+from ..services.quote_service import quote_service
 
 router = APIRouter(
     prefix="/requests",
@@ -17,6 +20,22 @@ router = APIRouter(
 )
 
 
+def _admission_estimate() -> tuple[int, dt.datetime]:
+    """Retry-After in whole seconds and the estimated admission time for a rejected submission."""
+    wait = queue_manager.admission_estimate()
+    return max(1, math.ceil(wait.total_seconds())), clock_service.now() + wait
+
+
+def _waiting_area_full() -> HTTPException:
+    retry_after, admission_time = _admission_estimate()
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"{WAITING_AREA_FULL} Estimated admission in about {math.ceil(retry_after / 60)} min "
+        f"({admission_time.isoformat(timespec='seconds')}).",
+        headers={"Retry-After": str(retry_after), "X-Estimated-Admission-Time": admission_time.isoformat()},
+    )
+
+
 @router.post("/", response_model=schemas.ChargingRequest, status_code=status.HTTP_201_CREATED)
 async def create_charging_request(
     request: schemas.ChargingRequestBody,
@@ -30,7 +49,8 @@ async def create_charging_request(
     - **requested_charge_amount**: The amount of charge requested in kWh.
 
     The user is placed in the waiting queue and assigned a queue number.
-    An error is returned if the waiting area is full.
+    If the waiting area (and its overflow list) is full, 429 is returned with a
+    Retry-After header based on how fast the waiting queues are draining.
     """
     # The user_id is taken from the authentication token, not the request body.
     full_request_data = schemas.ChargingRequestCreate(
@@ -41,19 +61,90 @@ async def create_charging_request(
 
     db_request, error_msg = await queue_manager.add_request_to_waiting_queue(db, full_request_data)
 
+    if error_msg == WAITING_AREA_FULL:
+        raise _waiting_area_full()
     if error_msg:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_msg)
 
     return db_request
 
 
-@router.get("/waiting-queue", response_model=List[schemas.ChargingRequest])
+@router.post("/batch", response_model=schemas.ChargingRequestBatchResult)
+async def create_charging_requests_batch(
+    batch: schemas.ChargingRequestBatchCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user),
+):
+    """
+    Submits many charging requests at once, e.g. for the vehicles of a fleet depot.
+
+    Items are admitted in order while the waiting area has room, in a single transaction;
+    the rest are rejected. Returns the outcome and queue number of every item, and
+    when to retry the rejected ones.
+    """
+    requests = [
+        schemas.ChargingRequestCreate(
+            user_id=current_user.user_id,
+            requested_charge_type=item.requested_charge_type,
+            requested_charge_amount=item.requested_charge_amount,
+        )
+        for item in batch.requests
+    ]
+
+    results = await queue_manager.add_requests_to_waiting_queue(db, requests)
+
+    items = [
+        schemas.ChargingRequestBatchItem(
+            index=index,
+            admitted=db_request is not None,
+            queue_number=db_request.queue_number if db_request else None,
+            request=db_request,
+            error=error_msg,
+        )
+        for index, (db_request, error_msg) in enumerate(results)
+    ]
+    admitted = sum(item.admitted for item in items)
+    result = schemas.ChargingRequestBatchResult(admitted=admitted, rejected=len(items) - admitted, items=items)
+    if result.rejected:
+        result.retry_after_seconds, result.estimated_admission_time = _admission_estimate()
+    return result
+
+
+@router.post("/quote", response_model=schemas.ChargeQuote)
+async def quote_charging_request(request: schemas.ChargingRequestBody, db: AsyncSession = Depends(get_db)):
+    """
+    Quotes a charging request without submitting it: the pile it is projected to be
+    dispatched to, when it would start and finish charging, and the fees.
+
+    The quote is computed from a cached projection of the current queues (every vehicle
+    already waiting goes first) and does not query the database while the queues are
+    unchanged. It is an estimate: later arrivals, stops and faults move it.
+    """
+    try:
+        quote = await quote_service.quote(db, request.requested_charge_type, request.requested_charge_amount)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if quote is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"No working {request.requested_charge_type.value} pile to charge at.",
+        )
+    return quote
+
+
+@router.get("/waiting-queue", response_model=List[schemas.WaitingQueueEntry])
 async def get_waiting_queue():
     """
-    Get the current list of all requests in the waiting area (both FAST and TRICKLE).
+    Get the current list of all requests in the waiting area (both FAST and TRICKLE),
+    followed by the requests in the overflow list in arrival order, marked with in_overflow.
     """
-    # The response_model will serialize the SQLAlchemy models correctly
-    return list(queue_manager.waiting_queue_fast) + list(queue_manager.waiting_queue_trickle)
+    # The response_model serializes the queue entries through their attributes
+    waiting = list(queue_manager.waiting_queue_fast) + list(queue_manager.waiting_queue_trickle)
+    overflow = [
+        schemas.WaitingQueueEntry.model_validate(request).model_copy(update={"in_overflow": True})
+        for request in queue_manager.waiting_area.overflow
+    ]
+    return waiting + overflow
 
 
 @router.get("/me/active", response_model=schemas.ChargingRequest | None)
@@ -85,6 +176,8 @@ async def stop_charging_request(
     """
     Manually stops an ongoing charging session.
     Calculates the charge up to the current moment and generates a final order.
+    Holds the pile's lock, so the session cannot be finalized twice by concurrent
+    stops, the charging monitor or a fault report.
     """
     request = await crud.get_request(db, request_id)
 
@@ -100,17 +193,23 @@ async def stop_charging_request(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Inconsistent request data: cannot stop charge."
         )
 
-    pile = await crud.get_pile(db, request.assigned_pile_id)
-    if not pile:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Associated pile not found.")
+    async with queue_manager.locked(pile_ids=[request.assigned_pile_id]):
+        # Someone else may have finalized the session while we waited for the lock
+        await db.refresh(request)
+        if request.status != models.RequestStatus.CHARGING:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request is not currently charging.")
 
-    end_time = dt.datetime.now(dt.timezone.utc)
-    duration_seconds = (end_time - request.start_time).total_seconds()
-    actual_charge_amount = (Decimal(duration_seconds) / Decimal(3600)) * pile.power_rate
+        pile = await crud.get_pile(db, request.assigned_pile_id)
+        if not pile:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Associated pile not found.")
 
-    order = await billing_service.finish_charging_session(
-        db=db, request_id=request_id, end_time=end_time, actual_charge_amount=actual_charge_amount
-    )
+        end_time = clock_service.now()
+        energy_mwh = energy_mwh_for_duration(timedelta_to_us(end_time - request.start_time), kw_to_w(pile.power_rate))
+        actual_charge_amount = mwh_to_kwh(energy_mwh)
+
+        order = await billing_service.finish_charging_session(
+            db=db, request_id=request_id, end_time=end_time, actual_charge_amount=actual_charge_amount
+        )
 
     if not order:
         raise HTTPException(
@@ -1,10 +1,10 @@
 from datetime import date, datetime
 from decimal import Decimal
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from .models import PileStatus, PileType, ReportType, RequestStatus, RequestType, UserRole
+from .models import PileStatus, PileType, ReportType, RequestStatus, RequestType, TariffDayKind, UserRole
 
 
 # Base Schemas
@@ -70,6 +70,12 @@ class ChargingRequestCreate(ChargingRequestBase):
     pass
 
 
+class ChargingRequestBatchCreate(BaseModel):
+    """Schema for submitting many vehicles in one call, e.g. by a fleet depot."""
+
+    requests: List[ChargingRequestBody] = Field(min_length=1, max_length=500)
+
+
 class ChargingOrderCreate(ChargingOrderBase):
     pass
 
@@ -85,6 +91,59 @@ class SchedulingStrategyUpdate(BaseModel):
     strategy: str
 
 
+class SchedulerMode(BaseModel):
+    drain_until_saturated: bool
+    max_dispatch_per_tick: int
+
+
+class WaitingAreaCapacityUpdate(BaseModel):
+    capacity: int
+    overflow_capacity: Optional[int] = None  # Unchanged if omitted; 0 disables the overflow list
+
+
+class WaitingAreaConfig(WaitingAreaCapacityUpdate):
+    overflow_capacity: int
+    waiting: int
+    reserved: int  # Places held by admissions still being written to the database
+    overflow: int
+    drain_per_hour: Dict[RequestType, float]  # Observed departure rate of each waiting queue
+
+
+class SchedulerDispatchStats(BaseModel):
+    ticks: int
+    total_dispatched: int
+    last_dispatched: int
+    last_passes: int
+    max_dispatched: int
+    cap_hits: int
+    mean_dispatched: float
+
+
+class HistogramSummary(BaseModel):
+    count: int
+    sum: float
+    mean: float
+    max: float
+    p50: float
+    p95: float
+    p99: float
+    buckets: Dict[str, int]
+
+
+class LoopTickMetrics(BaseModel):
+    """Tick metrics of a background loop (durations in ms)."""
+
+    loop: str
+    label: str
+    ticks: int
+    errors: int
+    tick_ms: HistogramSummary
+    phase_ms: Dict[str, HistogramSummary]
+    statements: HistogramSummary
+    vehicles: HistogramSummary
+    last_tick: Optional[Dict[str, Any]] = None
+
+
 class OperationalReportCreate(OperationalReportBase):
     pass
 
@@ -135,6 +194,46 @@ class ChargingRequest(ChargingRequestBase):
         from_attributes = True
 
 
+class WaitingQueueEntry(ChargingRequest):
+    # Requests in the overflow list wait for a place in the waiting area; the scheduler does not see them yet
+    in_overflow: bool = False
+
+
+class ChargingRequestBatchItem(BaseModel):
+    index: int  # Position of the item in the submitted batch
+    admitted: bool
+    queue_number: Optional[str] = None
+    request: Optional[ChargingRequest] = None
+    error: Optional[str] = None
+
+
+class ChargingRequestBatchResult(BaseModel):
+    admitted: int
+    rejected: int
+    items: List[ChargingRequestBatchItem]
+    # Set when items were rejected: when to resubmit them
+    retry_after_seconds: Optional[int] = None
+    estimated_admission_time: Optional[datetime] = None
+
+
+class ChargeQuote(BaseModel):
+    """Projected pile, start and finish times and fees for a request that has not been submitted."""
+
+    requested_charge_type: RequestType
+    requested_charge_amount: Decimal
+    pile_id: int
+    pile_code: str
+    # Vehicles already waiting for this charge type, dispatched before the quoted one
+    vehicles_ahead: int
+    start_time: datetime
+    finish_time: datetime
+    charge_fee: Decimal
+    service_fee: Decimal
+    total_fee: Decimal
+    # When the queue projection behind the quote was built
+    projected_at: datetime
+
+
 class ChargingOrder(ChargingOrderBase):
     order_id: int
     created_at: datetime
@@ -255,6 +354,62 @@ class DashboardData(BaseModel):
     current_vehicles: List[CurrentVehicle]
 
 
+class PileBacklogCheck(BaseModel):
+    """Comparison of a pile's maintained backlog with a full recomputation from its queue."""
+
+    pile_id: int
+    queue_length: int
+    wait_hours: Decimal
+    recomputed_wait_hours: Decimal
+    projected_free_at: datetime
+    recomputed_free_at: datetime
+    consistent: bool
+
+
+class TariffPeriodBase(BaseModel):
+    day_kind: TariffDayKind
+    start_minute: int = Field(ge=0, lt=1440)  # Minute of the day
+    end_minute: int = Field(gt=0, le=1440)  # Exclusive
+    rate: Decimal  # Yuan per kWh
+
+
+class TariffVersionCreate(BaseModel):
+    """
+    A new tariff version. WEEKDAY periods must cover the whole day; WEEKEND and HOLIDAY
+    periods are optional and fall back to WEEKDAY and WEEKEND rates where they leave gaps.
+    """
+
+    pile_type: Optional[PileType] = None  # None: every pile type
+    effective_from: datetime
+    service_fee_per_kwh: Decimal
+    description: Optional[str] = None
+    periods: List[TariffPeriodBase] = Field(min_length=1)
+
+
+class TariffPeriod(TariffPeriodBase):
+    period_id: int
+
+    class Config:
+        from_attributes = True
+
+
+class TariffVersion(TariffVersionCreate):
+    tariff_id: int
+    created_at: Optional[datetime] = None
+    periods: List[TariffPeriod]
+
+    class Config:
+        from_attributes = True
+
+
+class TariffHoliday(BaseModel):
+    holiday_date: date
+    description: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
 class PileSetup(BaseModel):
     fast_piles: int
     trickle_piles: int
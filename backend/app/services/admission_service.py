@@ -0,0 +1,96 @@
+import datetime as dt
+import math
+from typing import Dict, List, Optional
+
+from .. import models
+
+# Used for the departures beyond the projected ones before anything has drained
+DEFAULT_RETRY_AFTER = dt.timedelta(seconds=60)
+# Upper bound of the rate-based part of an estimate, so that a stale drain rate after
+# a quiet period cannot send clients away for hours
+MAX_RETRY_AFTER = dt.timedelta(hours=1)
+
+
+class DrainRate:
+    """
+    Observed rate at which vehicles leave one waiting queue (dispatched to a pile or
+    cancelled), as an exponentially weighted average over roughly `window`: recent
+    departures count most, so the rate follows the load through the day.
+    """
+
+    # Shortest observation period the rate is averaged over, so one early departure
+    # is not extrapolated into a burst
+    MIN_OBSERVATION_SECONDS = 60.0
+
+    def __init__(self, window: dt.timedelta = dt.timedelta(minutes=15)):
+        self.window_seconds = window.total_seconds()
+        self._weight = 0.0  # Exponentially decayed number of departures
+        self._updated_at: Optional[dt.datetime] = None
+        self._observing_since: Optional[dt.datetime] = None
+
+    def reset(self, now: dt.datetime):
+        self._weight = 0.0
+        self._updated_at = now
+        self._observing_since = now
+
+    def _decayed_weight(self, now: dt.datetime) -> float:
+        if self._updated_at is None:
+            self.reset(now)
+        elapsed = max(0.0, (now - self._updated_at).total_seconds())
+        return self._weight * math.exp(-elapsed / self.window_seconds)
+
+    def record(self, now: dt.datetime, count: int = 1):
+        self._weight = self._decayed_weight(now) + count
+        self._updated_at = max(now, self._updated_at)
+
+    def per_second(self, now: dt.datetime) -> float:
+        weight = self._decayed_weight(now)
+        observed = max((now - self._observing_since).total_seconds(), self.MIN_OBSERVATION_SECONDS)
+        # Correct for the part of the window that has not been observed yet
+        coverage = 1.0 - math.exp(-observed / self.window_seconds)
+        return weight / (self.window_seconds * coverage)
+
+
+class AdmissionService:
+    """
+    Tracks how fast each waiting queue drains and turns that into the time at which a
+    rejected submission can expect to be admitted (the basis of Retry-After).
+    """
+
+    def __init__(self, window: dt.timedelta = dt.timedelta(minutes=15)):
+        self.drain_rates: Dict[models.RequestType, DrainRate] = {
+            charge_type: DrainRate(window) for charge_type in models.RequestType
+        }
+
+    def reset(self, now: dt.datetime):
+        for drain_rate in self.drain_rates.values():
+            drain_rate.reset(now)
+
+    def record_departures(self, charge_type: models.RequestType, now: dt.datetime, count: int = 1):
+        self.drain_rates[charge_type].record(now, count)
+
+    def drain_per_hour(self, now: dt.datetime) -> Dict[models.RequestType, float]:
+        return {charge_type: rate.per_second(now) * 3600 for charge_type, rate in self.drain_rates.items()}
+
+    def estimate_wait(self, now: dt.datetime, places_needed: int, session_ends: List[dt.datetime]) -> dt.timedelta:
+        """
+        Time until `places_needed` more vehicles have left the waiting area. Vehicles are
+        dispatched as piles free up, so the first departures are expected at the projected
+        ends of the charging sessions in `session_ends`; any further ones at the observed
+        combined drain rate.
+        """
+        places_needed = max(places_needed, 1)
+        upcoming = sorted(end for end in session_ends if end > now)
+        if len(upcoming) >= places_needed:
+            return upcoming[places_needed - 1] - now
+
+        projected = upcoming[-1] - now if upcoming else dt.timedelta(0)
+        rate = sum(drain_rate.per_second(now) for drain_rate in self.drain_rates.values())
+        if rate <= 0:
+            return projected + DEFAULT_RETRY_AFTER
+        remaining_seconds = (places_needed - len(upcoming)) / rate
+        return projected + dt.timedelta(seconds=min(remaining_seconds, MAX_RETRY_AFTER.total_seconds()))
+
+
+# Global instance
+admission_service = AdmissionService()
@@ -0,0 +1,125 @@
+import itertools
+import math
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+CostMatrix = Union[np.ndarray, Sequence[Sequence[float]]]
+
+# Inputs with at most this many columns are solved by enumerating permutations.
+# At this size brute force is as fast as the Hungarian method and keeps the
+# historical tie-breaking (first permutation in lexicographic order wins).
+BRUTE_FORCE_MAX_COLS = 4
+
+
+def solve_assignment(cost: CostMatrix) -> List[Optional[int]]:
+    """
+    Solves the rectangular min-cost assignment problem for a rows x cols cost matrix.
+
+    Uses the Hungarian method with row/column potentials (the Jonker-Volgenant
+    shortest augmenting path formulation), which runs in O(rows^2 * cols); the
+    scan over columns is vectorized with NumPy.
+    Returns, for every row, the index of the column assigned to it. When there are
+    more rows than columns, the rows left without a column are returned as None.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.ndim != 2 or cost.shape[0] == 0:
+        return []
+    n_rows, n_cols = cost.shape
+    if n_cols == 0:
+        return [None] * n_rows
+
+    if n_rows > n_cols:
+        # Solve the transposed problem so that every column gets a row instead.
+        row_for_col = solve_assignment(cost.T)
+        assignment: List[Optional[int]] = [None] * n_rows
+        for j, i in enumerate(row_for_col):
+            assignment[i] = j
+        return assignment
+
+    # Potentials and matching are 1-indexed; index 0 is the virtual source.
+    u = np.zeros(n_rows + 1)
+    v = np.zeros(n_cols + 1)
+    row_of_col = np.zeros(n_cols + 1, dtype=np.int64)
+    way = np.zeros(n_cols + 1, dtype=np.int64)
+
+    for i in range(1, n_rows + 1):
+        row_of_col[0] = i
+        j0 = 0
+        minv = np.full(n_cols + 1, np.inf)
+        used = np.zeros(n_cols + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of_col[j0]
+            free = ~used
+            free[0] = False
+
+            cur = np.full(n_cols + 1, np.inf)
+            cur[1:] = cost[i0 - 1] - u[i0] - v[1:]
+            improved = free & (cur < minv)
+            minv[improved] = cur[improved]
+            way[improved] = j0
+
+            candidates = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+            if not math.isfinite(delta):
+                raise ValueError("Cost matrix has no feasible assignment (all remaining costs are infinite).")
+
+            u[row_of_col[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if row_of_col[j0] == 0:
+                break
+        # Walk the augmenting path back to the source
+        while j0:
+            j1 = way[j0]
+            row_of_col[j0] = row_of_col[j1]
+            j0 = j1
+
+    result: List[Optional[int]] = [None] * n_rows
+    for j in range(1, n_cols + 1):
+        if row_of_col[j]:
+            result[row_of_col[j] - 1] = j - 1
+    return result
+
+
+def brute_force_assignment(cost: CostMatrix) -> List[Optional[int]]:
+    """
+    Reference solver that enumerates every permutation of columns (rows <= cols).
+    Only suitable for very small inputs; kept for cross-checking and benchmarking.
+    """
+    n_rows = len(cost)
+    if n_rows == 0:
+        return []
+    n_cols = len(cost[0])
+    if n_rows > n_cols:
+        raise ValueError("Brute force assignment requires rows <= cols.")
+
+    best_permutation = None
+    min_total = math.inf
+    for permutation in itertools.permutations(range(n_cols), n_rows):
+        total = sum(cost[i][j] for i, j in enumerate(permutation))
+        if total < min_total:
+            min_total = total
+            best_permutation = permutation
+
+    if best_permutation is None:
+        return [None] * n_rows
+    return list(best_permutation)
+
+
+def optimal_assignment(cost: CostMatrix, brute_force_max_cols: int = BRUTE_FORCE_MAX_COLS) -> List[Optional[int]]:
+    """
+    Solves the assignment problem, falling back to brute force for tiny inputs.
+    Pass brute_force_max_cols=0 to always use the Hungarian method.
+    """
+    if len(cost) and len(cost) <= len(cost[0]) <= brute_force_max_cols:
+        return brute_force_assignment(cost)
+    return solve_assignment(cost)
+
+
+def assignment_cost(cost: CostMatrix, assignment: Sequence[Optional[int]]) -> float:
+    """Total cost of an assignment returned by one of the solvers."""
+    return float(sum(cost[i][j] for i, j in enumerate(assignment) if j is not None))
@@ -1,11 +1,25 @@
 import datetime as dt
 from decimal import Decimal
-from typing import Optional
+from typing import Dict, List, Optional, Tuple, Union
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud, models, schemas
-from ..queue_manager import queue_manager
+from ..queue_manager import QueueEntry, queue_manager
+from ..services.clock_service import clock_service
+from ..services.fixed_point import (
+    FEN_PER_YUAN,
+    MWH_PER_KWH,
+    US_PER_HOUR,
+    W_PER_KW,
+    fen_to_yuan,
+    kw_to_w,
+    kwh_to_mwh,
+    round_div,
+    wall_clock_us,
+)
+from ..services.scheduler_trigger import scheduler_trigger
+from ..services.tariff_service import tariff_service
 
 
 class BillingService:
@@ -15,9 +29,9 @@ class BillingService:
 
     SERVICE_FEE_PER_KWH = Decimal("0.8")
 
-    # Time-of-use (TOU) tariff periods (in UTC, assuming server runs in UTC)
-    # The prices are in Yuan per kWh.
-    # To handle timezones correctly in a real app, all times should be UTC.
+    # Built-in time-of-use (TOU) tariff periods, in effect before the first tariff version
+    # stored in the database (see TariffService). The prices are in Yuan per kWh.
+    # Periods are taken on the wall clock of the session's start time.
     TOU_TARIFFS = [
         # Peak: 10:00–15:00, 18:00–21:00
         {"start_hour": 10, "end_hour": 15, "rate": Decimal("1.0")},
@@ -30,41 +44,103 @@ class BillingService:
         {"start_hour": 23, "end_hour": 24, "rate": Decimal("0.4")},
         {"start_hour": 0, "end_hour": 7, "rate": Decimal("0.4")},
     ]
+    # Rate for any hour the periods above do not cover: the standard rate
+    DEFAULT_RATE = Decimal("0.7")
 
-    def get_price_for_time(self, timestamp: dt.datetime) -> Decimal:
+    # Fees are accumulated exactly as integer numerators and rounded to fen only once.
+    # A charge fee numerator is expressed in fen / CHARGE_FEE_DENOMINATOR (us * W * fen/kWh),
+    # a service fee numerator in fen / (MWH_PER_KWH * session duration in us)
+    # (mWh * us * fen/kWh, the fee rate weighted by the time spent under each tariff version).
+    CHARGE_FEE_DENOMINATOR = US_PER_HOUR * W_PER_KW
+
+    def __init__(self):
+        tariff_service.set_builtin(self.TOU_TARIFFS, self.DEFAULT_RATE, self.SERVICE_FEE_PER_KWH)
+
+    def get_price_for_time(self, timestamp: dt.datetime, pile_type: Optional[models.PileType] = None) -> Decimal:
         """Gets the electricity rate for a specific timestamp."""
-        hour = timestamp.hour
-        for tariff in self.TOU_TARIFFS:
-            if tariff["start_hour"] <= hour < tariff["end_hour"]:
-                return tariff["rate"]
-        # This should not be reached if tariffs cover 24h
-        return Decimal("0.7")  # Default to standard rate
+        time_us, offset_us = wall_clock_us(timestamp)
+        version = tariff_service.schedule_for(pile_type).version_at(time_us)
+        return fen_to_yuan(version.rate_fen_at(time_us + offset_us))
 
-    def calculate_charge_fee(self, start_time: dt.datetime, end_time: dt.datetime, power_rate_kw: Decimal) -> Decimal:
+    def _fee_units(
+        self, start_time: dt.datetime, end_time: dt.datetime, pile_type: Optional[models.PileType]
+    ) -> Tuple[int, int, int]:
         """
-        Calculates the total charge fee for a session, accurately handling TOU changes.
+        Walks the session through the tariff versions in effect during it and returns
+        (rate-time units in us * fen/kWh, service-fee-time units in us * fen/kWh, duration
+        in us). Each version is looked up in O(1) from its compiled tables; TOU periods
+        are taken on the wall clock of start_time's timezone.
         """
-        total_fee = Decimal(0)
-        energy_per_second = power_rate_kw / Decimal(3600)
+        start_us, offset_us = wall_clock_us(start_time)
+        end_us, _ = wall_clock_us(end_time)
+        rate_time_units = 0
+        fee_time_units = 0
+        for version, segment_start, segment_end in tariff_service.schedule_for(pile_type).segments(start_us, end_us):
+            rate_time_units += version.rate_time_units(segment_start + offset_us, segment_end + offset_us)
+            fee_time_units += (segment_end - segment_start) * version.service_fee_fen_per_kwh
+        duration_us = end_us - start_us
+        if duration_us <= 0:
+            # An empty session pays the service fee in effect at its start
+            return rate_time_units, version.service_fee_fen_per_kwh, 1
+        return rate_time_units, fee_time_units, duration_us
 
-        current_time = start_time
-        while current_time < end_time:
-            # Determine the end of the current tariff block or the end of the charge
-            rate = self.get_price_for_time(current_time)
-            next_hour = (current_time + dt.timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
-
-            # Find the next boundary (either next hour or end of charge)
-            boundary_time = min(end_time, next_hour)
+    def calculate_charge_fee_units(
+        self,
+        start_time: dt.datetime,
+        end_time: dt.datetime,
+        power_w: int,
+        pile_type: Optional[models.PileType] = None,
+    ) -> int:
+        """
+        Calculates the exact charge fee of a session as an integer numerator over
+        CHARGE_FEE_DENOMINATOR, split at tariff version changes and in O(1) per version
+        whatever the length of the session.
+        """
+        rate_time_units, _, _ = self._fee_units(start_time, end_time, pile_type)
+        return rate_time_units * power_w
 
-            duration_in_block = (boundary_time - current_time).total_seconds()
+    def calculate_charge_fee(self, start_time: dt.datetime, end_time: dt.datetime, power_rate_kw: Decimal) -> Decimal:
+        """
+        Calculates the total charge fee for a session in Yuan, accurately handling TOU changes.
+        """
+        units = self.calculate_charge_fee_units(start_time, end_time, kw_to_w(power_rate_kw))
+        return Decimal(units) / Decimal(self.CHARGE_FEE_DENOMINATOR * FEN_PER_YUAN)
 
-            if duration_in_block > 0:
-                energy_in_block = Decimal(duration_in_block) * energy_per_second
-                total_fee += energy_in_block * rate
+    def calculate_bill(
+        self,
+        start_time: dt.datetime,
+        end_time: dt.datetime,
+        power_rate_kw: Decimal,
+        actual_charge_amount: Decimal,
+        pile_type: Optional[models.PileType] = None,
+    ) -> Dict[str, Decimal]:
+        """
+        Calculates the rounded amounts of a charging order against the tariff versions in
+        effect during the session. Energy is delivered at a constant power, so it is split
+        between versions in proportion to time for the service fee. Everything is computed
+        in integer units; the Decimal values are only produced for persistence.
+        """
+        rate_time_units, fee_time_units, duration_us = self._fee_units(start_time, end_time, pile_type)
+        charge_units = rate_time_units * kw_to_w(power_rate_kw)
+        energy_mwh = kwh_to_mwh(actual_charge_amount)
+        service_units = energy_mwh * fee_time_units
+        service_denominator = MWH_PER_KWH * duration_us
 
-            current_time = boundary_time
+        charge_fee_fen = round_div(charge_units, self.CHARGE_FEE_DENOMINATOR)
+        service_fee_fen = round_div(service_units, service_denominator)
+        total_fee_fen = round_div(
+            charge_units * service_denominator + service_units * self.CHARGE_FEE_DENOMINATOR,
+            self.CHARGE_FEE_DENOMINATOR * service_denominator,
+        )
+        # Numeric(10, 2) kWh, i.e. 10 Wh steps
+        actual_charge_centi_kwh = round_div(energy_mwh, MWH_PER_KWH // 100)
 
-        return total_fee
+        return {
+            "actual_charge_amount": Decimal(actual_charge_centi_kwh).scaleb(-2),
+            "charge_fee": fen_to_yuan(charge_fee_fen),
+            "service_fee": fen_to_yuan(service_fee_fen),
+            "total_fee": fen_to_yuan(total_fee_fen),
+        }
 
     async def create_final_order(
         self,
@@ -78,9 +154,7 @@ class BillingService:
         Calculates fees and creates a charging order DB object without committing.
         """
         # 1. Calculate fees
-        charge_fee = self.calculate_charge_fee(request.start_time, end_time, pile.power_rate)
-        service_fee = actual_charge_amount * self.SERVICE_FEE_PER_KWH
-        total_fee = charge_fee + service_fee
+        bill = self.calculate_bill(request.start_time, end_time, pile.power_rate, actual_charge_amount, pile.type)
 
         # 2. Create ChargingOrder object
         order_create = schemas.ChargingOrderCreate(
@@ -89,10 +163,7 @@ class BillingService:
             pile_id=pile.pile_id,
             start_time=request.start_time,
             end_time=end_time,
-            actual_charge_amount=round(actual_charge_amount, 2),
-            charge_fee=round(charge_fee, 2),
-            service_fee=round(service_fee, 2),
-            total_fee=round(total_fee, 2),
+            **bill,
         )
         # This adds to the session, but does not commit
         return await crud.create_order(db, order=order_create)
@@ -106,7 +177,11 @@ class BillingService:
         final_pile_status: Optional[models.PileStatus] = None,
     ) -> Optional[models.ChargingOrder]:
         """
-        Finalizes a charging session: creates an order, updates states, and commits.
+        Finalizes a charging session with the energy actually delivered, e.g. when it is
+        stopped early: creates the order, finishes the request and starts the next vehicle
+        at the pile (or sets `final_pile_status`) in one commit. Like the batch path, the
+        in-memory pile queue is only advanced once the commit has succeeded. The caller
+        holds the pile's lock.
         """
         request = await crud.get_request(db, request_id)
         if not request or not request.start_time or not request.assigned_pile_id:
@@ -116,56 +191,126 @@ class BillingService:
         if not pile:
             return None
 
-        # Create the order object first
-        order = await self.create_final_order(db, request, pile, end_time, actual_charge_amount)
-
-        # Update states
-        request.status = models.RequestStatus.FINISHED
-        request.end_time = end_time
-
-        pile_queue = queue_manager.pile_queues.get(pile.pile_id)
-        if pile_queue:
-            # Remove the finished request from the in-memory queue
-            new_deque = [r for r in pile_queue if r.request_id != request.request_id]
-            pile_queue.clear()
-            pile_queue.extend(new_deque)
-
-        # Set the final status for the pile
-        if final_pile_status:
-            pile.status = final_pile_status
-        # If no specific final status is given, determine it based on queue
-        elif not pile_queue or not pile_queue[0]:
-            pile.status = models.PileStatus.AVAILABLE
-        else:
-            # Default behavior: start next in queue or set to available
-            await self.start_next_in_pile_queue(db, pile)
-
-        await db.merge(request)
-        await db.merge(pile)
-        await db.commit()
-        await db.refresh(order)
+        try:
+            orders = await self._finish_sessions(
+                db, [(pile.pile_id, request, end_time, actual_charge_amount)], final_pile_status
+            )
+        except Exception:
+            await db.rollback()
+            raise
 
-        return order
+        # A pile slot has been freed up
+        scheduler_trigger.notify()
+        return orders[0]
 
-    async def start_next_in_pile_queue(self, db: AsyncSession, pile: models.ChargingPile):
+    async def finish_charging_sessions(
+        self, db: AsyncSession, completions: List[Tuple[int, dt.datetime]]
+    ) -> List[models.ChargingOrder]:
         """
-        Checks if there is a next vehicle in the queue and starts it.
+        Finalizes the sessions charging at the given piles that ran to completion, each
+        at its (projected) end time with the full requested amount, as one transaction:
+        one INSERT for all orders, one batched UPDATE for the finished and started
+        requests and one for the piles. Returns the created orders.
+
+        If the batch fails it is rolled back and the sessions are finalized one at a
+        time, so a single bad session cannot hold up the others. The caller holds the
+        piles' locks.
         """
-        pile_queue = queue_manager.pile_queues.get(pile.pile_id)
-        if pile_queue:
-            # There is another vehicle waiting at the pile, start it.
-            next_request = pile_queue[0]
-            next_request.status = models.RequestStatus.CHARGING
-            next_request.start_time = dt.datetime.now(dt.timezone.utc)
-            pile.status = models.PileStatus.CHARGING
-            await db.merge(next_request)
-        else:
-            # The pile is now free
-            pile.status = models.PileStatus.AVAILABLE
-
-        await db.merge(pile)
+        sessions = []
+        for pile_id, end_time in completions:
+            # Skip sessions that have been stopped, faulted or rescheduled in the meantime
+            pile_queue = queue_manager.pile_queues.get(pile_id)
+            backlog = queue_manager.pile_backlogs.get(pile_id)
+            if pile_queue and backlog and backlog.charging_end == end_time:
+                sessions.append((pile_id, pile_queue[0], end_time, None))
+        if not sessions:
+            return []
+
+        try:
+            orders = await self._finish_sessions(db, sessions)
+        except Exception as e:
+            await db.rollback()
+            if len(sessions) == 1:
+                raise
+            print(f"Finalizing {len(sessions)} sessions in one transaction failed ({e}), retrying one by one.")
+            orders = []
+            for session in sessions:
+                try:
+                    orders += await self._finish_sessions(db, [session])
+                except Exception as e:
+                    await db.rollback()
+                    print(f"Finalizing request {session[1].queue_number} failed: {e}")
+
+        # Pile slots have been freed up
+        scheduler_trigger.notify()
+        return orders
+
+    async def _finish_sessions(
+        self,
+        db: AsyncSession,
+        sessions: List[Tuple[int, Union[QueueEntry, models.ChargingRequest], dt.datetime, Optional[Decimal]]],
+        final_pile_status: Optional[models.PileStatus] = None,
+    ) -> List[models.ChargingOrder]:
+        """
+        Writes and commits the completion of (pile_id, charging request, end_time,
+        actual amount) sessions, then advances the in-memory pile queues. The request is a
+        QueueEntry or a database row; an actual amount of None bills the full requested
+        amount. With `final_pile_status` the piles are set to it instead of starting the
+        next vehicle. The queues are only touched once the commit has succeeded, so a
+        failed batch leaves them as they were.
+        """
+        now = clock_service.now()
+        piles = {pile.pile_id: pile for pile in await crud.get_piles_by_ids(db, [s[0] for s in sessions])}
+
+        order_rows, request_rows, pile_rows = [], [], []
+        next_requests: List[Tuple[int, QueueEntry]] = []
+        for pile_id, request, end_time, actual_charge_amount in sessions:
+            pile = piles[pile_id]
+            if actual_charge_amount is None:
+                actual_charge_amount = request.requested_charge_amount
+            bill = self.calculate_bill(request.start_time, end_time, pile.power_rate, actual_charge_amount, pile.type)
+            order_rows.append(
+                dict(
+                    request_id=request.request_id,
+                    user_id=request.user_id,
+                    pile_id=pile_id,
+                    start_time=request.start_time,
+                    end_time=end_time,
+                    **bill,
+                )
+            )
+            request_rows.append(
+                {"request_id": request.request_id, "status": models.RequestStatus.FINISHED, "end_time": end_time}
+            )
+
+            # The vehicle queued behind the finished one starts charging now
+            next_request = None
+            if final_pile_status is None:
+                pile_queue = queue_manager.pile_queues.get(pile_id) or []
+                next_request = next((r for r in pile_queue if r.request_id != request.request_id), None)
+            if next_request is not None:
+                request_rows.append(
+                    {"request_id": next_request.request_id, "status": models.RequestStatus.CHARGING, "start_time": now}
+                )
+                next_requests.append((pile_id, next_request))
+            pile_status = final_pile_status
+            if pile_status is None:
+                pile_status = models.PileStatus.CHARGING if next_request is not None else models.PileStatus.AVAILABLE
+            pile_rows.append({"pile_id": pile_id, "status": pile_status})
+
+        orders = await crud.insert_orders_returning(db, order_rows)
+        await crud.update_requests_bulk(db, request_rows)
+        await crud.update_piles_bulk(db, pile_rows)
         await db.commit()
 
+        for pile_id, request, _, _ in sessions:
+            queue_manager.remove_from_pile(pile_id, request.request_id)
+        for pile_id, next_request in next_requests:
+            next_request.status = models.RequestStatus.CHARGING
+            next_request.start_time = now
+            queue_manager.start_charging(pile_id, next_request)
+        return orders
+
 
 # Global instance
 billing_service = BillingService()
@@ -1,51 +1,84 @@
+import asyncio
 import datetime as dt
+from typing import Callable, List, Tuple
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import crud
 from ..queue_manager import queue_manager
 from ..services.billing_service import billing_service
+from ..services.clock_service import clock_service
+from ..services.metrics_service import metrics_service
 
 
 class ChargingMonitorService:
     """
     Monitors active charging sessions and finalizes them upon completion.
+
+    The projected end of every session being charged is kept in the QueueManager's
+    deadline heap, so the monitor sleeps until the next one is due and only touches
+    the piles whose sessions have actually ended.
     """
 
-    async def check_completed_charges(self, db: AsyncSession):
+    def __init__(self, safety_net_interval: float = 60.0, max_concurrency: int = 4):
+        self.safety_net_interval = safety_net_interval
+        # Number of groups of due piles finalized in parallel, each on its own database session
+        self.max_concurrency = max_concurrency
+
+    async def wait_for_next_completion(self):
+        """
+        Sleeps until the earliest charging session is projected to end, waking early if
+        an earlier deadline is scheduled meanwhile, or after the safety-net interval.
+        """
+        # Clear before reading the heap so that deadlines pushed from now on wake us
+        queue_manager.completions_changed.clear()
+        timeout = self.safety_net_interval
+        next_end = queue_manager.next_completion()
+        if next_end is not None:
+            timeout = min(timeout, max(0.0, (next_end - clock_service.now()).total_seconds()))
+        try:
+            await asyncio.wait_for(queue_manager.completions_changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def has_due_completions(self) -> bool:
+        next_end = queue_manager.next_completion()
+        return next_end is not None and next_end <= clock_service.now()
+
+    async def check_completed_charges(self, session_factory: Callable[[], AsyncSession]):
         """
-        Iterates through all active charging piles, checks if the currently
-        charging vehicle has finished, and if so, processes the session completion.
+        Finalizes every charging session whose projected end has passed, ending it at
+        that projected time. The due piles are split into up to `max_concurrency`
+        groups that are finalized concurrently, each as one batch on its own session
+        while holding its piles' locks, so stop and fault requests for the same piles
+        wait for it (and vice versa).
         """
-        now = dt.datetime.now(dt.timezone.utc)
-
-        # Iterate over a copy of pile_queues' items to avoid issues with modification during iteration
-        for pile_id, pile_queue in list(queue_manager.pile_queues.items()):
-            if not pile_queue:
-                continue
-
-            # The first request in the queue is the one currently charging
-            charging_request = pile_queue[0]
-
-            if charging_request.status != "CHARGING" or not charging_request.start_time:
-                continue
-
-            pile = await crud.get_pile(db, pile_id)
-            if not pile or pile.power_rate <= 0:
-                continue
-
-            # Calculate estimated completion time
-            charge_duration_hours = charging_request.requested_charge_amount / pile.power_rate
-            estimated_end_time = charging_request.start_time + dt.timedelta(hours=float(charge_duration_hours))
-
-            if now >= estimated_end_time:
-                print(f"Charge for request {charging_request.queue_number} seems to be complete. Finalizing...")
-                await billing_service.finish_charging_session(
-                    db=db,
-                    request_id=charging_request.request_id,
-                    end_time=estimated_end_time,
-                    actual_charge_amount=charging_request.requested_charge_amount,
-                )
+        completions = queue_manager.due_completions(clock_service.now())
+        if not completions:
+            return
+
+        group_count = min(self.max_concurrency, len(completions))
+        groups = [completions[i::group_count] for i in range(group_count)]
+        with metrics_service.phase("finalize"):
+            results = await asyncio.gather(
+                *(self._finalize_group(session_factory, group) for group in groups), return_exceptions=True
+            )
+        metrics_service.record_vehicles(sum(result for result in results if isinstance(result, int)))
+        # Let every group finish before reporting a failure; its sessions stay due
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def _finalize_group(
+        self, session_factory: Callable[[], AsyncSession], completions: List[Tuple[int, dt.datetime]]
+    ) -> int:
+        async with queue_manager.locked(pile_ids=[pile_id for pile_id, _ in completions]):
+            for pile_id, end_time in completions:
+                pile_queue = queue_manager.pile_queues.get(pile_id)
+                if pile_queue and queue_manager.pile_backlogs[pile_id].charging_end == end_time:
+                    print(f"Charge for request {pile_queue[0].queue_number} seems to be complete. Finalizing...")
+            async with session_factory() as db:
+                orders = await billing_service.finish_charging_sessions(db, completions)
+        return len(orders)
 
 
 # Global instance
@@ -0,0 +1,36 @@
+import datetime as dt
+from typing import Optional
+
+
+class ClockService:
+    """
+    Source of the current time for the scheduling, monitoring and billing logic.
+    Uses the system clock unless a virtual time has been set, e.g. by the offline simulator.
+    """
+
+    def __init__(self):
+        self._virtual_now: Optional[dt.datetime] = None
+
+    def now(self) -> dt.datetime:
+        if self._virtual_now is not None:
+            return self._virtual_now
+        return dt.datetime.now(dt.timezone.utc)
+
+    @property
+    def is_virtual(self) -> bool:
+        return self._virtual_now is not None
+
+    def set_virtual_time(self, now: dt.datetime):
+        """Freezes the clock at `now`. Virtual time can only move forward."""
+        if now.tzinfo is None:
+            raise ValueError("Virtual time must be timezone-aware.")
+        if self._virtual_now is not None and now < self._virtual_now:
+            raise ValueError("Virtual time cannot move backwards.")
+        self._virtual_now = now
+
+    def use_system_time(self):
+        self._virtual_now = None
+
+
+# Global instance of the clock service
+clock_service = ClockService()
@@ -5,6 +5,7 @@ class SchedulingStrategy(str, Enum):
     SHORTEST_INDIVIDUAL_COMPLETION = "SHORTEST_INDIVIDUAL_COMPLETION"
     SHORTEST_BATCH_COMPLETION = "SHORTEST_BATCH_COMPLETION"
     BATCH_FULL_LOAD_SHORTEST_TIME = "BATCH_FULL_LOAD_SHORTEST_TIME"
+    ROLLING_HORIZON_BATCH_COMPLETION = "ROLLING_HORIZON_BATCH_COMPLETION"
 
 
 class ConfigService:
@@ -14,6 +15,10 @@ class ConfigService:
 
     def __init__(self):
         self._scheduling_strategy = SchedulingStrategy.SHORTEST_INDIVIDUAL_COMPLETION
+        # When enabled, the scheduler keeps dispatching within one run until no
+        # waiting request can be placed, instead of running its strategy once.
+        self._drain_until_saturated = True
+        self._max_dispatch_per_tick = 100
 
     @property
     def scheduling_strategy(self) -> SchedulingStrategy:
@@ -24,6 +29,20 @@ class ConfigService:
             raise ValueError("Invalid scheduling strategy")
         self._scheduling_strategy = strategy
 
+    @property
+    def drain_until_saturated(self) -> bool:
+        return self._drain_until_saturated
+
+    @property
+    def max_dispatch_per_tick(self) -> int:
+        return self._max_dispatch_per_tick
+
+    def set_scheduler_mode(self, drain_until_saturated: bool, max_dispatch_per_tick: int):
+        if max_dispatch_per_tick < 1:
+            raise ValueError("max_dispatch_per_tick must be at least 1")
+        self._drain_until_saturated = drain_until_saturated
+        self._max_dispatch_per_tick = max_dispatch_per_tick
+
 
 # Global instance of the config service
 config_service = ConfigService()
@@ -0,0 +1,26 @@
+from typing import Sequence
+
+import numpy as np
+
+
+def charge_time_matrix(amounts: Sequence[float], power_rates: Sequence[float]) -> np.ndarray:
+    """
+    Builds the requests x piles matrix of charging times (amount / power) in one operation,
+    e.g. Wh / W gives hours.
+    Piles without a positive power rate get an infinite charging time.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64).reshape(-1, 1)
+    power_rates = np.asarray(power_rates, dtype=np.float64).reshape(1, -1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(power_rates > 0, amounts / power_rates, np.inf)
+
+
+def completion_time_matrix(
+    amounts: Sequence[float], power_rates: Sequence[float], wait_hours: Sequence[float]
+) -> np.ndarray:
+    """
+    Builds the requests x piles matrix of completion times in hours:
+    the wait at the pile plus the request's own charging time there.
+    """
+    wait = np.asarray(wait_hours, dtype=np.float64).reshape(1, -1)
+    return charge_time_matrix(amounts, power_rates) + wait
@@ -1,12 +1,14 @@
-import datetime as dt
 from decimal import Decimal
 from typing import Any, Dict
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud, models
-from ..queue_manager import queue_manager
+from ..queue_manager import QueueEntry, queue_manager
 from ..services.billing_service import billing_service
+from ..services.clock_service import clock_service
+from ..services.fixed_point import energy_mwh_for_duration, kw_to_w, mwh_to_kwh, timedelta_to_us
+from ..services.scheduler_trigger import scheduler_trigger
 
 
 class FaultService:
@@ -17,7 +19,14 @@ class FaultService:
     async def handle_pile_fault(self, db: AsyncSession, pile_id: int) -> Dict[str, Any]:
         """
         Handles a fault report for a charging pile. This is a single transactional operation.
+        It holds the pile's lock, so the charging session cannot also be finalized by the
+        charging monitor or a stop request, and the waiting-queue locks for the vehicles
+        it sends back to the waiting area.
         """
+        async with queue_manager.locked(queue_manager.waiting_area.queues, [pile_id]):
+            return await self._handle_pile_fault(db, pile_id)
+
+    async def _handle_pile_fault(self, db: AsyncSession, pile_id: int) -> Dict[str, Any]:
         pile = await crud.get_pile(db, pile_id)
         if not pile:
             return {"error": "充电桩不存在"}
@@ -43,18 +52,25 @@ class FaultService:
             "bill_generated": False,
         }
 
+        # Vehicles waiting in the pile's queue behind the charging one go back to the front
+        # of the waiting area, ahead of newer arrivals (the re-queued remainder goes first).
+        queued_requests = [req for req in pile_queue or [] if req.status == models.RequestStatus.WAITING]
+        for queued_request in reversed(queued_requests):
+            queued_request.assigned_pile_id = None
+            await crud.update_request_fields(db, queued_request.request_id, assigned_pile_id=None)
+            queue_manager.requeue_front(queued_request)
+
         if (
             charging_request
             and charging_request.status == models.RequestStatus.CHARGING
             and charging_request.start_time
         ):
             # Step 1: Stop ongoing charging session and generate bill
-            end_time = dt.datetime.now(dt.timezone.utc)
-            duration_seconds = (end_time - charging_request.start_time).total_seconds()
-            actual_charge_amount = (Decimal(duration_seconds) / Decimal(3600)) * pile.power_rate
-
-            if actual_charge_amount < 0:
-                actual_charge_amount = Decimal(0)
+            end_time = clock_service.now()
+            energy_mwh = energy_mwh_for_duration(
+                timedelta_to_us(end_time - charging_request.start_time), kw_to_w(pile.power_rate)
+            )  # never negative
+            actual_charge_amount = mwh_to_kwh(energy_mwh)
 
             # Create bill, but don't commit yet
             await billing_service.create_final_order(db, charging_request, pile, end_time, actual_charge_amount)
@@ -62,9 +78,9 @@ class FaultService:
             result["stopped_charging"] = True
 
             # Mark original request as finished
-            charging_request.status = models.RequestStatus.FINISHED
-            charging_request.end_time = end_time
-            await db.merge(charging_request)
+            await crud.update_request_fields(
+                db, charging_request.request_id, status=models.RequestStatus.FINISHED, end_time=end_time
+            )
 
             # Step 2: Re-queue remaining charge amount
             remaining_charge = charging_request.requested_charge_amount - actual_charge_amount
@@ -73,11 +89,9 @@ class FaultService:
                 result["requeued_request_id"] = new_req.request_id
 
         # Step 3: Clear in-memory pile queue and set pile status to FAULTY
-        if pile_queue:
-            pile_queue.clear()
+        queue_manager.clear_pile(pile.pile_id)
 
         pile.status = models.PileStatus.FAULTY
-        await db.merge(pile)
 
         # Step 4: Log the event
         await self._log_fault_event(db, pile_id, "USER_REPORTED_FAULT", "用户上报充电桩故障")
@@ -85,6 +99,11 @@ class FaultService:
         # Step 5: Commit all changes as a single transaction
         await db.commit()
 
+        # Step 6: Let the scheduler pick up the re-queued request. Quote projections built
+        # while the commit was awaited still saw the pile working, so they are made stale now.
+        queue_manager.bump_version()
+        scheduler_trigger.notify()
+
         return result
 
     async def _requeue_remaining_charge(
@@ -97,23 +116,19 @@ class FaultService:
         Creates a new request for the remaining charge and adds it to the front of the waiting queue.
         Does not commit.
         """
-        new_queue_number = queue_manager._generate_queue_number(original_request.requested_charge_type)
+        new_queue_number = await queue_manager._generate_queue_number(db, original_request.requested_charge_type)
         new_request = models.ChargingRequest(
             user_id=original_request.user_id,
             queue_number=new_queue_number,
             requested_charge_type=original_request.requested_charge_type,
             requested_charge_amount=remaining_charge,
             status=models.RequestStatus.WAITING,
-            request_time=dt.datetime.now(dt.timezone.utc),
+            request_time=clock_service.now(),
         )
         db.add(new_request)
         await db.flush()  # Flush to get the new request_id without committing
-        await db.refresh(new_request)
 
-        if new_request.requested_charge_type == models.RequestType.FAST:
-            queue_manager.waiting_queue_fast.appendleft(new_request)
-        else:
-            queue_manager.waiting_queue_trickle.appendleft(new_request)
+        queue_manager.requeue_front(QueueEntry.from_model(new_request))
 
         return new_request
 
@@ -0,0 +1,113 @@
+"""
+Fixed-point integer units used inside the scheduling and billing engines.
+
+- energy: Wh (int), or mWh where sub-Wh precision matters for billing
+- power: W (int)
+- money: fen (int)
+- time: microseconds (int)
+
+Values are converted from the Decimal columns (Numeric(10, 2) kWh / kW / Yuan)
+when they enter an engine, and back to Decimal only at the persistence boundary.
+"""
+
+import datetime as dt
+from decimal import ROUND_HALF_EVEN, Decimal
+from typing import Tuple, Union
+
+import numpy as np
+
+WH_PER_KWH = 1000
+MWH_PER_KWH = 1_000_000
+W_PER_KW = 1000
+FEN_PER_YUAN = 100
+US_PER_SECOND = 1_000_000
+US_PER_HOUR = 3600 * US_PER_SECOND
+
+_EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+
+Number = Union[Decimal, int, float, str]
+
+
+def round_div(numerator: int, denominator: int) -> int:
+    """Integer division rounded half-to-even, like round() on a Decimal."""
+    quotient, remainder = divmod(numerator, denominator)
+    twice_remainder = 2 * remainder
+    if twice_remainder > denominator or (twice_remainder == denominator and quotient % 2 == 1):
+        quotient += 1
+    return quotient
+
+
+def round_div_array(numerator: np.ndarray, denominator: Union[int, np.ndarray]) -> np.ndarray:
+    """round_div over int64 arrays."""
+    quotient, remainder = np.divmod(numerator, denominator)
+    twice_remainder = 2 * remainder
+    round_up = (twice_remainder > denominator) | ((twice_remainder == denominator) & (quotient % 2 == 1))
+    return quotient + round_up
+
+
+def _scale(value: Number, factor: int) -> int:
+    return int((Decimal(value) * factor).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+def kwh_to_wh(kwh: Number) -> int:
+    return _scale(kwh, WH_PER_KWH)
+
+
+def kwh_to_mwh(kwh: Number) -> int:
+    return _scale(kwh, MWH_PER_KWH)
+
+
+def kw_to_w(kw: Number) -> int:
+    return _scale(kw, W_PER_KW)
+
+
+def yuan_to_fen(yuan: Number) -> int:
+    return _scale(yuan, FEN_PER_YUAN)
+
+
+def wh_to_kwh(wh: int) -> Decimal:
+    return Decimal(wh).scaleb(-3)
+
+
+def w_to_kw(w: int) -> Decimal:
+    return Decimal(w).scaleb(-3)
+
+
+def mwh_to_kwh(mwh: int) -> Decimal:
+    return Decimal(mwh).scaleb(-6)
+
+
+def fen_to_yuan(fen: int) -> Decimal:
+    return Decimal(fen).scaleb(-2)
+
+
+def timedelta_to_us(delta: dt.timedelta) -> int:
+    return (delta.days * 86400 + delta.seconds) * US_PER_SECOND + delta.microseconds
+
+
+def datetime_to_us(timestamp: dt.datetime) -> int:
+    """Microseconds since the Unix epoch."""
+    return timedelta_to_us(timestamp - _EPOCH)
+
+
+def wall_clock_us(timestamp: dt.datetime) -> Tuple[int, int]:
+    """Microseconds since the Unix epoch and the UTC offset of the timestamp's wall clock (UTC if naive)."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=dt.timezone.utc)
+    return datetime_to_us(timestamp), timedelta_to_us(timestamp.utcoffset())
+
+
+def charge_duration_us(amount_wh: int, power_w: int) -> int:
+    """Time needed to deliver amount_wh at power_w, in microseconds."""
+    if power_w <= 0:
+        raise ValueError("Power must be positive to compute a charge duration.")
+    return round_div(amount_wh * US_PER_HOUR, power_w)
+
+
+def charge_duration(amount_wh: int, power_w: int) -> dt.timedelta:
+    return dt.timedelta(microseconds=charge_duration_us(amount_wh, power_w))
+
+
+def energy_mwh_for_duration(duration_us: int, power_w: int) -> int:
+    """Energy delivered at power_w during duration_us, in mWh (us * W / 3.6e6)."""
+    return round_div(max(0, duration_us) * power_w, US_PER_HOUR // 1000)
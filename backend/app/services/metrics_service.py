@@ -0,0 +1,179 @@
+import bisect
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+DURATION_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are reported as the upper bound of their bucket."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for upper_bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(upper_bound, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(le): n for le, n in zip((*self.buckets, "+Inf"), self.counts)},
+        }
+
+
+class TickRecorder:
+    """Measurements collected during one run of a background loop."""
+
+    def __init__(self):
+        self.phases_ms: Dict[str, float] = {}
+        self.statements = 0
+        self.vehicles = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.phases_ms[name] = self.phases_ms.get(name, 0.0) + elapsed_ms
+
+
+class LoopMetrics:
+    """Aggregated measurements of one background loop for one label (e.g. a scheduling strategy)."""
+
+    def __init__(self):
+        self.ticks = 0
+        self.errors = 0
+        self.tick_ms = Histogram(DURATION_BUCKETS_MS)
+        self.phase_ms: Dict[str, Histogram] = {}
+        self.statements = Histogram(COUNT_BUCKETS)
+        self.vehicles = Histogram(COUNT_BUCKETS)
+        self.last_tick: Optional[Dict[str, Any]] = None
+
+    def record(self, recorder: TickRecorder, duration_ms: float, failed: bool):
+        self.ticks += 1
+        if failed:
+            self.errors += 1
+        self.tick_ms.observe(duration_ms)
+        for name, elapsed_ms in recorder.phases_ms.items():
+            self.phase_ms.setdefault(name, Histogram(DURATION_BUCKETS_MS)).observe(elapsed_ms)
+        self.statements.observe(recorder.statements)
+        self.vehicles.observe(recorder.vehicles)
+        self.last_tick = {
+            "duration_ms": duration_ms,
+            "phases_ms": dict(recorder.phases_ms),
+            "statements": recorder.statements,
+            "vehicles": recorder.vehicles,
+            "failed": failed,
+        }
+
+
+_current_tick: contextvars.ContextVar[Optional[TickRecorder]] = contextvars.ContextVar("current_tick", default=None)
+
+
+class MetricsService:
+    """
+    Instrumentation for the scheduler and charging monitor loops: tick duration
+    histograms, per-phase timings, SQL statement counts and vehicles handled per tick
+    (dispatched to a pile by the scheduler, finalized by the monitor).
+    """
+
+    def __init__(self):
+        self._loops: Dict[Tuple[str, str], LoopMetrics] = {}
+
+    @contextmanager
+    def tick(self, loop: str, label: str = "default") -> Iterator[TickRecorder]:
+        """Measures one run of a background loop. Phases and statements inside it are attributed to it."""
+        recorder = TickRecorder()
+        token = _current_tick.set(recorder)
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield recorder
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _current_tick.reset(token)
+            duration_ms = (time.perf_counter() - started) * 1000
+            self._loops.setdefault((loop, label), LoopMetrics()).record(recorder, duration_ms, failed)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Times a phase of the current tick; does nothing outside of a tick."""
+        recorder = _current_tick.get()
+        if recorder is None:
+            yield
+            return
+        with recorder.phase(name):
+            yield
+
+    def record_vehicles(self, count: int):
+        """Adds to the number of vehicles handled by the current tick."""
+        recorder = _current_tick.get()
+        if recorder is not None:
+            recorder.vehicles += count
+
+    def _count_statement(self, *args):
+        recorder = _current_tick.get()
+        if recorder is not None:
+            recorder.statements += 1
+
+    def install_statement_counter(self, engine: AsyncEngine):
+        """Counts every SQL statement executed during a tick."""
+        if not event.contains(engine.sync_engine, "before_cursor_execute", self._count_statement):
+            event.listen(engine.sync_engine, "before_cursor_execute", self._count_statement)
+
+    def snapshot(self) -> list:
+        return [
+            {
+                "loop": loop,
+                "label": label,
+                "ticks": metrics.ticks,
+                "errors": metrics.errors,
+                "tick_ms": metrics.tick_ms.snapshot(),
+                "phase_ms": {name: histogram.snapshot() for name, histogram in metrics.phase_ms.items()},
+                "statements": metrics.statements.snapshot(),
+                "vehicles": metrics.vehicles.snapshot(),
+                "last_tick": metrics.last_tick,
+            }
+            for (loop, label), metrics in sorted(self._loops.items())
+        ]
+
+    def reset(self):
+        self._loops = {}
+
+
+# Global instance of the metrics service
+metrics_service = MetricsService()
@@ -1,6 +1,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud, models, schemas
+from ..queue_manager import queue_manager
+from ..services.scheduler_trigger import scheduler_trigger
 
 
 class PileSimulatorService:
@@ -55,9 +57,10 @@ class PileSimulatorService:
             await crud.create_pile_log(db, log=log_create)
             print(f"Pile {pile.pile_code} status changed to {new_status.value}")
 
-            # Update in-memory representation if necessary
-            # This part is crucial for the scheduler to see the change instantly.
-            # (Currently, scheduler refetches piles, so this is implicitly handled)
+            # The scheduler reloads piles on every run, so waking it up is enough
+            # for it to see the change instantly. Quote projections reload them too.
+            queue_manager.bump_version()
+            scheduler_trigger.notify()
 
         return pile
 
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Dict
+
+import sqlalchemy as sa
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .. import models
+
+QUEUE_NUMBER_PREFIX = {models.RequestType.FAST: "F", models.RequestType.TRICKLE: "T"}
+
+
+class QueueNumberBlock:
+    """A range [next, limit) of queue numbers reserved by this process."""
+
+    def __init__(self):
+        self.next = 0
+        self.limit = 0
+
+    def exhausted(self) -> bool:
+        return self.next >= self.limit
+
+
+class QueueNumberService:
+    """
+    Allocates queue numbers ("F12", "T3") from per-type database sequences.
+
+    Every nextval() reserves a whole block of numbers (the sequence's INCREMENT), which
+    this process then hands out without touching the database, so concurrent workers
+    never collide and only one request in QUEUE_NUMBER_BLOCK_SIZE pays a round-trip.
+    Numbers stay unique and increasing per process; blocks left over at shutdown leave
+    gaps. Databases without sequences (the SQLite simulator, a single process) get one
+    unbounded block starting after the highest number already issued.
+    """
+
+    def __init__(self):
+        self._blocks: Dict[models.RequestType, QueueNumberBlock] = {
+            charge_type: QueueNumberBlock() for charge_type in models.RequestType
+        }
+        self._locks: Dict[models.RequestType, asyncio.Lock] = {
+            charge_type: asyncio.Lock() for charge_type in models.RequestType
+        }
+
+    async def allocate(self, db: AsyncSession, charge_type: models.RequestType) -> str:
+        block = self._blocks[charge_type]
+        if block.exhausted():
+            async with self._locks[charge_type]:
+                # Another coroutine may have refilled the block while we waited
+                if block.exhausted():
+                    await self._reserve_block(db, charge_type, block)
+        number = block.next
+        block.next += 1
+        return f"{QUEUE_NUMBER_PREFIX[charge_type]}{number}"
+
+    async def _reserve_block(self, db: AsyncSession, charge_type: models.RequestType, block: QueueNumberBlock):
+        sequence = models.queue_number_sequences[charge_type]
+        if db.bind.dialect.supports_sequences:
+            block.next = await db.scalar(select(sequence.next_value()))
+            block.limit = block.next + sequence.increment
+        else:
+            prefix = QUEUE_NUMBER_PREFIX[charge_type]
+            number = func.cast(func.substring(models.ChargingRequest.queue_number, 2), sa.Integer)
+            stmt = select(func.max(number)).where(models.ChargingRequest.queue_number.startswith(prefix))
+            block.next = (await db.scalar(stmt) or 0) + 1
+            block.limit = float("inf")
+
+    def reset(self):
+        """Drops the reserved blocks; the next allocation reserves a new one."""
+        for block in self._blocks.values():
+            block.next = block.limit = 0
+
+
+# Global instance
+queue_number_service = QueueNumberService()
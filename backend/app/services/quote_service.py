@@ -0,0 +1,156 @@
+import asyncio
+import datetime as dt
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import crud, models, schemas
+from ..queue_manager import queue_manager
+from ..services.billing_service import billing_service
+from ..services.clock_service import clock_service
+from ..services.cost_model import completion_time_matrix
+from ..services.fixed_point import US_PER_HOUR, charge_duration, kw_to_w, kwh_to_wh, timedelta_to_us
+
+_PILE_STATUSES = (models.PileStatus.AVAILABLE, models.PileStatus.CHARGING)
+
+
+class PileProjection:
+    """
+    Projected state of the working piles of one type once the vehicles already waiting
+    for that type have been dispatched: when each pile is free for one more vehicle.
+    """
+
+    def __init__(self, piles: List[models.ChargingPile], power_w: List[int], free_at: List[dt.datetime]):
+        self.piles = piles
+        self.power_w = power_w
+        self.free_at = free_at
+        self.vehicles_ahead = 0
+
+    def dispatch(self, amount_wh: int, now: dt.datetime) -> Optional[int]:
+        """
+        Index of the pile the scheduler's cost model picks for a vehicle (the shortest
+        wait plus own charging time, first pile on ties), or None without a working pile.
+        """
+        if not self.piles:
+            return None
+        wait_hours = [max(0, timedelta_to_us(free_at - now)) / US_PER_HOUR for free_at in self.free_at]
+        completion_times = completion_time_matrix([amount_wh], self.power_w, wait_hours)[0]
+        best_index = int(np.argmin(completion_times))
+        if not np.isfinite(completion_times[best_index]):
+            return None
+        return best_index
+
+
+class QueueProjection:
+    """The pile projections of every charge type, built from one version of the queues."""
+
+    def __init__(self, version: int, projected_at: dt.datetime, by_type: Dict[models.PileType, PileProjection]):
+        self.version = version
+        self.projected_at = projected_at
+        self.by_type = by_type
+
+
+class QuoteService:
+    """
+    Price and ETA quotes for a charging request before it is submitted.
+
+    Quotes are answered from a projection of the queues: every vehicle already waiting
+    (including the overflow list) is dispatched in queue order to the pile the
+    scheduler's cost model picks, and a new request comes after them. The projection is
+    cached and rebuilt, with a single pile query, only after QueueManager.version has
+    moved, i.e. after the queues or the piles have changed; a quote itself costs no
+    database query. Fees come from the compiled tariff tables.
+
+    Quotes ignore the pile queue capacity and the scheduling strategy's batching, so
+    they are estimates of the order of the scheduler's decisions, not promises.
+    """
+
+    def __init__(self):
+        self._projection: Optional[QueueProjection] = None
+        # Only one rebuild at a time; concurrent quotes wait for it and share the result
+        self._rebuild_lock = asyncio.Lock()
+
+    async def projection(self, db: AsyncSession) -> QueueProjection:
+        """The current projection, rebuilt first if the queues have changed since it was built."""
+        projection = self._projection
+        if projection is not None and projection.version == queue_manager.version:
+            return projection
+        async with self._rebuild_lock:
+            projection = self._projection
+            if projection is None or projection.version != queue_manager.version:
+                # Read the version before awaiting, so that changes made meanwhile leave it stale
+                version = queue_manager.version
+                piles = await crud.get_all_piles(db)
+                projection = self._project(version, piles, clock_service.now())
+                self._projection = projection
+        return projection
+
+    def _project(self, version: int, piles: List[models.ChargingPile], now: dt.datetime) -> QueueProjection:
+        by_type = {}
+        for pile_type in models.PileType:
+            working = []
+            power_w = []
+            free_at = []
+            for pile in piles:
+                backlog = queue_manager.pile_backlogs.get(pile.pile_id)
+                pile_power_w = backlog.power_w if backlog else kw_to_w(pile.power_rate)
+                if pile.type != pile_type or pile.status not in _PILE_STATUSES or pile_power_w <= 0:
+                    continue
+                working.append(pile)
+                power_w.append(pile_power_w)
+                free_at.append(backlog.projected_free_at(now) if backlog else now)
+            projection = PileProjection(working, power_w, free_at)
+
+            waiting = list(queue_manager.waiting_queue_for(models.RequestType(pile_type.value)))
+            waiting += [
+                request
+                for request in queue_manager.waiting_area.overflow
+                if request.requested_charge_type.value == pile_type.value
+            ]
+            for request in waiting:
+                index = projection.dispatch(request.amount_wh, now)
+                if index is None:
+                    break
+                start = max(now, projection.free_at[index])
+                projection.free_at[index] = start + charge_duration(request.amount_wh, projection.power_w[index])
+            projection.vehicles_ahead = len(waiting)
+            by_type[pile_type] = projection
+        return QueueProjection(version, now, by_type)
+
+    async def quote(
+        self, db: AsyncSession, charge_type: models.RequestType, amount: Decimal
+    ) -> Optional[schemas.ChargeQuote]:
+        """Quotes a request for `amount` kWh of `charge_type`, or None if no pile of that type works."""
+        if amount <= 0:
+            raise ValueError("requested_charge_amount must be positive.")
+        queue_projection = await self.projection(db)
+        projection = queue_projection.by_type[models.PileType(charge_type.value)]
+        now = clock_service.now()
+        amount_wh = kwh_to_wh(amount)
+        index = projection.dispatch(amount_wh, now)
+        if index is None:
+            return None
+
+        pile = projection.piles[index]
+        start_time = max(now, projection.free_at[index])
+        finish_time = start_time + charge_duration(amount_wh, projection.power_w[index])
+        bill = billing_service.calculate_bill(start_time, finish_time, pile.power_rate, amount, pile.type)
+        return schemas.ChargeQuote(
+            requested_charge_type=charge_type,
+            requested_charge_amount=amount,
+            pile_id=pile.pile_id,
+            pile_code=pile.pile_code,
+            vehicles_ahead=projection.vehicles_ahead,
+            start_time=start_time,
+            finish_time=finish_time,
+            charge_fee=bill["charge_fee"],
+            service_fee=bill["service_fee"],
+            total_fee=bill["total_fee"],
+            projected_at=queue_projection.projected_at,
+        )
+
+
+# Global instance
+quote_service = QuoteService()
@@ -0,0 +1,239 @@
+import csv
+import datetime as dt
+from typing import Dict, Iterable, Optional, TextIO, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import crud, models
+from .billing_service import BillingService
+from .fixed_point import (
+    MWH_PER_KWH,
+    fen_to_yuan,
+    kw_to_w,
+    kwh_to_mwh,
+    round_div,
+    round_div_array,
+    wall_clock_us,
+    yuan_to_fen,
+)
+from .tariff_service import tariff_service
+from .tariff_table import TariffSchedule
+
+REPORT_COLUMNS = [
+    "order_id",
+    "pile_id",
+    "pile_type",
+    "start_time",
+    "end_time",
+    "actual_charge_amount",
+    "stored_charge_fee",
+    "rebilled_charge_fee",
+    "stored_service_fee",
+    "rebilled_service_fee",
+    "stored_total_fee",
+    "rebilled_total_fee",
+    "total_fee_delta",
+]
+
+
+class RebillingService:
+    """
+    Re-bills stored charging orders in bulk, e.g. to audit them against the tariff
+    versions in effect or to price a past period under another tariff version.
+
+    Orders are streamed from the database in keyset pages and each page is billed with
+    NumPy over int64 arrays against the compiled tariff tables, with exactly the
+    integer arithmetic and rounding of BillingService.calculate_bill, so that an
+    audit under the tariffs in effect reproduces the stored fees. Only the few
+    sessions that straddle a change of service fee are finished in Python integers.
+
+    Sessions are re-billed from the stored order: its start and end times, its rounded
+    energy and the pile's current power rate.
+    """
+
+    # Charge fee numerators are in us * W * fen/kWh, as in BillingService
+    CHARGE_FEE_DENOMINATOR = BillingService.CHARGE_FEE_DENOMINATOR
+    # Largest power for which rate-time remainders times power fit in int64
+    MAX_POWER_W = np.iinfo(np.int64).max // CHARGE_FEE_DENOMINATOR
+
+    def __init__(self, chunk_size: int = 50_000):
+        self.chunk_size = chunk_size
+
+    def bill_arrays(
+        self,
+        schedule: TariffSchedule,
+        start_us: np.ndarray,
+        end_us: np.ndarray,
+        offset_us: np.ndarray,
+        power_w: np.ndarray,
+        energy_mwh: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Bills arrays of sessions against a tariff schedule: absolute start and end
+        times, the UTC offsets of their wall clocks, power and energy. Returns the
+        charge, service and total fees in fen.
+        """
+        if len(power_w) and power_w.max() > self.MAX_POWER_W:
+            raise ValueError(f"Cannot re-bill powers above {self.MAX_POWER_W} W in int64.")
+        denominator = self.CHARGE_FEE_DENOMINATOR
+        rate_units, fee_units = schedule.integrate_array(start_us, end_us, offset_us)
+
+        # Charge fee: rate_units * power_w / denominator, split so that nothing overflows
+        rate_quotient, rate_remainder = np.divmod(rate_units, denominator)
+        carry, charge_remainder = np.divmod(rate_remainder * power_w, denominator)
+        charge_quotient = rate_quotient * power_w + carry
+        charge_fen = _round_remainder(charge_quotient, charge_remainder, denominator)
+
+        # Service fee: a single rate over the whole session reduces to energy * rate; empty
+        # sessions pay the rate in effect at their start, like calculate_bill
+        duration_us = end_us - start_us
+        service_rate = schedule.service_fee_at_array(start_us)
+        service_units = energy_mwh * service_rate
+        service_fen = round_div_array(service_units, MWH_PER_KWH)
+
+        # Total fee: (charge_units * MWH_PER_KWH + service_units * denominator) / (denominator * MWH_PER_KWH),
+        # with the quotients and remainders of both terms added separately
+        service_quotient, service_remainder = np.divmod(service_units, MWH_PER_KWH)
+        total_remainder = charge_remainder * MWH_PER_KWH + service_remainder * denominator
+        total_fen = _round_remainder(charge_quotient + service_quotient, total_remainder, denominator * MWH_PER_KWH)
+
+        mixed = np.flatnonzero((duration_us > 0) & (fee_units != duration_us * service_rate))
+        for row in mixed:
+            # The service fee changed during the session: weight it by time, in Python integers
+            charge_units = int(rate_units[row]) * int(power_w[row])
+            service_units_row = int(energy_mwh[row]) * int(fee_units[row])
+            service_denominator = MWH_PER_KWH * int(duration_us[row])
+            service_fen[row] = round_div(service_units_row, service_denominator)
+            total_fen[row] = round_div(
+                charge_units * service_denominator + service_units_row * denominator,
+                denominator * service_denominator,
+            )
+        return charge_fen, service_fen, total_fen
+
+    async def audit(
+        self,
+        db: AsyncSession,
+        report: TextIO,
+        start_time: Optional[dt.datetime] = None,
+        end_time: Optional[dt.datetime] = None,
+        tariff_id: Optional[int] = None,
+        pile_type: Optional[models.PileType] = None,
+        include_unchanged: bool = False,
+    ) -> Dict:
+        """
+        Re-bills the orders that started in [start_time, end_time) and writes a CSV
+        report of the ones whose fees differ from the stored ones (or of every order).
+
+        With `tariff_id`, every session is billed entirely under that tariff version
+        (a stored one, or the built-in tariff for 0); otherwise under the versions in
+        effect for its pile type, as it would be billed today.
+        """
+        if tariff_id is not None:
+            version = tariff_service.version(tariff_id or None)
+            if version is None:
+                raise ValueError(f"Tariff version {tariff_id} not found.")
+            schedules = {pile_type: TariffSchedule([version]) for pile_type in models.PileType}
+        else:
+            schedules = {pile_type: tariff_service.schedule_for(pile_type) for pile_type in models.PileType}
+
+        type_code = {pile_type: code for code, pile_type in enumerate(schedules)}
+
+        writer = csv.writer(report)
+        writer.writerow(REPORT_COLUMNS)
+        summary = {"orders": 0, "changed": 0}
+        stored_totals = {"charge": 0, "service": 0, "total": 0}
+        rebilled_totals = {"charge": 0, "service": 0, "total": 0}
+        after_order_id = 0
+        while True:
+            rows = await crud.get_orders_for_rebilling(
+                db, after_order_id, self.chunk_size, start_time, end_time, pile_type
+            )
+            if not rows:
+                break
+            after_order_id = rows[-1].order_id
+            count = len(rows)
+            start_us, offset_us = _wall_clock_arrays(row.start_time for row in rows)
+            end_us, _ = _wall_clock_arrays(row.end_time for row in rows)
+            power_w = np.fromiter((kw_to_w(row.power_rate) for row in rows), np.int64, count)
+            energy_mwh = np.fromiter((kwh_to_mwh(row.actual_charge_amount) for row in rows), np.int64, count)
+            stored = {
+                "charge": np.fromiter((yuan_to_fen(row.charge_fee) for row in rows), np.int64, count),
+                "service": np.fromiter((yuan_to_fen(row.service_fee) for row in rows), np.int64, count),
+                "total": np.fromiter((yuan_to_fen(row.total_fee) for row in rows), np.int64, count),
+            }
+
+            rebilled = {key: np.zeros(count, dtype=np.int64) for key in stored}
+            type_codes = np.fromiter((type_code[row.pile_type] for row in rows), np.int64, count)
+            for code, schedule in enumerate(schedules.values()):
+                selected = np.flatnonzero(type_codes == code)
+                if not len(selected):
+                    continue
+                fees = self.bill_arrays(
+                    schedule,
+                    start_us[selected],
+                    end_us[selected],
+                    offset_us[selected],
+                    power_w[selected],
+                    energy_mwh[selected],
+                )
+                for key, fee in zip(("charge", "service", "total"), fees):
+                    rebilled[key][selected] = fee
+
+            changed = (
+                (rebilled["charge"] != stored["charge"])
+                | (rebilled["service"] != stored["service"])
+                | (rebilled["total"] != stored["total"])
+            )
+            summary["orders"] += count
+            summary["changed"] += int(changed.sum())
+            for key in stored:
+                stored_totals[key] += int(stored[key].sum())
+                rebilled_totals[key] += int(rebilled[key].sum())
+            reported = np.arange(count) if include_unchanged else np.flatnonzero(changed)
+            writer.writerows(
+                [
+                    rows[i].order_id,
+                    rows[i].pile_id,
+                    rows[i].pile_type.value,
+                    rows[i].start_time.isoformat(),
+                    rows[i].end_time.isoformat(),
+                    rows[i].actual_charge_amount,
+                    rows[i].charge_fee,
+                    fen_to_yuan(int(rebilled["charge"][i])),
+                    rows[i].service_fee,
+                    fen_to_yuan(int(rebilled["service"][i])),
+                    rows[i].total_fee,
+                    fen_to_yuan(int(rebilled["total"][i])),
+                    fen_to_yuan(int(rebilled["total"][i] - stored["total"][i])),
+                ]
+                for i in reported
+            )
+
+        for key in stored_totals:
+            summary[f"stored_{key}_fee"] = fen_to_yuan(stored_totals[key])
+            summary[f"rebilled_{key}_fee"] = fen_to_yuan(rebilled_totals[key])
+        summary["total_fee_delta"] = fen_to_yuan(rebilled_totals["total"] - stored_totals["total"])
+        return summary
+
+
+def _round_remainder(quotient: np.ndarray, remainder: np.ndarray, denominator: int) -> np.ndarray:
+    """
+    round_div of quotient * denominator + remainder, for non-negative remainders below
+    twice the denominator (which itself must be below 2**62).
+    """
+    carry, remainder = np.divmod(remainder, denominator)
+    quotient = quotient + carry
+    twice_remainder = 2 * remainder
+    round_up = (twice_remainder > denominator) | ((twice_remainder == denominator) & (quotient % 2 == 1))
+    return quotient + round_up
+
+
+def _wall_clock_arrays(timestamps: Iterable[dt.datetime]) -> Tuple[np.ndarray, np.ndarray]:
+    """wall_clock_us over timestamps, as arrays of absolute microseconds and UTC offsets."""
+    pairs = np.array([wall_clock_us(timestamp) for timestamp in timestamps], dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+# Global instance
+rebilling_service = RebillingService()
@@ -0,0 +1,43 @@
+import asyncio
+
+
+class SchedulerTrigger:
+    """
+    Wakes the scheduler loop as soon as something it cares about changes
+    (a request arrives or is modified, a session finishes, a pile changes status).
+
+    Bursts of signals are coalesced into a single scheduler run, and a long
+    safety-net interval keeps the scheduler running even if a signal is missed.
+    """
+
+    def __init__(self, safety_net_interval: float = 60.0, coalesce_window: float = 0.05):
+        self.safety_net_interval = safety_net_interval
+        self.coalesce_window = coalesce_window
+        self._event = asyncio.Event()
+
+    def notify(self):
+        """Signals the scheduler that it should run. Safe to call any number of times."""
+        self._event.set()
+
+    async def wait(self) -> bool:
+        """
+        Waits until the scheduler is signalled or the safety-net interval elapses.
+        Returns True if the wakeup was caused by a signal.
+        """
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=self.safety_net_interval)
+            signalled = True
+        except asyncio.TimeoutError:
+            signalled = False
+
+        if signalled and self.coalesce_window > 0:
+            # Give the rest of a burst of signals a moment to arrive before running.
+            await asyncio.sleep(self.coalesce_window)
+
+        # Clear before the run so that signals raised during it trigger another run.
+        self._event.clear()
+        return signalled
+
+
+# Global instance of the scheduler trigger
+scheduler_trigger = SchedulerTrigger()
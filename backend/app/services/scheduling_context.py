@@ -0,0 +1,98 @@
+import datetime as dt
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import crud, models
+from ..queue_manager import QueueEntry, queue_manager
+from ..services.clock_service import clock_service
+from ..services.fixed_point import charge_duration_us
+
+
+class PileSnapshot:
+    """
+    Scheduling view of a single pile: its ORM row plus the in-memory queue state
+    (number of occupied slots and remaining backlog in microseconds) at the start of a tick.
+    """
+
+    def __init__(self, pile: models.ChargingPile, power_w: int, queue_length: int, backlog_us: int):
+        self.pile = pile
+        self.pile_id = pile.pile_id
+        self.type = pile.type
+        self.status = pile.status
+        self.power_w = power_w
+        self.queue_length = queue_length
+        self.backlog_us = backlog_us
+
+
+class SchedulingContext:
+    """
+    Everything the scheduling strategies need for one tick, loaded with a single query.
+
+    Strategies read pile data from here instead of querying the database, and record
+    their decisions here so that later decisions in the same tick see the updated
+    queue lengths and backlogs. The decisions are written to the database and to the
+    in-memory pile queues by SchedulingService once the strategy has finished.
+    """
+
+    def __init__(self, piles: List[models.ChargingPile], now: dt.datetime, pile_queue_capacity: int):
+        self.now = now
+        self.pile_queue_capacity = pile_queue_capacity
+        self.piles: Dict[int, PileSnapshot] = {}
+        for pile in piles:
+            # Piles created after startup get their queue here
+            queue_manager.register_pile(pile.pile_id, pile.power_rate)
+            self.piles[pile.pile_id] = PileSnapshot(
+                pile,
+                queue_manager.pile_backlogs[pile.pile_id].power_w,
+                len(queue_manager.pile_queues[pile.pile_id]),
+                queue_manager.pile_wait_us(pile.pile_id, now),
+            )
+        # (request, pile, starts_charging) for every decision taken during the tick
+        self.assignments: List[Tuple[QueueEntry, PileSnapshot, bool]] = []
+
+    @classmethod
+    async def load(cls, db: AsyncSession) -> "SchedulingContext":
+        """Builds the context for a tick. This is the only query issued while planning."""
+        piles = await crud.get_all_piles(db)
+        return cls(piles, clock_service.now(), queue_manager.pile_queue_capacity)
+
+    def get_pile(self, pile_id: int) -> Optional[PileSnapshot]:
+        return self.piles.get(pile_id)
+
+    def available_piles(self, pile_type: Optional[models.PileType] = None) -> List[PileSnapshot]:
+        """Piles that are AVAILABLE and still have a free slot in their queue, optionally of one type."""
+        return [
+            snapshot
+            for snapshot in self.piles.values()
+            if snapshot.status == models.PileStatus.AVAILABLE
+            and snapshot.power_w > 0
+            and snapshot.queue_length < self.pile_queue_capacity
+            and (pile_type is None or snapshot.type == pile_type)
+        ]
+
+    def piles_with_free_slots(self, pile_type: Optional[models.PileType] = None) -> List[PileSnapshot]:
+        """Working piles (AVAILABLE or CHARGING) with at least one free queue slot, optionally of one type."""
+        return [
+            snapshot
+            for snapshot in self.piles.values()
+            if snapshot.status in (models.PileStatus.AVAILABLE, models.PileStatus.CHARGING)
+            and snapshot.power_w > 0
+            and snapshot.queue_length < self.pile_queue_capacity
+            and (pile_type is None or snapshot.type == pile_type)
+        ]
+
+    def is_any_pile_active(self) -> bool:
+        """Check if any pile is currently charging or has a waiting queue."""
+        return bool(self.assignments) or any(len(pile_queue) > 0 for pile_queue in queue_manager.pile_queues.values())
+
+    def record_assignment(self, request: QueueEntry, snapshot: PileSnapshot):
+        """Records a scheduling decision and updates the pile's projected state."""
+        starts_charging = snapshot.queue_length == 0
+        if starts_charging:
+            # The vehicle starts charging right away, so the pile is no longer available.
+            snapshot.status = models.PileStatus.CHARGING
+        if snapshot.power_w > 0:
+            snapshot.backlog_us += charge_duration_us(request.amount_wh, snapshot.power_w)
+        snapshot.queue_length += 1
+        self.assignments.append((request, snapshot, starts_charging))
@@ -1,14 +1,16 @@
-import datetime as dt
-import itertools
-import sys
-from decimal import Decimal
-from typing import Dict, List, Optional, Tuple
+from typing import List, Optional, Tuple
 
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud, models
-from ..queue_manager import queue_manager
+from ..queue_manager import QueueEntry, queue_manager
+from ..services.assignment_solver import assignment_cost, optimal_assignment
 from ..services.config_service import SchedulingStrategy, config_service
+from ..services.cost_model import charge_time_matrix, completion_time_matrix
+from ..services.fixed_point import US_PER_HOUR
+from ..services.metrics_service import metrics_service
+from ..services.scheduling_context import PileSnapshot, SchedulingContext
 
 
 class SchedulingService:
@@ -16,125 +18,89 @@ class SchedulingService:
     Handles the logic for scheduling vehicles from the waiting queue to charging piles.
     """
 
-    async def _get_charge_time_estimate_hours(
-        self, request: models.ChargingRequest, pile: models.ChargingPile
-    ) -> Decimal:
-        """Calculates the estimated charging time in hours for a request at a given pile."""
-        if pile.power_rate <= 0:
-            return Decimal(sys.maxsize)  # Avoid division by zero
-        return Decimal(request.requested_charge_amount) / Decimal(pile.power_rate)
-
-    async def _get_pile_wait_time_hours(self, pile_id: int, db: AsyncSession) -> Decimal:
-        """
-        Calculates the total expected wait time for a new vehicle at a specific pile.
-        This is the sum of the remaining charge times of all vehicles ahead of it in the pile's queue.
-        """
-        wait_time_hours = Decimal(0)
-        pile_queue = queue_manager.pile_queues.get(pile_id)
-        if not pile_queue:
-            return wait_time_hours
-
-        pile = await crud.get_pile(db, pile_id=pile_id)
-        if not pile:
-            return wait_time_hours
-
-        for i, request_in_queue in enumerate(pile_queue):
-            estimated_total_time = await self._get_charge_time_estimate_hours(request_in_queue, pile)
-
-            if i == 0 and request_in_queue.status == models.RequestStatus.CHARGING and request_in_queue.start_time:
-                # For the car currently charging, calculate remaining time.
-                time_elapsed = dt.datetime.now(dt.timezone.utc) - request_in_queue.start_time
-                elapsed_hours = Decimal(time_elapsed.total_seconds()) / Decimal(3600)
-                remaining_time = estimated_total_time - elapsed_hours
-                wait_time_hours += max(Decimal(0), remaining_time)
-            else:
-                # For cars waiting at the pile, add their full estimated charge time.
-                wait_time_hours += estimated_total_time
-
-        return wait_time_hours
+    def __init__(self):
+        # Vehicles dispatched per scheduler run
+        self.dispatch_stats = {
+            "ticks": 0,
+            "total_dispatched": 0,
+            "last_dispatched": 0,
+            "last_passes": 0,
+            "max_dispatched": 0,
+            "cap_hits": 0,
+        }
 
-    async def _find_best_pile_for_request(
-        self, request: models.ChargingRequest, available_piles: List[models.ChargingPile], db: AsyncSession
-    ) -> Tuple[Optional[models.ChargingPile], Decimal]:
+    def _build_cost_matrix(
+        self, requests: List[QueueEntry], piles: List[PileSnapshot], include_wait: bool = True
+    ) -> np.ndarray:
         """
-        Finds the best pile for a request by minimizing the total completion time.
+        Builds the requests x piles completion-time matrix (hours, float64) in one operation.
         Total Completion Time = Wait Time at Pile + Vehicle's Own Charging Time.
+        Amounts and power rates come in as fixed-point Wh / W, so Wh / W gives hours; the
+        Decimal amounts stay untouched on the requests and floats are only used to decide.
         """
-        best_pile = None
-        min_completion_time = Decimal(sys.maxsize)
-
-        for pile in available_piles:
-            wait_time = await self._get_pile_wait_time_hours(pile.pile_id, db)
-            self_charging_time = await self._get_charge_time_estimate_hours(request, pile)
-            total_completion_time = wait_time + self_charging_time
-
-            if total_completion_time < min_completion_time:
-                min_completion_time = total_completion_time
-                best_pile = pile
-
-        return best_pile, min_completion_time
+        amounts_wh = [request.amount_wh for request in requests]
+        power_w = [pile.power_w for pile in piles]
+        if not include_wait:
+            return charge_time_matrix(amounts_wh, power_w)
+        return completion_time_matrix(amounts_wh, power_w, [pile.backlog_us / US_PER_HOUR for pile in piles])
+
+    def _find_best_pile_for_request(
+        self, request: QueueEntry, available_piles: List[PileSnapshot]
+    ) -> Tuple[Optional[PileSnapshot], float]:
+        """
+        Finds the best pile for a request by minimizing the total completion time.
+        Returns the pile and the completion time in hours.
+        """
+        if not available_piles:
+            return None, float("inf")
+        completion_times = self._build_cost_matrix([request], available_piles)[0]
+        best_index = int(np.argmin(completion_times))  # first pile wins ties
+        if not np.isfinite(completion_times[best_index]):
+            return None, float("inf")
+        return available_piles[best_index], float(completion_times[best_index])
 
     async def _assign_request_to_pile(
-        self, db: AsyncSession, request: models.ChargingRequest, pile: models.ChargingPile
+        self,
+        db: AsyncSession,
+        ctx: SchedulingContext,
+        request: QueueEntry,
+        pile: PileSnapshot,
+        starts_charging: bool,
     ):
-        """Assigns a request to a pile, updating DB and in-memory queues."""
-        print(f"Assigning request {request.queue_number} to pile {pile.pile_code}")
+        """Stages the DB changes for assigning a request to a pile. Does not commit."""
+        print(f"Assigning request {request.queue_number} to pile {pile.pile.pile_code}")
 
         # Update request state
-        request.assigned_pile_id = pile.pile_id
+        values = {"assigned_pile_id": pile.pile_id}
 
         # If this is the first vehicle to be in the pile queue, it starts charging.
-        is_first_in_queue = len(queue_manager.pile_queues[pile.pile_id]) == 0
-        if is_first_in_queue:
-            request.status = models.RequestStatus.CHARGING
-            request.start_time = dt.datetime.now(dt.timezone.utc)
-            pile.status = models.PileStatus.CHARGING
-            await db.merge(pile)
+        if starts_charging:
+            values.update(status=models.RequestStatus.CHARGING, start_time=ctx.now)
+            pile.pile.status = models.PileStatus.CHARGING
 
-        await db.merge(request)
-        await db.commit()
+        await crud.update_request_fields(db, request.request_id, **values)
 
-        # Add to the pile's in-memory queue after DB commit
-        queue_manager.pile_queues[pile.pile_id].append(request)
-
-    async def _schedule_individual_shortest_completion(self, db: AsyncSession):
+    def _schedule_individual_shortest_completion(self, ctx: SchedulingContext):
         """
         Strategy: Schedule one vehicle at a time to the pile that offers the
         shortest total completion time (wait + charge).
         """
-        # Find all piles that have space in their queue
-        available_piles_map: Dict[models.PileType, List[models.ChargingPile]] = {
-            models.PileType.FAST: [],
-            models.PileType.TRICKLE: [],
-        }
-        all_piles = await crud.get_available_piles(db)
-        for pile in all_piles:
-            if len(queue_manager.pile_queues.get(pile.pile_id, [])) < queue_manager.pile_queue_capacity:
-                available_piles_map[pile.type].append(pile)
-
-        # Attempt to schedule from the FAST queue first
-        if available_piles_map[models.PileType.FAST] and queue_manager.waiting_queue_fast:
-            request_to_schedule = queue_manager.waiting_queue_fast.popleft()
-            best_pile, _ = await self._find_best_pile_for_request(
-                request_to_schedule, available_piles_map[models.PileType.FAST], db
-            )
-            if best_pile:
-                await self._assign_request_to_pile(db, request_to_schedule, best_pile)
-            else:
-                queue_manager.waiting_queue_fast.appendleft(request_to_schedule)  # Re-add if no pile found
-
-        # Attempt to schedule from the TRICKLE queue
-        if available_piles_map[models.PileType.TRICKLE] and queue_manager.waiting_queue_trickle:
-            request_to_schedule = queue_manager.waiting_queue_trickle.popleft()
-            best_pile, _ = await self._find_best_pile_for_request(
-                request_to_schedule, available_piles_map[models.PileType.TRICKLE], db
-            )
+        for pile_type, waiting_queue in [
+            (models.PileType.FAST, queue_manager.waiting_queue_fast),
+            (models.PileType.TRICKLE, queue_manager.waiting_queue_trickle),
+        ]:
+            available_piles = ctx.available_piles(pile_type)
+            if not available_piles or not waiting_queue:
+                continue
+
+            request_to_schedule = waiting_queue.popleft()
+            best_pile, _ = self._find_best_pile_for_request(request_to_schedule, available_piles)
             if best_pile:
-                await self._assign_request_to_pile(db, request_to_schedule, best_pile)
+                ctx.record_assignment(request_to_schedule, best_pile)
             else:
-                queue_manager.waiting_queue_trickle.appendleft(request_to_schedule)  # Re-add if no pile found
+                waiting_queue.appendleft(request_to_schedule)  # Re-add if no pile found
 
-    async def _schedule_batch_shortest_completion(self, db: AsyncSession):
+    def _schedule_batch_shortest_completion(self, ctx: SchedulingContext):
         """
         Strategy: For each pile type, take a batch of waiting vehicles and find
         the optimal assignment to available piles to minimize total completion time for the batch.
@@ -143,58 +109,40 @@ class SchedulingService:
             (models.PileType.FAST, queue_manager.waiting_queue_fast),
             (models.PileType.TRICKLE, queue_manager.waiting_queue_trickle),
         ]:
-            available_piles = [
-                p
-                for p in await crud.get_available_piles_by_type(db, pile_type)
-                if len(queue_manager.pile_queues.get(p.pile_id, [])) < queue_manager.pile_queue_capacity
-            ]
+            available_piles = ctx.available_piles(pile_type)
             if not available_piles or not waiting_queue:
                 continue
 
             # Take a batch of N requests for M piles (N <= M)
             num_piles = len(available_piles)
-            batch_requests = [waiting_queue[i] for i in range(min(len(waiting_queue), num_piles))]
+            batch_requests = waiting_queue.head(num_piles)
             if not batch_requests:
                 continue
 
-            best_assignment = None
-            min_total_time = Decimal(sys.maxsize)
+            cost_matrix = self._build_cost_matrix(batch_requests, available_piles)
 
-            # Generate all possible assignments of requests to piles
-            for pile_permutation in itertools.permutations(available_piles, len(batch_requests)):
-                current_total_time = Decimal(0)
-                for request, pile in zip(batch_requests, pile_permutation):
-                    wait_time = await self._get_pile_wait_time_hours(pile.pile_id, db)
-                    charge_time = await self._get_charge_time_estimate_hours(request, pile)
-                    current_total_time += wait_time + charge_time
-
-                if current_total_time < min_total_time:
-                    min_total_time = current_total_time
-                    best_assignment = list(zip(batch_requests, pile_permutation))
-
-            # Assign based on the best permutation found
-            if best_assignment:
-                for request, pile in best_assignment:
-                    await self._assign_request_to_pile(db, request, pile)
-                    waiting_queue.remove(request)  # Remove from waiting queue
+            # Find the assignment of requests to piles with the minimum total completion time
+            assignment = optimal_assignment(cost_matrix)
+            best_assignment = [
+                (request, available_piles[pile_index])
+                for request, pile_index in zip(batch_requests, assignment)
+                if pile_index is not None
+            ]
 
-    async def _is_any_pile_active(self, db: AsyncSession) -> bool:
-        """Check if any pile is currently charging or has a waiting queue."""
-        for pile_id in queue_manager.pile_queues:
-            if len(queue_manager.pile_queues[pile_id]) > 0:
-                return True
-        return False
+            for request, pile in best_assignment:
+                ctx.record_assignment(request, pile)
+                waiting_queue.remove(request)  # Remove from waiting queue
 
-    async def _schedule_batch_full_load_shortest_time(self, db: AsyncSession):
+    def _schedule_batch_full_load_shortest_time(self, ctx: SchedulingContext):
         """
         Strategy: When waiting cars == available piles, schedule them all to
         minimize total batch completion time, ignoring request charge type.
         """
         # Condition 1: No piles should be currently active (charging or with a queue)
-        if await self._is_any_pile_active(db):
+        if ctx.is_any_pile_active():
             return
 
-        all_available_piles = await crud.get_available_piles(db)
+        all_available_piles = ctx.available_piles()
         all_waiting_requests = list(queue_manager.waiting_queue_fast) + list(queue_manager.waiting_queue_trickle)
 
         # Condition 2: Number of waiting requests must equal number of available piles
@@ -203,46 +151,169 @@ class SchedulingService:
 
         print(f"Full load condition met: {len(all_waiting_requests)} vehicles, {len(all_available_piles)} piles.")
 
-        best_assignment = None
-        min_total_time = Decimal(sys.maxsize)
+        # In this strategy, wait time is 0 since we start with all empty piles,
+        # so the cost of a vehicle on a pile is just its own charging time there.
+        cost_matrix = self._build_cost_matrix(all_waiting_requests, all_available_piles, include_wait=False)
 
         # Find the optimal assignment of all vehicles to all piles
-        for pile_permutation in itertools.permutations(all_available_piles, len(all_waiting_requests)):
-            current_total_time = Decimal(0)
-            # In this strategy, wait time is 0 since we start with all empty piles
-            for request, pile in zip(all_waiting_requests, pile_permutation):
-                charge_time = await self._get_charge_time_estimate_hours(request, pile)
-                current_total_time += charge_time  # Wait time is 0 for all
-
-            if current_total_time < min_total_time:
-                min_total_time = current_total_time
-                best_assignment = list(zip(all_waiting_requests, pile_permutation))
+        assignment = optimal_assignment(cost_matrix)
+        best_assignment = [
+            (request, all_available_piles[pile_index])
+            for request, pile_index in zip(all_waiting_requests, assignment)
+            if pile_index is not None
+        ]
 
         if best_assignment:
-            print(f"Found best full load assignment with total time: {min_total_time}")
+            min_total_time = assignment_cost(cost_matrix, assignment)
+            print(f"Found best full load assignment with total time: {min_total_time:.4f}")
             for request, pile in best_assignment:
-                await self._assign_request_to_pile(db, request, pile)
+                ctx.record_assignment(request, pile)
 
             # Clear waiting queues as all have been scheduled
             queue_manager.waiting_queue_fast.clear()
             queue_manager.waiting_queue_trickle.clear()
 
-    async def schedule_next_vehicle(self, db: AsyncSession):
+    def _schedule_rolling_horizon_batch_completion(self, ctx: SchedulingContext):
         """
-        The main scheduling logic. Dispatches to the correct strategy.
+        Strategy: For each pile type, assign a batch of waiting vehicles across every free
+        queue slot of the working piles (charging piles included) in one optimization.
+
+        A vehicle placed in the k-th last of the slots filled on a pile in this run delays
+        itself and the k - 1 vehicles behind it, so its cost there is the pile's projected
+        wait (the slot ahead's free-at time) plus k times its own charging time. Minimizing
+        the sum of these costs minimizes the batch's total completion time.
         """
-        strategy = config_service.scheduling_strategy
-        if strategy == SchedulingStrategy.SHORTEST_INDIVIDUAL_COMPLETION:
-            await self._schedule_individual_shortest_completion(db)
-        elif strategy == SchedulingStrategy.SHORTEST_BATCH_COMPLETION:
-            await self._schedule_batch_shortest_completion(db)
-        elif strategy == SchedulingStrategy.BATCH_FULL_LOAD_SHORTEST_TIME:
-            await self._schedule_batch_full_load_shortest_time(db)
-        else:
-            print(f"Unknown scheduling strategy: {strategy}")
+        for pile_type, waiting_queue in [
+            (models.PileType.FAST, queue_manager.waiting_queue_fast),
+            (models.PileType.TRICKLE, queue_manager.waiting_queue_trickle),
+        ]:
+            piles = ctx.piles_with_free_slots(pile_type)
+            if not piles or not waiting_queue:
+                continue
+
+            # One column per free slot: (pile index, position counted from the last slot)
+            slot_piles = []
+            slot_positions = []
+            for pile_index, pile in enumerate(piles):
+                for position_from_end in range(1, ctx.pile_queue_capacity - pile.queue_length + 1):
+                    slot_piles.append(pile_index)
+                    slot_positions.append(position_from_end)
+            slot_piles = np.array(slot_piles)
+            slot_positions = np.array(slot_positions)
+
+            batch_requests = waiting_queue.head(len(slot_piles))
+            charge_hours = self._build_cost_matrix(batch_requests, piles, include_wait=False)
+            wait_hours = np.array([pile.backlog_us / US_PER_HOUR for pile in piles])
+            cost_matrix = wait_hours[slot_piles] + charge_hours[:, slot_piles] * slot_positions
+
+            assignment = optimal_assignment(cost_matrix)
+            best_assignment = [
+                (request, slot_index)
+                for request, slot_index in zip(batch_requests, assignment)
+                if slot_index is not None
+            ]
+            # Fill every pile's slots front to back
+            best_assignment.sort(key=lambda item: -slot_positions[item[1]])
+
+            for request, slot_index in best_assignment:
+                ctx.record_assignment(request, piles[slot_piles[slot_index]])
+                waiting_queue.remove(request)  # Remove from waiting queue
+
+    async def _apply_assignments(self, db: AsyncSession, ctx: SchedulingContext):
+        """
+        Writes the decisions recorded in the context to the database in one transaction,
+        then appends the requests to the in-memory pile queues.
+        If the commit fails the requests are put back at the front of their waiting queues.
+        """
+        if not ctx.assignments:
             return
 
-        await db.commit()
+        # The dispatched requests keep their places in the waiting area until the outcome
+        # is known, so that admissions during the commit cannot overfill it on a requeue
+        with queue_manager.waiting_area.holding(len(ctx.assignments)):
+            try:
+                with metrics_service.phase("assign"):
+                    for request, pile, starts_charging in ctx.assignments:
+                        await self._assign_request_to_pile(db, ctx, request, pile, starts_charging)
+                with metrics_service.phase("commit"):
+                    await db.commit()
+            except Exception:
+                await db.rollback()
+                for request, _, _ in reversed(ctx.assignments):
+                    queue_manager.requeue_front(request)
+                raise
+
+            # Update the in-memory entries and add them to the piles' queues after DB commit
+            for request, pile, starts_charging in ctx.assignments:
+                request.assigned_pile_id = pile.pile_id
+                if starts_charging:
+                    request.status = models.RequestStatus.CHARGING
+                    request.start_time = ctx.now
+                queue_manager.enqueue_to_pile(pile.pile_id, request)
+
+        queue_manager.record_departures(request for request, _, _ in ctx.assignments)
+
+    async def schedule_next_vehicle(self, db: AsyncSession):
+        """
+        The main scheduling logic. Loads a scheduling context, dispatches to the
+        correct strategy and commits the resulting assignments.
+        """
+        strategy = config_service.scheduling_strategy
+        # The tick plans against a snapshot of the queues and only applies it after the
+        # commit, so it holds every waiting queue and pile lock from load to apply.
+        async with queue_manager.locked(
+            [queue_manager.waiting_queue_fast, queue_manager.waiting_queue_trickle], list(queue_manager.pile_queues)
+        ):
+            with metrics_service.phase("load"):
+                ctx = await SchedulingContext.load(db)
+
+            with metrics_service.phase("solve"):
+                passes = self._run_strategy(ctx, strategy)
+            if passes is None:
+                print(f"Unknown scheduling strategy: {strategy}")
+                return
+
+            await self._apply_assignments(db, ctx)
+        self._record_dispatch_stats(len(ctx.assignments), passes)
+        metrics_service.record_vehicles(len(ctx.assignments))
+
+    def _run_strategy(self, ctx: SchedulingContext, strategy: SchedulingStrategy) -> Optional[int]:
+        """
+        Runs the strategy once, or, in drain-until-saturated mode, repeatedly until a pass
+        dispatches nothing or the per-tick cap is reached. Every pass sees the backlogs and
+        free slots updated by the decisions of the previous ones through the context.
+        Returns the number of passes, or None for an unknown strategy.
+        """
+        strategies = {
+            SchedulingStrategy.SHORTEST_INDIVIDUAL_COMPLETION: self._schedule_individual_shortest_completion,
+            SchedulingStrategy.SHORTEST_BATCH_COMPLETION: self._schedule_batch_shortest_completion,
+            SchedulingStrategy.BATCH_FULL_LOAD_SHORTEST_TIME: self._schedule_batch_full_load_shortest_time,
+            SchedulingStrategy.ROLLING_HORIZON_BATCH_COMPLETION: self._schedule_rolling_horizon_batch_completion,
+        }
+        run_pass = strategies.get(strategy)
+        if run_pass is None:
+            return None
+
+        passes = 0
+        while True:
+            dispatched_before = len(ctx.assignments)
+            run_pass(ctx)
+            passes += 1
+            if not config_service.drain_until_saturated or len(ctx.assignments) == dispatched_before:
+                break
+            if len(ctx.assignments) >= config_service.max_dispatch_per_tick:
+                self.dispatch_stats["cap_hits"] += 1
+                print(f"Scheduler dispatch cap of {config_service.max_dispatch_per_tick} reached for this tick.")
+                break
+        return passes
+
+    def _record_dispatch_stats(self, dispatched: int, passes: int):
+        stats = self.dispatch_stats
+        stats["ticks"] += 1
+        stats["total_dispatched"] += dispatched
+        stats["last_dispatched"] = dispatched
+        stats["last_passes"] = passes
+        stats["max_dispatched"] = max(stats["max_dispatched"], dispatched)
 
 
 # Global instance of the scheduling service
@@ -0,0 +1,137 @@
+import datetime as dt
+from decimal import Decimal
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import crud, models, schemas
+from .fixed_point import datetime_to_us, yuan_to_fen
+from .tariff_table import CompiledTariffVersion, TariffSchedule, minute_rates
+
+_EPOCH_DATE = dt.date(1970, 1, 1)
+
+
+class TariffService:
+    """
+    Versioned, effective-dated time-of-use tariffs for billing.
+
+    The versions and holidays stored in the database are compiled into one
+    TariffSchedule per pile type when loaded, and billing only ever reads the compiled
+    schedules. Reloading builds the new schedules aside and swaps them in with a single
+    assignment, so a bill is computed entirely against either the old or the new
+    tables. Versions are immutable, so compiled versions are reused across reloads until
+    the holiday calendar changes.
+
+    The built-in tariff (BillingService.TOU_TARIFFS) applies before the first stored
+    version, and on its own while there is none.
+    """
+
+    def __init__(self):
+        self.builtin: Optional[CompiledTariffVersion] = None
+        self._schedules: Dict[Optional[models.PileType], TariffSchedule] = {}
+        self._compiled: Dict[Tuple[int, Tuple[int, ...]], CompiledTariffVersion] = {}
+
+    def set_builtin(self, periods: Iterable[Mapping], default_rate: Decimal, service_fee_per_kwh: Decimal):
+        default_fen = yuan_to_fen(default_rate)
+        rates = [default_fen if rate is None else rate for rate in minute_rates(periods)]
+        self.builtin = CompiledTariffVersion(None, None, rates, rates, rates, (), yuan_to_fen(service_fee_per_kwh))
+        self._schedules = {None: TariffSchedule([self.builtin])}
+
+    def schedule_for(self, pile_type: Optional[models.PileType] = None) -> TariffSchedule:
+        """Compiled schedule for a pile type; no database access."""
+        return self._schedules.get(pile_type) or self._schedules[None]
+
+    def version(self, tariff_id: Optional[int]) -> Optional[CompiledTariffVersion]:
+        """A loaded tariff version by id, or the built-in tariff for None."""
+        if tariff_id is None:
+            return self.builtin
+        return next((version for version in self._compiled.values() if version.tariff_id == tariff_id), None)
+
+    async def load(self, db: AsyncSession):
+        """(Re)loads the tariff versions and holidays from the database and swaps them in."""
+        self.install(await crud.get_tariff_versions(db), await crud.get_tariff_holidays(db))
+
+    def install(self, versions: Sequence[models.TariffVersion], holidays: Sequence[models.TariffHoliday]):
+        """Compiles tariff versions and holidays and swaps them in."""
+        self._schedules = self.compile(versions, holidays)
+
+    def compile(
+        self, versions: Sequence[models.TariffVersion], holidays: Sequence[models.TariffHoliday]
+    ) -> Dict[Optional[models.PileType], TariffSchedule]:
+        holiday_days = tuple(sorted((holiday.holiday_date - _EPOCH_DATE).days for holiday in holidays))
+        compiled = {}
+        for version in versions:
+            cached = self._compiled.get((version.tariff_id, holiday_days))
+            compiled[version.tariff_id] = cached or self._compile_version(version, holiday_days)
+        self._compiled = {(tariff_id, holiday_days): version for tariff_id, version in compiled.items()}
+
+        schedules = {}
+        for pile_type in (None, *models.PileType):
+            # Versions for every pile type apply too; at the same effective time the
+            # type-specific one wins, and otherwise the one created last
+            in_effect: Dict[dt.datetime, models.TariffVersion] = {}
+            for version in sorted(versions, key=lambda v: (v.pile_type is not None, v.tariff_id)):
+                if version.pile_type is None or version.pile_type == pile_type:
+                    in_effect[_aware(version.effective_from)] = version
+            schedules[pile_type] = TariffSchedule(
+                [self.builtin, *(compiled[version.tariff_id] for version in in_effect.values())]
+            )
+        return schedules
+
+    def _compile_version(self, version: models.TariffVersion, holiday_days: Tuple[int, ...]) -> CompiledTariffVersion:
+        weekday, weekend, holiday = self._day_rates(version.periods)
+        return CompiledTariffVersion(
+            version.tariff_id,
+            datetime_to_us(_aware(version.effective_from)),
+            weekday,
+            weekend,
+            holiday,
+            holiday_days,
+            yuan_to_fen(version.service_fee_per_kwh),
+        )
+
+    def _day_rates(self, periods: Iterable) -> Tuple[List[int], List[int], List[int]]:
+        """
+        Per-minute rates for weekdays, weekends and holidays. WEEKEND periods fall back to
+        the weekday rates where they leave gaps, HOLIDAY periods to the weekend rates.
+        """
+        by_kind = {kind: [] for kind in models.TariffDayKind}
+        for period in periods:
+            if not 0 <= period.start_minute < period.end_minute <= 24 * 60:
+                raise ValueError(f"Invalid tariff period {period.start_minute}-{period.end_minute}.")
+            by_kind[period.day_kind].append(
+                {
+                    "start_hour": 0,
+                    "start_minute": period.start_minute,
+                    "end_hour": 0,
+                    "end_minute": period.end_minute,
+                    "rate": period.rate,
+                }
+            )
+        weekday = minute_rates(by_kind[models.TariffDayKind.WEEKDAY])
+        if None in weekday:
+            raise ValueError("WEEKDAY tariff periods must cover the whole day.")
+        weekend = _fill_gaps(minute_rates(by_kind[models.TariffDayKind.WEEKEND]), weekday)
+        holiday = _fill_gaps(minute_rates(by_kind[models.TariffDayKind.HOLIDAY]), weekend)
+        return weekday, weekend, holiday
+
+    def validate(self, version: schemas.TariffVersionCreate):
+        """Raises ValueError if a new version cannot be compiled."""
+        if version.effective_from.tzinfo is None:
+            raise ValueError("effective_from must include a timezone.")
+        if version.service_fee_per_kwh < 0 or any(period.rate < 0 for period in version.periods):
+            raise ValueError("Rates and the service fee cannot be negative.")
+        self._day_rates(version.periods)
+
+
+def _fill_gaps(rates: List[Optional[int]], fallback: List[int]) -> List[int]:
+    return [rate if rate is not None else base for rate, base in zip(rates, fallback)]
+
+
+def _aware(timestamp: dt.datetime) -> dt.datetime:
+    # SQLite returns naive timestamps; they are stored in UTC
+    return timestamp if timestamp.tzinfo is not None else timestamp.replace(tzinfo=dt.timezone.utc)
+
+
+# Global instance
+tariff_service = TariffService()
@@ -0,0 +1,253 @@
+"""
+Compiled time-of-use tariff tables for the billing engine.
+
+A tariff is compiled into a per-minute rate table (whole fen per kWh) over its cycle
+(a day, or a week for weekday/weekend tariffs) plus its cumulative sums, so that the
+rate-time integral of any interval takes O(1): whole cycles are multiplied out and
+the two partial cycles are looked up. All arithmetic is on integers, so results are
+exact and independent of how an interval is split. Every integral also has a NumPy
+form over arrays of intervals (int64 microseconds) for bulk re-billing.
+
+Wall-clock times are microseconds since the Unix epoch on the session's wall clock;
+effective times of tariff versions are absolute (UTC) microseconds.
+"""
+
+import bisect
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .fixed_point import US_PER_SECOND, yuan_to_fen
+
+MINUTES_PER_DAY = 24 * 60
+US_PER_MINUTE = 60 * US_PER_SECOND
+US_PER_DAY = MINUTES_PER_DAY * US_PER_MINUTE
+# 1970-01-01, day 0 of the wall clocks, was a Thursday
+EPOCH_WEEKDAY = 3
+
+
+def minute_rates(periods: Iterable[Mapping]) -> List[Optional[int]]:
+    """
+    Per-minute rates in fen per kWh from periods given as dicts with start_hour, end_hour
+    (exclusive) and rate in Yuan per kWh, plus optional start_minute / end_minute. The
+    first period covering a minute sets its rate; minutes no period covers are None.
+    """
+    rates: List[Optional[int]] = [None] * MINUTES_PER_DAY
+    for period in periods:
+        start = period["start_hour"] * 60 + period.get("start_minute", 0)
+        end = period["end_hour"] * 60 + period.get("end_minute", 0)
+        rate_fen = yuan_to_fen(period["rate"])
+        for minute in range(max(start, 0), min(end, MINUTES_PER_DAY)):
+            if rates[minute] is None:
+                rates[minute] = rate_fen
+    return rates
+
+
+class CompiledTariff:
+    """
+    A cyclic tariff (a whole number of days long, starting on day 0 of the wall clock)
+    as a per-minute rate table with cumulative sums. Rate-time units are
+    microseconds * fen/kWh.
+    """
+
+    __slots__ = ("rate_fen_by_minute", "cycle_us", "cycle_units", "_cumulative", "_rate_array", "_cumulative_array")
+
+    def __init__(self, rate_fen_by_minute: Sequence[int]):
+        if not rate_fen_by_minute or len(rate_fen_by_minute) % MINUTES_PER_DAY:
+            raise ValueError(f"A tariff needs one rate per minute of each day ({MINUTES_PER_DAY} per day).")
+        self.rate_fen_by_minute = tuple(rate_fen_by_minute)
+        self.cycle_us = len(self.rate_fen_by_minute) * US_PER_MINUTE
+        # _cumulative[m]: units from the start of the cycle to the start of minute m
+        cumulative = [0] * (len(self.rate_fen_by_minute) + 1)
+        for minute, rate in enumerate(self.rate_fen_by_minute):
+            cumulative[minute + 1] = cumulative[minute] + rate * US_PER_MINUTE
+        self._cumulative = cumulative
+        self.cycle_units = cumulative[-1]
+        self._rate_array = np.array(self.rate_fen_by_minute, dtype=np.int64)
+        self._cumulative_array = np.array(cumulative, dtype=np.int64)
+
+    @classmethod
+    def from_periods(cls, periods: Iterable[Mapping], default_rate: Decimal) -> "CompiledTariff":
+        """Compiles a daily tariff from periods (see minute_rates); uncovered minutes get `default_rate`."""
+        default_fen = yuan_to_fen(default_rate)
+        return cls([default_fen if rate is None else rate for rate in minute_rates(periods)])
+
+    def rate_fen_at(self, time_us: int) -> int:
+        """Rate in fen per kWh in effect at a wall-clock time."""
+        return self.rate_fen_by_minute[(time_us % self.cycle_us) // US_PER_MINUTE]
+
+    def units_until(self, time_us: int) -> int:
+        """Rate-time integral from the wall clock's epoch up to `time_us`."""
+        cycles, into_cycle = divmod(time_us, self.cycle_us)
+        minute, into_minute = divmod(into_cycle, US_PER_MINUTE)
+        return cycles * self.cycle_units + self._cumulative[minute] + into_minute * self.rate_fen_by_minute[minute]
+
+    def rate_time_units(self, start_us: int, end_us: int) -> int:
+        """Rate-time integral over [start_us, end_us), 0 for an empty interval."""
+        if end_us <= start_us:
+            return 0
+        return self.units_until(end_us) - self.units_until(start_us)
+
+    def rate_time_units_array(self, start_us: np.ndarray, end_us: np.ndarray) -> np.ndarray:
+        """rate_time_units over arrays of intervals."""
+        start_cycles, start_into = np.divmod(start_us, self.cycle_us)
+        end_cycles, end_into = np.divmod(end_us, self.cycle_us)
+        # Whole cycles are counted between the two ends, so absolute times never overflow int64
+        units = (end_cycles - start_cycles) * self.cycle_units
+        units += self._into_cycle(end_into) - self._into_cycle(start_into)
+        return np.where(end_us > start_us, units, 0)
+
+    def _into_cycle(self, into_cycle_us: np.ndarray) -> np.ndarray:
+        minute, into_minute = np.divmod(into_cycle_us, US_PER_MINUTE)
+        return self._cumulative_array[minute] + into_minute * self._rate_array[minute]
+
+
+class CompiledTariffVersion:
+    """
+    One tariff version compiled for billing: a weekly table (weekday and weekend
+    rates), a daily table for holidays and the holiday dates as wall-clock day numbers,
+    plus the service fee. The holidays in an interval are found by bisection, so a
+    session costs O(log H) plus the holidays it spans.
+    """
+
+    __slots__ = (
+        "tariff_id",
+        "effective_from_us",
+        "week",
+        "holiday",
+        "holidays",
+        "service_fee_fen_per_kwh",
+        "_holiday_array",
+    )
+
+    def __init__(
+        self,
+        tariff_id: Optional[int],
+        effective_from_us: Optional[int],
+        weekday: Sequence[int],
+        weekend: Sequence[int],
+        holiday: Sequence[int],
+        holidays: Iterable[int],
+        service_fee_fen_per_kwh: int,
+    ):
+        self.tariff_id = tariff_id
+        # None: in effect since the beginning of time (the built-in tariff)
+        self.effective_from_us = effective_from_us
+        days = [weekend if (EPOCH_WEEKDAY + day) % 7 >= 5 else weekday for day in range(7)]
+        self.week = CompiledTariff([rate for day in days for rate in day])
+        self.holiday = CompiledTariff(holiday)
+        self.holidays = sorted(set(holidays))
+        self._holiday_array = np.array(self.holidays, dtype=np.int64)
+        self.service_fee_fen_per_kwh = service_fee_fen_per_kwh
+
+    def rate_fen_at(self, time_us: int) -> int:
+        """Rate in fen per kWh in effect at a wall-clock time."""
+        day = time_us // US_PER_DAY
+        index = bisect.bisect_left(self.holidays, day)
+        is_holiday = index < len(self.holidays) and self.holidays[index] == day
+        return (self.holiday if is_holiday else self.week).rate_fen_at(time_us)
+
+    def rate_time_units(self, start_us: int, end_us: int) -> int:
+        """Rate-time integral over the wall-clock interval [start_us, end_us)."""
+        units = self.week.rate_time_units(start_us, end_us)
+        if end_us <= start_us or not self.holidays:
+            return units
+        first = bisect.bisect_left(self.holidays, start_us // US_PER_DAY)
+        last = bisect.bisect_right(self.holidays, (end_us - 1) // US_PER_DAY)
+        for day in self.holidays[first:last]:
+            # A holiday's own rates replace the ones of its weekday
+            overlap_start = max(start_us, day * US_PER_DAY)
+            overlap_end = min(end_us, (day + 1) * US_PER_DAY)
+            units += self.holiday.rate_time_units(overlap_start, overlap_end)
+            units -= self.week.rate_time_units(overlap_start, overlap_end)
+        return units
+
+    def rate_time_units_array(self, start_us: np.ndarray, end_us: np.ndarray) -> np.ndarray:
+        """
+        rate_time_units over arrays of wall-clock intervals. Holiday corrections cost one
+        vectorized pass per holiday within the span of the whole array.
+        """
+        units = self.week.rate_time_units_array(start_us, end_us)
+        if not len(units) or not self.holidays:
+            return units
+        first_day = start_us.min() // US_PER_DAY
+        last_day = (end_us.max() - 1) // US_PER_DAY
+        first = np.searchsorted(self._holiday_array, first_day, side="left")
+        last = np.searchsorted(self._holiday_array, last_day, side="right")
+        for day in self._holiday_array[first:last]:
+            overlap_start = np.maximum(start_us, day * US_PER_DAY)
+            overlap_end = np.minimum(end_us, (day + 1) * US_PER_DAY)
+            rows = np.flatnonzero(overlap_end > overlap_start)
+            if not len(rows):
+                continue
+            overlap_start, overlap_end = overlap_start[rows], overlap_end[rows]
+            units[rows] += self.holiday.rate_time_units_array(overlap_start, overlap_end)
+            units[rows] -= self.week.rate_time_units_array(overlap_start, overlap_end)
+        return units
+
+
+class TariffSchedule:
+    """The tariff versions that apply to one pile type, in effective order."""
+
+    def __init__(self, versions: Sequence[CompiledTariffVersion]):
+        if not versions:
+            raise ValueError("A tariff schedule needs at least one version.")
+        self.versions = sorted(versions, key=lambda version: _effective_key(version.effective_from_us))
+        self._starts = [_effective_key(version.effective_from_us) for version in self.versions]
+        # Times at which each version after the first takes over, and every version's service fee
+        self._change_array = np.array(self._starts[1:], dtype=np.int64)
+        self._fee_array = np.array([version.service_fee_fen_per_kwh for version in self.versions], dtype=np.int64)
+
+    def version_at(self, time_us: int) -> CompiledTariffVersion:
+        """Version in effect at an absolute time (the earliest one before all of them)."""
+        return self.versions[max(bisect.bisect_right(self._starts, time_us) - 1, 0)]
+
+    def segments(self, start_us: int, end_us: int) -> Iterator[Tuple[CompiledTariffVersion, int, int]]:
+        """
+        Splits the absolute interval [start_us, end_us) at version changes, yielding
+        (version, segment start, segment end). An empty interval yields the version in
+        effect at its start once.
+        """
+        index = max(bisect.bisect_right(self._starts, start_us) - 1, 0)
+        segment_start = start_us
+        while True:
+            next_start = self._starts[index + 1] if index + 1 < len(self.versions) else None
+            segment_end = end_us if next_start is None else min(end_us, next_start)
+            yield self.versions[index], segment_start, max(segment_end, segment_start)
+            if segment_end >= end_us:
+                return
+            segment_start = segment_end
+            index += 1
+
+    def service_fee_at_array(self, time_us: np.ndarray) -> np.ndarray:
+        """Service fee in fen per kWh of the version in effect at each absolute time."""
+        return self._fee_array[np.searchsorted(self._change_array, time_us, side="right")]
+
+    def integrate_array(
+        self, start_us: np.ndarray, end_us: np.ndarray, offset_us: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        segments() over arrays of absolute intervals, each on its own wall clock (UTC
+        offsets in `offset_us`). Returns the rate-time units and the service-fee-time
+        units (microseconds * fen/kWh) of every interval, one vectorized pass per version.
+        """
+        rate_units = np.zeros(len(start_us), dtype=np.int64)
+        fee_units = np.zeros(len(start_us), dtype=np.int64)
+        for index, version in enumerate(self.versions):
+            segment_start, segment_end = start_us, end_us
+            if index > 0:
+                segment_start = np.maximum(start_us, self._starts[index])
+            if index + 1 < len(self.versions):
+                segment_end = np.minimum(end_us, self._starts[index + 1])
+            rows = np.flatnonzero(segment_end > segment_start)
+            if not len(rows):
+                continue
+            segment_start, segment_end, offset = segment_start[rows], segment_end[rows], offset_us[rows]
+            rate_units[rows] += version.rate_time_units_array(segment_start + offset, segment_end + offset)
+            fee_units[rows] += (segment_end - segment_start) * version.service_fee_fen_per_kwh
+        return rate_units, fee_units
+
+
+def _effective_key(effective_from_us: Optional[int]) -> float:
+    return float("-inf") if effective_from_us is None else effective_from_us
@@ -0,0 +1,631 @@
+"""
+Offline micro-benchmarks for the scheduling and billing engines.
+
+Usage:
+    uv run python benchmark.py [assignment] [full_load] [tick] [billing] [tariff] [rebilling]
+        [waiting_area]
+    uv run --group sim python benchmark.py admission
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import time
+
+from app.services.assignment_solver import (
+    assignment_cost,
+    brute_force_assignment,
+    optimal_assignment,
+    solve_assignment,
+)
+
+
+def _time_call(func, *args, repeat: int = 3) -> float:
+    """Returns the best wall-clock time of `repeat` calls, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def _random_completion_matrix(n_requests: int, n_piles: int, rng: random.Random, with_wait: bool = True):
+    """Builds a requests x piles completion-time matrix like the batch scheduler does."""
+    amounts = [rng.uniform(5, 60) for _ in range(n_requests)]
+    power_rates = [rng.choice([7.0, 30.0]) for _ in range(n_piles)]
+    wait_times = [rng.uniform(0, 3) if with_wait else 0.0 for _ in range(n_piles)]
+    return [[wait + amount / power for power, wait in zip(power_rates, wait_times)] for amount in amounts]
+
+
+def bench_assignment():
+    print("== Assignment solver: Hungarian vs brute-force permutations ==")
+    rng = random.Random(42)
+
+    print(f"{'requests':>8} {'piles':>6} {'brute (ms)':>12} {'hungarian (ms)':>15} {'same optimum':>13}")
+    for n_requests, n_piles in [(2, 4), (3, 6), (4, 8), (6, 6), (6, 8), (6, 9)]:
+        cost = _random_completion_matrix(n_requests, n_piles, rng)
+        brute_ms = _time_call(brute_force_assignment, cost, repeat=1)
+        hungarian_ms = _time_call(solve_assignment, cost)
+        same = abs(assignment_cost(cost, brute_force_assignment(cost)) - assignment_cost(cost, solve_assignment(cost)))
+        print(f"{n_requests:>8} {n_piles:>6} {brute_ms:>12.2f} {hungarian_ms:>15.3f} {str(same < 1e-9):>13}")
+
+    print(f"{'requests':>8} {'piles':>6} {'hungarian (ms)':>15}")
+    for n_requests, n_piles in [(6, 100), (6, 500), (50, 200), (100, 300)]:
+        cost = _random_completion_matrix(n_requests, n_piles, rng)
+        print(f"{n_requests:>8} {n_piles:>6} {_time_call(solve_assignment, cost):>15.2f}")
+
+
+def bench_full_load():
+    print("== Full-load assignment over mixed FAST/TRICKLE piles ==")
+    rng = random.Random(7)
+
+    print(f"{'vehicles':>8} {'brute (ms)':>12} {'hungarian (ms)':>15} {'same optimum':>13}")
+    for size in range(2, 9):
+        # Wait time is zero in this strategy, the cost is the charging time only
+        cost = _random_completion_matrix(size, size, rng, with_wait=False)
+        brute_ms = _time_call(brute_force_assignment, cost, repeat=1)
+        hungarian_ms = _time_call(optimal_assignment, cost, 0)
+        brute_cost = assignment_cost(cost, brute_force_assignment(cost))
+        same = abs(brute_cost - assignment_cost(cost, optimal_assignment(cost, 0)))
+        print(f"{size:>8} {brute_ms:>12.2f} {hungarian_ms:>15.3f} {str(same < 1e-9):>13}")
+
+    print(f"{'vehicles':>8} {'hungarian (ms)':>15}")
+    for size in (20, 50, 100):
+        cost = _random_completion_matrix(size, size, rng, with_wait=False)
+        print(f"{size:>8} {_time_call(optimal_assignment, cost, 0):>15.2f}")
+
+
+def bench_tick():
+    print("== Scheduler tick CPU time (planning only, no database) ==")
+    import datetime as dt
+    from decimal import Decimal
+
+    from app import models
+    from app.queue_manager import QueueEntry, queue_manager
+    from app.services.config_service import SchedulingStrategy
+    from app.services.scheduling_context import SchedulingContext
+    from app.services.scheduling_service import scheduling_service
+
+    rng = random.Random(3)
+    now = dt.datetime.now(dt.timezone.utc)
+
+    def make_piles(n_piles):
+        return [
+            models.ChargingPile(
+                pile_id=i + 1,
+                pile_code=f"P{i + 1}",
+                type=models.PileType.FAST if i % 2 == 0 else models.PileType.TRICKLE,
+                status=models.PileStatus.AVAILABLE,
+                power_rate=Decimal(30) if i % 2 == 0 else Decimal(7),
+            )
+            for i in range(n_piles)
+        ]
+
+    def make_requests(n_requests):
+        return [
+            QueueEntry(
+                request_id=i + 1,
+                user_id=1,
+                queue_number=f"R{i + 1}",
+                requested_charge_type=models.RequestType.FAST if i % 2 == 0 else models.RequestType.TRICKLE,
+                requested_charge_amount=Decimal(rng.randint(5, 60)),
+                status=models.RequestStatus.WAITING,
+            )
+            for i in range(n_requests)
+        ]
+
+    def plan_tick(piles, requests, strategy):
+        queue_manager.reset_piles(piles)
+        queue_manager.waiting_queue_fast.clear()
+        queue_manager.waiting_queue_trickle.clear()
+        for request in requests:
+            queue_manager.waiting_queue_for(request.requested_charge_type).append(request)
+        ctx = SchedulingContext(piles, now, queue_manager.pile_queue_capacity)
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduling_service._run_strategy(ctx, strategy)
+        return ctx
+
+    print(f"{'piles':>6} {'waiting':>8} {'strategy':<32} {'tick (ms)':>10} {'dispatched':>11}")
+    for n_piles in (10, 100, 1000):
+        piles = make_piles(n_piles)
+        for strategy in SchedulingStrategy:
+            # The full-load strategy only runs when every pile can take a waiting vehicle
+            n_waiting = n_piles if strategy == SchedulingStrategy.BATCH_FULL_LOAD_SHORTEST_TIME else 6
+            if n_waiting > 300:
+                continue
+            requests = make_requests(n_waiting)
+            tick_ms = _time_call(plan_tick, piles, requests, strategy)
+            dispatched = len(plan_tick(piles, requests, strategy).assignments)
+            print(f"{n_piles:>6} {n_waiting:>8} {strategy.value:<32} {tick_ms:>10.2f} {dispatched:>11}")
+
+    queue_manager.reset_piles([])
+    queue_manager.waiting_queue_fast.clear()
+    queue_manager.waiting_queue_trickle.clear()
+
+
+def _reference_decimal_bill(start_time, end_time, power_rate_kw, actual_charge_amount, tariffs, service_fee_per_kwh):
+    """The original Decimal implementation of a bill, kept as the reference for the fixed-point engine."""
+    import datetime as dt
+    from decimal import Decimal
+
+    def rate_for(timestamp):
+        for tariff in tariffs:
+            if tariff["start_hour"] <= timestamp.hour < tariff["end_hour"]:
+                return tariff["rate"]
+        return Decimal("0.7")
+
+    charge_fee = Decimal(0)
+    energy_per_second = power_rate_kw / Decimal(3600)
+    current_time = start_time
+    while current_time < end_time:
+        rate = rate_for(current_time)
+        next_hour = (current_time + dt.timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+        boundary_time = min(end_time, next_hour)
+        duration_in_block = (boundary_time - current_time).total_seconds()
+        if duration_in_block > 0:
+            charge_fee += Decimal(duration_in_block) * energy_per_second * rate
+        current_time = boundary_time
+
+    service_fee = actual_charge_amount * service_fee_per_kwh
+    return {
+        "actual_charge_amount": round(actual_charge_amount, 2),
+        "charge_fee": round(charge_fee, 2),
+        "service_fee": round(service_fee, 2),
+        "total_fee": round(charge_fee + service_fee, 2),
+    }
+
+
+def bench_billing():
+    print("== Billing: fixed-point integer engine vs the original Decimal engine ==")
+    import datetime as dt
+    from decimal import Decimal
+
+    from app.services.billing_service import billing_service
+    from app.services.fixed_point import energy_mwh_for_duration, kw_to_w, mwh_to_kwh, timedelta_to_us
+
+    rng = random.Random(11)
+    base = dt.datetime(2025, 6, 1, tzinfo=dt.timezone.utc)
+    sessions = []
+    for _ in range(20000):
+        start_time = base + dt.timedelta(seconds=rng.randint(0, 30 * 86400), microseconds=rng.randint(0, 999999))
+        end_time = start_time + dt.timedelta(seconds=rng.randint(1, 12 * 3600), microseconds=rng.randint(0, 999999))
+        power_rate = Decimal(rng.choice(["30.00", "7.00", "22.50", "60.00"]))
+        duration_us = timedelta_to_us(end_time - start_time)
+        # Half the sessions stop early (arbitrary energy), half complete their requested amount
+        if rng.random() < 0.5:
+            actual = mwh_to_kwh(energy_mwh_for_duration(duration_us, kw_to_w(power_rate)))
+        else:
+            actual = Decimal(rng.randint(100, 9000)).scaleb(-2)
+        sessions.append((start_time, end_time, power_rate, actual))
+
+    def run_reference():
+        return [
+            _reference_decimal_bill(*session, billing_service.TOU_TARIFFS, billing_service.SERVICE_FEE_PER_KWH)
+            for session in sessions
+        ]
+
+    def run_fixed_point():
+        return [billing_service.calculate_bill(*session) for session in sessions]
+
+    mismatches = [
+        (session, reference, fixed)
+        for session, reference, fixed in zip(sessions, run_reference(), run_fixed_point())
+        if reference != fixed
+    ]
+    print(f"sessions: {len(sessions)}, identical rounded bills: {len(sessions) - len(mismatches)}")
+    for session, reference, fixed in mismatches[:5]:
+        print(f"  mismatch {session}: decimal={reference} fixed={fixed}")
+
+    reference_ms = _time_call(run_reference, repeat=1)
+    fixed_ms = _time_call(run_fixed_point, repeat=1)
+    print(f"decimal engine:     {reference_ms / len(sessions) * 1000:8.2f} us/bill")
+    print(f"fixed-point engine: {fixed_ms / len(sessions) * 1000:8.2f} us/bill")
+
+    amounts = [Decimal(rng.randint(100, 9000)).scaleb(-2) for _ in range(100000)]
+    decimal_ms = _time_call(lambda: [amount / Decimal("7.00") for amount in amounts], repeat=1)
+    from app.services.fixed_point import charge_duration_us, kwh_to_wh
+
+    integer_wh = [kwh_to_wh(amount) for amount in amounts]
+    integer_ms = _time_call(lambda: [charge_duration_us(wh, 7000) for wh in integer_wh], repeat=1)
+    print(f"charge duration, Decimal kWh / kW: {decimal_ms / len(amounts) * 1e6:8.1f} ns/op")
+    print(f"charge duration, integer Wh / W:   {integer_ms / len(amounts) * 1e6:8.1f} ns/op")
+
+
+def _reference_hourly_units(start_us: int, end_us: int, rate_fen_by_hour) -> int:
+    """The original hour-by-hour walk of the fixed-point engine, kept as the reference for the compiled tariff."""
+    from app.services.fixed_point import US_PER_HOUR
+
+    units = 0
+    current_us = start_us
+    while current_us < end_us:
+        hour_index = current_us // US_PER_HOUR
+        boundary_us = min(end_us, (hour_index + 1) * US_PER_HOUR)
+        units += (boundary_us - current_us) * rate_fen_by_hour[hour_index % 24]
+        current_us = boundary_us
+    return units
+
+
+def bench_tariff():
+    print("== Tariff: compiled per-minute prefix sums vs the hour-by-hour walk ==")
+    import datetime as dt
+
+    from app.services.billing_service import billing_service
+    from app.services.fixed_point import US_PER_HOUR, datetime_to_us, timedelta_to_us
+    from app.services.tariff_service import tariff_service
+    from app.services.tariff_table import (
+        MINUTES_PER_DAY,
+        US_PER_DAY,
+        US_PER_MINUTE,
+        CompiledTariff,
+        CompiledTariffVersion,
+        TariffSchedule,
+    )
+
+    rng = random.Random(23)
+
+    def random_interval():
+        start_us = rng.randint(0, 60 * US_PER_DAY)
+        length_us = rng.choice(
+            [rng.randint(0, US_PER_MINUTE), rng.randint(0, US_PER_DAY), rng.randint(0, 40 * US_PER_DAY)]
+        )
+        return start_us, start_us + length_us
+
+    # Property 1: on hour-aligned tariffs the compiled table agrees exactly with the hourly walk
+    mismatches = 0
+    for _ in range(200):
+        rate_fen_by_hour = [rng.randint(0, 300) for _ in range(24)]
+        tariff = CompiledTariff([rate_fen_by_hour[minute // 60] for minute in range(MINUTES_PER_DAY)])
+        for _ in range(50):
+            start_us, end_us = random_interval()
+            if tariff.rate_time_units(start_us, end_us) != _reference_hourly_units(start_us, end_us, rate_fen_by_hour):
+                mismatches += 1
+    print(f"hour-aligned random tariffs, 10000 intervals: {mismatches} mismatches against the hourly walk")
+
+    # Property 2: on minute-level tariffs the integral is additive over any split point
+    mismatches = 0
+    for _ in range(200):
+        tariff = CompiledTariff([rng.randint(0, 300) for _ in range(MINUTES_PER_DAY)])
+        for _ in range(50):
+            start_us, end_us = random_interval()
+            split_us = rng.randint(start_us, end_us)
+            if tariff.rate_time_units(start_us, end_us) != (
+                tariff.rate_time_units(start_us, split_us) + tariff.rate_time_units(split_us, end_us)
+            ):
+                mismatches += 1
+    print(f"minute-level random tariffs, 10000 split intervals: {mismatches} additivity violations")
+
+    # Property 3: the billing service's fee numerators match the hourly walk on its own tariff,
+    # for sessions on any wall clock
+    rate_fen_by_hour = [tariff_service.builtin.week.rate_fen_at(hour * US_PER_HOUR) for hour in range(24)]
+    base = dt.datetime(2025, 6, 1, tzinfo=dt.timezone.utc)
+    mismatches = 0
+    for _ in range(10000):
+        zone = dt.timezone(dt.timedelta(minutes=rng.choice([0, 60, 330, 480, -300, -570])))
+        start_time = (base + dt.timedelta(microseconds=rng.randint(0, 30 * US_PER_DAY))).astimezone(zone)
+        end_time = start_time + dt.timedelta(microseconds=rng.randint(0, 3 * US_PER_DAY))
+        power_w = rng.choice([7000, 22500, 30000, 60000])
+        offset_us = timedelta_to_us(start_time.utcoffset())
+        expected = power_w * _reference_hourly_units(
+            datetime_to_us(start_time) + offset_us, datetime_to_us(end_time) + offset_us, rate_fen_by_hour
+        )
+        if billing_service.calculate_charge_fee_units(start_time, end_time, power_w) != expected:
+            mismatches += 1
+    print(f"billing sessions on random time zones, 10000 sessions: {mismatches} mismatches against the hourly walk")
+
+    # Property 4: versioned schedules with holidays integrate like a minute-by-minute walk
+    # of the version and day in effect
+    mismatches = 0
+    for _ in range(20):
+        holidays = rng.sample(range(20), 5)
+        versions = [
+            CompiledTariffVersion(
+                version_id,
+                None if version_id == 0 else rng.randint(0, 20 * MINUTES_PER_DAY) * US_PER_MINUTE,
+                *([rng.randint(0, 300) for _ in range(MINUTES_PER_DAY)] for _ in range(3)),
+                holidays,
+                0,
+            )
+            for version_id in range(4)
+        ]
+        schedule = TariffSchedule(versions)
+        for _ in range(25):
+            start_us = rng.randint(0, 20 * US_PER_DAY) // US_PER_MINUTE * US_PER_MINUTE
+            end_us = start_us + rng.randint(0, 3 * MINUTES_PER_DAY) * US_PER_MINUTE
+            expected = sum(
+                schedule.version_at(minute_us).rate_fen_at(minute_us) * US_PER_MINUTE
+                for minute_us in range(start_us, end_us, US_PER_MINUTE)
+            )
+            total = sum(version.rate_time_units(a, b) for version, a, b in schedule.segments(start_us, end_us))
+            if total != expected:
+                mismatches += 1
+    print(f"versioned schedules with holidays, 500 sessions: {mismatches} mismatches against the minute walk")
+
+    print(f"{'session':>8} {'hourly walk (us)':>17} {'compiled (us)':>14}")
+    tariff = tariff_service.builtin.week
+    lengths = [
+        ("10 min", 10 * US_PER_MINUTE),
+        ("12 h", 12 * US_PER_HOUR),
+        ("7 d", 7 * US_PER_DAY),
+        ("30 d", 30 * US_PER_DAY),
+    ]
+    for label, length_us in lengths:
+        starts = [rng.randint(0, 60 * US_PER_DAY) for _ in range(2000)]
+        intervals = [(start_us, start_us + length_us) for start_us in starts]
+        walk_ms = _time_call(lambda: [_reference_hourly_units(a, b, rate_fen_by_hour) for a, b in intervals], repeat=1)
+        compiled_ms = _time_call(lambda: [tariff.rate_time_units(a, b) for a, b in intervals])
+        print(f"{label:>8} {walk_ms / len(intervals) * 1000:>17.2f} {compiled_ms / len(intervals) * 1000:>14.2f}")
+
+
+def bench_rebilling():
+    print("== Re-billing: vectorized NumPy engine vs calculate_bill, per session ==")
+    import datetime as dt
+    from decimal import Decimal
+
+    import numpy as np
+
+    from app import models
+    from app.services.billing_service import billing_service
+    from app.services.fixed_point import kw_to_w, kwh_to_mwh, wall_clock_us, yuan_to_fen
+    from app.services.rebilling_service import rebilling_service
+    from app.services.tariff_service import tariff_service
+
+    rng = random.Random(24)
+    base = dt.datetime(2025, 6, 1, tzinfo=dt.timezone.utc)
+
+    def random_periods():
+        bounds = sorted(rng.sample(range(1, 24 * 60), 5))
+        periods = []
+        for kind in models.TariffDayKind:
+            for start, end in zip([0, *bounds], [*bounds, 24 * 60]):
+                rate = Decimal(rng.randint(20, 200)).scaleb(-2)
+                periods.append(models.TariffPeriod(day_kind=kind, start_minute=start, end_minute=end, rate=rate))
+        return periods
+
+    # Three price changes in the month, one of them also changing the service fee, plus holidays
+    versions = [
+        models.TariffVersion(
+            tariff_id=tariff_id,
+            pile_type=None,
+            effective_from=base + dt.timedelta(days=7 * tariff_id, minutes=rng.randint(0, 24 * 60)),
+            service_fee_per_kwh=Decimal("0.80") if tariff_id < 3 else Decimal("0.95"),
+            periods=random_periods(),
+        )
+        for tariff_id in range(1, 4)
+    ]
+    holidays = [models.TariffHoliday(holiday_date=base.date() + dt.timedelta(days=day)) for day in (1, 9, 17, 18)]
+
+    sessions = []
+    for _ in range(200_000):
+        zone = dt.timezone(dt.timedelta(minutes=rng.choice([0, 60, 330, 480, -300])))
+        start_time = (base + dt.timedelta(microseconds=rng.randint(-2 * 86400, 30 * 86400) * 10**6)).astimezone(zone)
+        end_time = start_time + dt.timedelta(microseconds=rng.randint(0, 2 * 86400 * 10**6))
+        power_rate = Decimal(rng.choice(["30.00", "7.00", "22.50", "60.00"]))
+        actual = Decimal(rng.randint(0, 9000)).scaleb(-2)
+        sessions.append((start_time, end_time, power_rate, actual))
+
+    start_us, offset_us = (np.array(column, dtype=np.int64) for column in zip(*(wall_clock_us(s[0]) for s in sessions)))
+    end_us = np.array([wall_clock_us(session[1])[0] for session in sessions], dtype=np.int64)
+    power_w = np.array([kw_to_w(session[2]) for session in sessions], dtype=np.int64)
+    energy_mwh = np.array([kwh_to_mwh(session[3]) for session in sessions], dtype=np.int64)
+
+    tariff_service.install(versions, holidays)
+    try:
+        schedule = tariff_service.schedule_for()
+        charge, service, total = rebilling_service.bill_arrays(
+            schedule, start_us, end_us, offset_us, power_w, energy_mwh
+        )
+        checked = sessions[:20000]
+        mismatches = 0
+        for i, session in enumerate(checked):
+            bill = billing_service.calculate_bill(*session)
+            expected = tuple(yuan_to_fen(bill[key]) for key in ("charge_fee", "service_fee", "total_fee"))
+            if expected != (charge[i], service[i], total[i]):
+                mismatches += 1
+        print(f"sessions across 3 tariff changes and 4 holidays, {len(checked)} checked: {mismatches} mismatches")
+
+        scalar_ms = _time_call(lambda: [billing_service.calculate_bill(*session) for session in checked], repeat=1)
+        vector_ms = _time_call(
+            lambda: rebilling_service.bill_arrays(schedule, start_us, end_us, offset_us, power_w, energy_mwh)
+        )
+        print(f"calculate_bill:    {scalar_ms / len(checked) * 1000:8.3f} us/session")
+        print(f"vectorized engine: {vector_ms / len(sessions) * 1000:8.3f} us/session ({len(sessions)} sessions)")
+    finally:
+        tariff_service.install([], [])
+
+
+def bench_waiting_area():
+    print("== Waiting area: cancel by request_id, linear deque scan vs indexed WaitingArea ==")
+    from collections import deque
+    from decimal import Decimal
+
+    from app import models
+    from app.queue_manager import QueueEntry, WaitingArea
+
+    rng = random.Random(5)
+
+    def make_requests(n_requests):
+        return [
+            QueueEntry(
+                request_id=i + 1,
+                user_id=i % 50,
+                queue_number=f"R{i + 1}",
+                requested_charge_type=models.RequestType.FAST if i % 2 == 0 else models.RequestType.TRICKLE,
+                requested_charge_amount=Decimal(20),
+                status=models.RequestStatus.WAITING,
+            )
+            for i in range(n_requests)
+        ]
+
+    def cancel_with_deques(requests, to_cancel):
+        fast, trickle = deque(), deque()
+        for request in requests:
+            (fast if request.requested_charge_type == models.RequestType.FAST else trickle).append(request)
+        for request_id in to_cancel:
+            for queue in (fast, trickle):
+                target = next((request for request in queue if request.request_id == request_id), None)
+                if target is not None:
+                    queue.remove(target)
+                    break
+
+    def cancel_with_waiting_area(requests, to_cancel):
+        area = WaitingArea(len(requests))
+        for request in requests:
+            area.queue_for(request.requested_charge_type).append(request)
+        for request_id in to_cancel:
+            request, queue = area.find(request_id)
+            if request is not None:
+                queue.remove(request)
+
+    print(f"{'waiting':>8} {'cancels':>8} {'deque scan (ms)':>16} {'indexed (ms)':>13}")
+    for n_waiting in (6, 1000, 10000):
+        requests = make_requests(n_waiting)
+        to_cancel = rng.sample(range(1, n_waiting + 1), n_waiting // 2)
+        deque_ms = _time_call(cancel_with_deques, requests, to_cancel, repeat=1)
+        indexed_ms = _time_call(cancel_with_waiting_area, requests, to_cancel, repeat=1)
+        print(f"{n_waiting:>8} {len(to_cancel):>8} {deque_ms:>16.2f} {indexed_ms:>13.2f}")
+
+    import datetime as dt
+    import tracemalloc
+
+    def allocated_bytes_per_item(factory, count=10000):
+        tracemalloc.start()
+        items = [factory(i) for i in range(count)]
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del items
+        return allocated / count
+
+    request_time = dt.datetime(2025, 6, 1, tzinfo=dt.timezone.utc)
+    fields = dict(
+        user_id=1,
+        requested_charge_type=models.RequestType.FAST,
+        requested_charge_amount=Decimal("20.00"),
+        status=models.RequestStatus.WAITING,
+        request_time=request_time,
+    )
+    orm_bytes = allocated_bytes_per_item(lambda i: models.ChargingRequest(request_id=i, queue_number=f"F{i}", **fields))
+    entry_bytes = allocated_bytes_per_item(lambda i: QueueEntry(request_id=i, queue_number=f"F{i}", **fields))
+    print(f"memory per queued vehicle: ORM ChargingRequest {orm_bytes:.0f} B, QueueEntry {entry_bytes:.0f} B")
+
+
+def bench_admission():
+    print("== Concurrent admissions against the waiting-area capacity (SQLite, needs the sim group) ==")
+    import asyncio
+    import os
+    import tempfile
+    from decimal import Decimal
+
+    from sqlalchemy import func, select
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app import models, schemas
+    from app.queue_manager import QueueManager
+
+    async def admit_concurrently(n_requests: int, capacity: int):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'admission.db')}")
+            session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.create_all)
+            async with session_factory() as db:
+                db.add(models.User(username="benchmark", password_hash="-", role=models.UserRole.USER))
+                await db.commit()
+
+            manager = QueueManager(waiting_area_capacity=capacity)
+            async with session_factory() as db:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    await manager.initialize(db)
+
+            async def submit(i: int):
+                async with session_factory() as db:
+                    _, error = await manager.add_request_to_waiting_queue(
+                        db,
+                        schemas.ChargingRequestCreate(
+                            user_id=1,
+                            requested_charge_type=models.RequestType.FAST if i % 2 else models.RequestType.TRICKLE,
+                            requested_charge_amount=Decimal(20),
+                        ),
+                    )
+                    return error is None
+
+            started = time.perf_counter()
+            accepted = sum(await asyncio.gather(*(submit(i) for i in range(n_requests))))
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            async with session_factory() as db:
+                stored = await db.scalar(select(func.count()).select_from(models.ChargingRequest))
+                numbers = (await db.execute(select(models.ChargingRequest.queue_number))).scalars().all()
+            await engine.dispose()
+            area = manager.waiting_area
+            return accepted, len(area), area.reserved, stored, len(set(numbers)), elapsed_ms
+
+    async def admit_sequentially_or_batched(n_requests: int):
+        timings = {}
+        for mode in ("one by one", "batch"):
+            with tempfile.TemporaryDirectory() as directory:
+                engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'admission.db')}")
+                session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+                async with engine.begin() as conn:
+                    await conn.run_sync(models.Base.metadata.create_all)
+                manager = QueueManager(waiting_area_capacity=n_requests)
+                requests = [
+                    schemas.ChargingRequestCreate(
+                        user_id=1, requested_charge_type=models.RequestType.FAST, requested_charge_amount=Decimal(20)
+                    )
+                    for _ in range(n_requests)
+                ]
+                async with session_factory() as db:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        await manager.initialize(db)
+                    started = time.perf_counter()
+                    if mode == "batch":
+                        await manager.add_requests_to_waiting_queue(db, requests)
+                    else:
+                        for request in requests:
+                            await manager.add_request_to_waiting_queue(db, request)
+                    timings[mode] = (time.perf_counter() - started) * 1000
+                await engine.dispose()
+        return timings
+
+    async def run_all():
+        header = f"{'submitted':>9} {'capacity':>8} {'accepted':>8} {'waiting':>7} {'reserved':>8} {'in DB':>6}"
+        print(f"{header} {'unique #':>8} {'ms':>8}")
+        for n_requests, capacity in [(50, 6), (300, 50), (300, 250)]:
+            accepted, waiting, reserved, stored, unique, elapsed_ms = await admit_concurrently(n_requests, capacity)
+            print(
+                f"{n_requests:>9} {capacity:>8} {accepted:>8} {waiting:>7} {reserved:>8} {stored:>6} "
+                f"{unique:>8} {elapsed_ms:>8.1f}"
+            )
+        for n_requests in (50, 250):
+            timings = await admit_sequentially_or_batched(n_requests)
+            print(
+                f"{n_requests} vehicles of one fleet: one by one {timings['one by one']:.1f} ms, "
+                f"one batch {timings['batch']:.1f} ms"
+            )
+
+    asyncio.run(run_all())
+
+
+BENCHMARKS = {
+    "assignment": bench_assignment,
+    "full_load": bench_full_load,
+    "tick": bench_tick,
+    "billing": bench_billing,
+    "tariff": bench_tariff,
+    "rebilling": bench_rebilling,
+    "waiting_area": bench_waiting_area,
+    "admission": bench_admission,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
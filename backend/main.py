@@ -1,7 +1,8 @@
 import asyncio
 from contextlib import asynccontextmanager
 
-from app.database import SessionLocal
+from app.database import SessionLocal, engine
+from app.queue_journal import QueueJournal
 from app.queue_manager import queue_manager
 from app.routers import admin as admin_router
 from app.routers import admin_auth as admin_auth_router
@@ -11,45 +12,70 @@ from app.routers import history as history_router
 from app.routers import orders as orders_router
 from app.routers import requests as requests_router
 from app.services.charging_monitor_service import charging_monitor_service
+from app.services.config_service import config_service
+from app.services.metrics_service import metrics_service
+from app.services.scheduler_trigger import scheduler_trigger
 from app.services.scheduling_service import scheduling_service
+from app.services.tariff_service import tariff_service
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 
 async def run_scheduler_periodically():
-    """Background task to run the scheduler periodically."""
+    """
+    Background task to run the scheduler. It runs as soon as it is signalled
+    through the scheduler trigger, with a long safety-net interval in between.
+    """
     while True:
-        await asyncio.sleep(10)  # Run every 10 seconds
-        print("Running scheduler...")
-        async with SessionLocal() as db_session:
-            try:
-                await scheduling_service.schedule_next_vehicle(db_session)
-            except Exception as e:
-                print(f"An error occurred in the scheduler: {e}")
+        await scheduler_trigger.wait()
+        if not queue_manager.waiting_queue_fast and not queue_manager.waiting_queue_trickle:
+            continue  # Nothing to schedule, don't touch the database
+        try:
+            with metrics_service.tick("scheduler", config_service.scheduling_strategy.value):
+                async with SessionLocal() as db_session:
+                    await scheduling_service.schedule_next_vehicle(db_session)
+        except Exception as e:
+            print(f"An error occurred in the scheduler: {e}")
 
 
 async def run_monitor_periodically():
-    """Background task to run the charging monitor periodically."""
+    """
+    Background task to run the charging monitor. It sleeps until the next charging
+    session is projected to end and only opens database sessions when one is due.
+    """
     while True:
-        await asyncio.sleep(5)  # Run every 5 seconds
-        print("Running charging monitor...")
-        async with SessionLocal() as db_session:
-            try:
-                await charging_monitor_service.check_completed_charges(db_session)
-            except Exception as e:
-                print(f"An error occurred in the charging monitor: {e}")
+        await charging_monitor_service.wait_for_next_completion()
+        if not charging_monitor_service.has_due_completions():
+            continue
+        try:
+            with metrics_service.tick("monitor"):
+                await charging_monitor_service.check_completed_charges(SessionLocal)
+        except Exception as e:
+            print(f"An error occurred in the charging monitor: {e}")
+            await asyncio.sleep(5)  # The failed sessions stay due; don't retry in a tight loop
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # On startup
+    metrics_service.install_statement_counter(engine)
     print("Application startup: Initializing QueueManager...")
+    journal = QueueJournal()
+    if journal.acquire():
+        queue_manager.attach_journal(journal)
+    else:
+        # The queues are per process: a second worker cannot share the first one's journal
+        print(f"Queue state in {journal.directory} is owned by another process; running without a journal.")
     async with SessionLocal() as db_session:
         try:
             await queue_manager.initialize(db_session)
         except Exception as e:
             print(f"Error initializing QueueManager: {e}")
             # Consider exiting if initialization is critical and fails
+        try:
+            await tariff_service.load(db_session)
+        except Exception as e:
+            print(f"Error loading tariff versions, billing with the built-in tariff: {e}")
 
     # Start background tasks
     scheduler_task = asyncio.create_task(run_scheduler_periodically())
@@ -69,6 +95,10 @@ async def lifespan(app: FastAPI):
         await monitor_task
     except asyncio.CancelledError:
         print("Monitor task has been cancelled.")
+    # Leave a fresh snapshot behind so that the next start replays nothing
+    queue_manager.write_snapshot()
+    if queue_manager.journal is not None:
+        queue_manager.journal.release()
     print("Application shutdown.")
 
 
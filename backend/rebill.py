@@ -0,0 +1,79 @@
+"""
+Bulk re-billing and tariff audit of the stored charging orders.
+
+Streams the orders that started in a period from the database in chunks, re-bills
+them with the vectorized engine (app/services/rebilling_service.py) and writes a CSV
+report of the orders whose charge, service or total fee differs from the stored one.
+
+Without --tariff-id, orders are billed under the tariff versions in effect for their
+pile type (an audit of the stored fees). With --tariff-id, every order is billed under
+that tariff version (0 for the built-in tariff), answering "what would this period
+have cost under tariff X".
+
+Usage:
+    uv run python rebill.py [--from 2025-06-01] [--to 2025-07-01] [--tariff-id ID]
+        [--pile-type FAST] [--output rebilling.csv] [--all] [--chunk-size 50000]
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.database import DATABASE_URL
+from app.services.rebilling_service import rebilling_service
+from app.services.tariff_service import tariff_service
+
+
+def _date(value: str) -> dt.datetime:
+    timestamp = dt.datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo is not None else timestamp.replace(tzinfo=dt.timezone.utc)
+
+
+async def run(args: argparse.Namespace):
+    engine = create_async_engine(args.database_url)
+    Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    rebilling_service.chunk_size = args.chunk_size
+    started = time.perf_counter()
+    try:
+        async with Session() as db:
+            await tariff_service.load(db)
+            with open(args.output, "w", newline="") as report:
+                summary = await rebilling_service.audit(
+                    db,
+                    report,
+                    start_time=args.start,
+                    end_time=args.end,
+                    tariff_id=args.tariff_id,
+                    pile_type=args.pile_type,
+                    include_unchanged=args.all,
+                )
+    finally:
+        await engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    print(f"orders re-billed: {summary['orders']} in {elapsed:.1f} s, with different fees: {summary['changed']}")
+    for key in ("charge", "service", "total"):
+        print(f"{key:>8} fee: stored {summary[f'stored_{key}_fee']}, re-billed {summary[f'rebilled_{key}_fee']}")
+    print(f"total fee delta: {summary['total_fee_delta']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="start", type=_date, help="first order start time (ISO 8601, UTC if naive)")
+    parser.add_argument("--to", dest="end", type=_date, help="order start times before this (ISO 8601, UTC if naive)")
+    parser.add_argument("--tariff-id", type=int, help="bill every order under this tariff version (0: built-in)")
+    parser.add_argument("--pile-type", type=models.PileType, choices=list(models.PileType), metavar="{FAST,TRICKLE}")
+    parser.add_argument("--output", default="rebilling.csv", help="CSV diff report")
+    parser.add_argument("--all", action="store_true", help="report every order, not only the changed ones")
+    parser.add_argument("--chunk-size", type=int, default=rebilling_service.chunk_size)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Offline discrete-event simulator for comparing the scheduling strategies.
+
+Replays a synthetic arrival trace (Poisson arrivals, mixed FAST/TRICKLE) through the
+real QueueManager, SchedulingService, ChargingMonitorService and BillingService,
+backed by an in-memory SQLite database and a virtual clock. Time jumps straight from
+one event (an arrival or a projected charge completion) to the next, so simulated
+days run in seconds and no PostgreSQL server is needed.
+
+Usage:
+    uv run --group sim python simulator.py [--days 1] [--fast-piles 2] [--trickle-piles 3]
+        [--fast-rate 3] [--trickle-rate 1.5] [--strategy SHORTEST_BATCH_COMPLETION ...]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime as dt
+import io
+import math
+import random
+import statistics
+import time
+from collections import deque
+from decimal import Decimal
+from typing import Dict, List, NamedTuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models, schemas
+from app.queue_manager import queue_manager
+from app.services.charging_monitor_service import charging_monitor_service
+from app.services.clock_service import clock_service
+from app.services.config_service import SchedulingStrategy, config_service
+from app.services.metrics_service import metrics_service
+from app.services.scheduling_service import scheduling_service
+
+SIMULATION_START = dt.datetime(2025, 6, 2, tzinfo=dt.timezone.utc)
+
+# Same power rates as the piles created by the admin setup endpoint
+PILE_POWER_KW = {models.PileType.FAST: Decimal("30.00"), models.PileType.TRICKLE: Decimal("7.00")}
+
+
+class Arrival(NamedTuple):
+    time: dt.datetime
+    charge_type: models.RequestType
+    amount_kwh: Decimal
+
+
+def generate_trace(
+    rng: random.Random, hours: float, rates_per_hour: Dict[models.RequestType, float], amount_range_kwh
+) -> List[Arrival]:
+    """Poisson arrivals for each charge type over `hours`, merged in time order."""
+    arrivals = []
+    min_centi_kwh, max_centi_kwh = (int(amount * 100) for amount in amount_range_kwh)
+    for charge_type, rate in rates_per_hour.items():
+        if rate <= 0:
+            continue
+        elapsed_hours = rng.expovariate(rate)
+        while elapsed_hours < hours:
+            amount = Decimal(rng.randint(min_centi_kwh, max_centi_kwh)).scaleb(-2)
+            arrivals.append(Arrival(SIMULATION_START + dt.timedelta(hours=elapsed_hours), charge_type, amount))
+            elapsed_hours += rng.expovariate(rate)
+    arrivals.sort(key=lambda arrival: arrival.time)
+    return arrivals
+
+
+def _as_utc(timestamp: dt.datetime) -> dt.datetime:
+    # SQLite hands timestamps back without their timezone
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=dt.timezone.utc)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+async def _setup_database(session_factory, engine, fast_piles: int, trickle_piles: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    async with session_factory() as db:
+        for pile_type, count in ((models.PileType.FAST, fast_piles), (models.PileType.TRICKLE, trickle_piles)):
+            for i in range(1, count + 1):
+                db.add(
+                    models.ChargingPile(
+                        pile_code=f"{pile_type.value[0]}{i:03d}",
+                        type=pile_type,
+                        status=models.PileStatus.AVAILABLE,
+                        power_rate=PILE_POWER_KW[pile_type],
+                    )
+                )
+        db.add(models.User(username="simulator", password_hash="-", role=models.UserRole.USER))
+        await db.commit()
+
+
+async def simulate(trace: List[Arrival], strategy: SchedulingStrategy, args) -> Dict[str, float]:
+    """Runs the trace through the system with the given strategy and returns its report."""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    await _setup_database(session_factory, engine, args.fast_piles, args.trickle_piles)
+
+    saved_capacity = queue_manager.waiting_area_capacity
+    saved_overflow_capacity = queue_manager.waiting_area.overflow_capacity
+    saved_strategy = config_service.scheduling_strategy
+    saved_monitor_concurrency = charging_monitor_service.max_concurrency
+    clock_service.use_system_time()
+    clock_service.set_virtual_time(SIMULATION_START)
+    config_service.set_scheduling_strategy(strategy)
+    queue_manager.waiting_area_capacity = args.waiting_capacity
+    queue_manager.waiting_area.overflow_capacity = args.overflow_capacity
+    # All sessions share the one in-memory connection, so finalize on one session at a time
+    charging_monitor_service.max_concurrency = 1
+    for queue in queue_manager.waiting_area.queues:
+        queue.clear()
+    metrics_service.reset()
+    metrics_service.install_statement_counter(engine)
+
+    pending = deque(trace)
+    rejected = 0
+    # Admission times promised to rejected arrivals that have not come true yet, and the
+    # errors of the ones that have (minutes)
+    promised_admissions: List[dt.datetime] = []
+    retry_errors_minutes: List[float] = []
+    started = time.perf_counter()
+    try:
+        async with session_factory() as db:
+            await queue_manager.initialize(db)
+
+        while True:
+            next_completion = queue_manager.next_completion()
+            event_times = [t for t in (next_completion, pending[0].time if pending else None) if t]
+            if not event_times:
+                break  # No arrivals left and no vehicle charging
+            now = max(min(event_times), clock_service.now())
+            clock_service.set_virtual_time(now)
+
+            if next_completion and next_completion <= now:
+                with metrics_service.tick("monitor"):
+                    await charging_monitor_service.check_completed_charges(session_factory)
+
+            async with session_factory() as db:
+                while pending and pending[0].time <= now:
+                    arrival = pending.popleft()
+                    _, error = await queue_manager.add_request_to_waiting_queue(
+                        db,
+                        schemas.ChargingRequestCreate(
+                            user_id=1,
+                            requested_charge_type=arrival.charge_type,
+                            requested_charge_amount=arrival.amount_kwh,
+                        ),
+                    )
+                    if error:
+                        rejected += 1
+                        promised_admissions.append(now + queue_manager.admission_estimate())
+
+                if queue_manager.waiting_queue_fast or queue_manager.waiting_queue_trickle:
+                    with metrics_service.tick("scheduler", strategy.value):
+                        await scheduling_service.schedule_next_vehicle(db)
+
+            area = queue_manager.waiting_area
+            if promised_admissions and area.occupied() < area.capacity + area.overflow_capacity:
+                # A submission would be admitted now
+                retry_errors_minutes += [abs((now - promised).total_seconds()) / 60 for promised in promised_admissions]
+                promised_admissions.clear()
+
+        wall_seconds = time.perf_counter() - started
+        end_time = clock_service.now()
+
+        async with session_factory() as db:
+            requests = (await db.execute(select(models.ChargingRequest))).scalars().all()
+            orders = (await db.execute(select(models.ChargingOrder))).scalars().all()
+            piles = {pile.pile_id: pile for pile in (await db.execute(select(models.ChargingPile))).scalars().all()}
+    finally:
+        clock_service.use_system_time()
+        config_service.set_scheduling_strategy(saved_strategy)
+        charging_monitor_service.max_concurrency = saved_monitor_concurrency
+        queue_manager.waiting_area.overflow_capacity = saved_overflow_capacity
+        queue_manager.waiting_area_capacity = saved_capacity
+        for queue in queue_manager.waiting_area.queues:
+            queue.clear()
+        queue_manager.reset_piles([])
+        await engine.dispose()
+
+    makespan_hours = max((end_time - SIMULATION_START).total_seconds() / 3600, 1e-9)
+    waits_minutes = [
+        (_as_utc(request.start_time) - _as_utc(request.request_time)).total_seconds() / 60
+        for request in requests
+        if request.start_time
+    ]
+    busy_hours = {pile_type: 0.0 for pile_type in models.PileType}
+    for order in orders:
+        pile_type = piles[order.pile_id].type
+        busy_hours[pile_type] += (_as_utc(order.end_time) - _as_utc(order.start_time)).total_seconds() / 3600
+    pile_counts = {models.PileType.FAST: args.fast_piles, models.PileType.TRICKLE: args.trickle_piles}
+    utilization = {
+        pile_type: busy_hours[pile_type] / (pile_counts[pile_type] * makespan_hours) if pile_counts[pile_type] else 0.0
+        for pile_type in models.PileType
+    }
+    scheduler_metrics = next((m for m in metrics_service.snapshot() if m["loop"] == "scheduler"), None)
+    solver_ms = scheduler_metrics["phase_ms"]["solve"]["sum"] if scheduler_metrics else 0.0
+    metrics_service.reset()
+
+    return {
+        "arrivals": len(trace),
+        "served": len(orders),
+        "rejected": rejected,
+        "unserved": len(trace) - rejected - len(orders),
+        "throughput_per_hour": len(orders) / makespan_hours,
+        "mean_wait_min": sum(waits_minutes) / len(waits_minutes) if waits_minutes else 0.0,
+        "p95_wait_min": _percentile(waits_minutes, 0.95),
+        "utilization_fast": utilization[models.PileType.FAST],
+        "utilization_trickle": utilization[models.PileType.TRICKLE],
+        "revenue_yuan": float(sum(order.total_fee for order in orders)),
+        "mean_retry_error_min": statistics.fmean(retry_errors_minutes) if retry_errors_minutes else 0.0,
+        "solver_ms": solver_ms,
+        "wall_seconds": wall_seconds,
+    }
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    trace = generate_trace(
+        rng,
+        args.days * 24,
+        {models.RequestType.FAST: args.fast_rate, models.RequestType.TRICKLE: args.trickle_rate},
+        (args.amount_min, args.amount_max),
+    )
+    strategies = [SchedulingStrategy(name) for name in args.strategy] if args.strategy else list(SchedulingStrategy)
+
+    print(
+        f"== {args.days:g} simulated day(s): {len(trace)} arrivals, "
+        f"{args.fast_piles} fast / {args.trickle_piles} trickle piles, waiting area {args.waiting_capacity}"
+        f" + overflow {args.overflow_capacity} =="
+    )
+    print(
+        f"{'strategy':<32} {'served':>6} {'rejected':>8} {'unserved':>8} {'veh/h':>6} {'mean wait':>10} "
+        f"{'p95 wait':>9} {'util F':>7} {'util T':>7} {'revenue':>9} {'retry err':>10} {'solver ms':>10} {'wall s':>7}"
+    )
+    for strategy in strategies:
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = await simulate(trace, strategy, args)
+        print(
+            f"{strategy.value:<32} {report['served']:>6} {report['rejected']:>8} {report['unserved']:>8} "
+            f"{report['throughput_per_hour']:>6.2f} {report['mean_wait_min']:>8.1f} m {report['p95_wait_min']:>7.1f} m "
+            f"{report['utilization_fast']:>7.1%} {report['utilization_trickle']:>7.1%} {report['revenue_yuan']:>9.2f} "
+            f"{report['mean_retry_error_min']:>8.1f} m {report['solver_ms']:>10.1f} {report['wall_seconds']:>7.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=1.0, help="simulated days of arrivals")
+    parser.add_argument("--fast-piles", type=int, default=2)
+    parser.add_argument("--trickle-piles", type=int, default=3)
+    parser.add_argument("--fast-rate", type=float, default=3.0, help="FAST arrivals per hour")
+    parser.add_argument("--trickle-rate", type=float, default=1.5, help="TRICKLE arrivals per hour")
+    parser.add_argument("--amount-min", type=float, default=5.0, help="smallest requested amount (kWh)")
+    parser.add_argument("--amount-max", type=float, default=60.0, help="largest requested amount (kWh)")
+    parser.add_argument("--waiting-capacity", type=int, default=queue_manager.waiting_area_capacity)
+    parser.add_argument("--overflow-capacity", type=int, default=0, help="overflow list behind the waiting area")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--strategy",
+        action="append",
+        choices=[strategy.value for strategy in SchedulingStrategy],
+        help="strategy to simulate, may be repeated (default: all)",
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
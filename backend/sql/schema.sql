@@ -8,6 +8,9 @@ DROP TABLE IF EXISTS ChargingRequests CASCADE;
 DROP TABLE IF EXISTS ChargingPiles CASCADE;
 DROP TABLE IF EXISTS Users CASCADE;
 DROP TABLE IF EXISTS PileLogs CASCADE;
+DROP TABLE IF EXISTS TariffPeriods CASCADE;
+DROP TABLE IF EXISTS TariffVersions CASCADE;
+DROP TABLE IF EXISTS TariffHolidays CASCADE;
 
 DROP TYPE IF EXISTS UserRole;
 DROP TYPE IF EXISTS PileType;
@@ -15,6 +18,7 @@ DROP TYPE IF EXISTS PileStatus;
 DROP TYPE IF EXISTS RequestType;
 DROP TYPE IF EXISTS RequestStatus;
 DROP TYPE IF EXISTS ReportType;
+DROP TYPE IF EXISTS TariffDayKind;
 
 -- Enum Types
 CREATE TYPE UserRole AS ENUM ('user', 'admin');
@@ -23,6 +27,7 @@ CREATE TYPE PileStatus AS ENUM ('AVAILABLE', 'CHARGING', 'FAULTY', 'OFF');
 CREATE TYPE RequestType AS ENUM ('FAST', 'TRICKLE');
 CREATE TYPE RequestStatus AS ENUM ('WAITING', 'CHARGING', 'FINISHED', 'CANCELLED');
 CREATE TYPE ReportType AS ENUM ('DAILY', 'WEEKLY', 'MONTHLY');
+CREATE TYPE TariffDayKind AS ENUM ('WEEKDAY', 'WEEKEND', 'HOLIDAY');
 
 
 -- Users Table
@@ -57,6 +62,16 @@ CREATE TABLE ChargingRequests (
     end_time TIMESTAMPTZ
 );
 
+-- Queue number sequences, one per request type. Each nextval() reserves a block of
+-- 20 numbers (INCREMENT BY must match QUEUE_NUMBER_BLOCK_SIZE in app/models.py).
+-- On an existing database, start them above the numbers already issued:
+--   SELECT setval('queue_number_fast_seq', COALESCE(MAX(SUBSTRING(queue_number FROM 2)::INTEGER), 0) + 1, false)
+--   FROM ChargingRequests WHERE queue_number LIKE 'F%';
+--   SELECT setval('queue_number_trickle_seq', COALESCE(MAX(SUBSTRING(queue_number FROM 2)::INTEGER), 0) + 1, false)
+--   FROM ChargingRequests WHERE queue_number LIKE 'T%';
+CREATE SEQUENCE queue_number_fast_seq INCREMENT BY 20 START WITH 1;
+CREATE SEQUENCE queue_number_trickle_seq INCREMENT BY 20 START WITH 1;
+
 -- Charging Orders/Bills Table
 CREATE TABLE ChargingOrders (
     order_id SERIAL PRIMARY KEY,
@@ -72,6 +87,33 @@ CREATE TABLE ChargingOrders (
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Time-of-use tariff versions. A version is in effect from effective_from until the
+-- next version for the same pile type (pile_type NULL applies to every type).
+CREATE TABLE TariffVersions (
+    tariff_id SERIAL PRIMARY KEY,
+    pile_type PileType,
+    effective_from TIMESTAMPTZ NOT NULL,
+    service_fee_per_kwh DECIMAL(10, 2) NOT NULL,
+    description VARCHAR(255),
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Rates of a tariff version by minute of the day, [start_minute, end_minute)
+CREATE TABLE TariffPeriods (
+    period_id SERIAL PRIMARY KEY,
+    tariff_id INTEGER NOT NULL REFERENCES TariffVersions(tariff_id) ON DELETE CASCADE,
+    day_kind TariffDayKind NOT NULL,
+    start_minute INTEGER NOT NULL CHECK (start_minute >= 0 AND start_minute < 1440),
+    end_minute INTEGER NOT NULL CHECK (end_minute > start_minute AND end_minute <= 1440),
+    rate DECIMAL(10, 2) NOT NULL
+);
+
+-- Dates billed with the HOLIDAY periods of the tariff in effect
+CREATE TABLE TariffHolidays (
+    holiday_date DATE PRIMARY KEY,
+    description VARCHAR(255)
+);
+
 -- Operational Reports Data Table
 CREATE TABLE OperationalReports (
     report_id SERIAL PRIMARY KEY,
@@ -94,4 +136,6 @@ CREATE INDEX idx_charging_requests_status ON ChargingRequests(status);
 CREATE INDEX idx_charging_requests_user_id ON ChargingRequests(user_id);
 CREATE INDEX idx_charging_orders_user_id ON ChargingOrders(user_id);
 CREATE INDEX idx_charging_orders_pile_id ON ChargingOrders(pile_id);
-CREATE INDEX idx_operational_reports_date ON OperationalReports(report_date); 
\ No newline at end of file
+CREATE INDEX idx_operational_reports_date ON OperationalReports(report_date);
+CREATE INDEX idx_tariff_versions_effective_from ON TariffVersions(effective_from);
+CREATE INDEX idx_tariff_periods_tariff_id ON TariffPeriods(tariff_id); 
\ No newline at end of file
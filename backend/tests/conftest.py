@@ -0,0 +1,94 @@
+import asyncio
+import datetime as dt
+from typing import Awaitable, Callable, Optional
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.queue_journal import QueueJournal
+from app.queue_manager import queue_manager
+from app.services.clock_service import clock_service
+
+START = dt.datetime(2025, 6, 2, 8, tzinfo=dt.timezone.utc)
+
+
+@pytest.fixture
+def failing_commit():
+    """
+    failing_commit(db, during=None) makes db.commit roll back, await during() (if any)
+    and then fail, like a COMMIT lost by the database.
+    """
+
+    def install(db: AsyncSession, during: Optional[Callable[[], Awaitable]] = None):
+        async def commit():
+            await db.rollback()
+            if during is not None:
+                await during()
+            raise OperationalError("COMMIT", {}, Exception("disk I/O error"))
+
+        db.commit = commit
+
+    return install
+
+
+@pytest.fixture
+def station():
+    """
+    Runs a scenario against a fresh in-memory station: two fast and two trickle piles and
+    one user (user_id 1), with the global QueueManager initialized on it at START.
+    `station(scenario, journal=None)` awaits scenario(session_factory) and returns its result.
+    """
+    saved_capacity = queue_manager.waiting_area_capacity
+    saved_overflow_capacity = queue_manager.waiting_area.overflow_capacity
+
+    def run(scenario, journal: Optional[QueueJournal] = None):
+        async def main():
+            engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+            session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(models.Base.metadata.create_all)
+                async with session_factory() as db:
+                    for pile_type, power_rate in ((models.PileType.FAST, 30), (models.PileType.TRICKLE, 7)):
+                        for i in range(1, 3):
+                            db.add(
+                                models.ChargingPile(
+                                    pile_code=f"{pile_type.value[0]}{i}",
+                                    type=pile_type,
+                                    status=models.PileStatus.AVAILABLE,
+                                    power_rate=power_rate,
+                                )
+                            )
+                    db.add(models.User(username="driver", password_hash="-", role=models.UserRole.USER))
+                    await db.commit()
+
+                if journal is not None:
+                    assert journal.acquire()
+                    queue_manager.attach_journal(journal)
+                async with session_factory() as db:
+                    await queue_manager.initialize(db)
+                return await scenario(session_factory)
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    clock_service.set_virtual_time(START)
+    for queue in queue_manager.waiting_area.queues:
+        queue.clear()
+    try:
+        yield run
+    finally:
+        clock_service.use_system_time()
+        if queue_manager.journal is not None:
+            queue_manager.journal.release()
+            queue_manager.journal = None
+        queue_manager.waiting_area.overflow_capacity = saved_overflow_capacity
+        queue_manager.waiting_area_capacity = saved_capacity
+        for queue in queue_manager.waiting_area.queues:
+            queue.clear()
+        queue_manager.reset_piles([])
@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+import pytest
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+from app.services.assignment_solver import (
+    assignment_cost,
+    brute_force_assignment,
+    optimal_assignment,
+    solve_assignment,
+)
+
+
+@st.composite
+def cost_matrices(draw, min_size=1, max_size=6):
+    rows = draw(st.integers(min_size, max_size))
+    cols = draw(st.integers(min_size, max_size))
+    values = st.floats(min_value=0, max_value=100, allow_nan=False, allow_infinity=False)
+    return np.array(draw(st.lists(st.lists(values, min_size=cols, max_size=cols), min_size=rows, max_size=rows)))
+
+
+def _brute_force_cost(cost: np.ndarray) -> float:
+    # The reference solver needs rows <= cols; with more rows, every column gets a row instead
+    if cost.shape[0] > cost.shape[1]:
+        return assignment_cost(cost.T, brute_force_assignment(cost.T))
+    return assignment_cost(cost, brute_force_assignment(cost))
+
+
+def _assert_valid(cost: np.ndarray, assignment):
+    assert len(assignment) == cost.shape[0]
+    columns = [j for j in assignment if j is not None]
+    assert len(columns) == len(set(columns)) == min(cost.shape)
+    assert all(0 <= j < cost.shape[1] for j in columns)
+
+
+@settings(max_examples=300, deadline=None)
+@given(cost_matrices())
+def test_solve_assignment_matches_brute_force(cost):
+    assignment = solve_assignment(cost)
+    _assert_valid(cost, assignment)
+    assert assignment_cost(cost, assignment) == pytest.approx(_brute_force_cost(cost), abs=1e-9)
+
+
+@pytest.mark.parametrize("rows, cols", [(2, 5), (3, 6), (5, 2), (6, 3), (6, 6)])
+def test_rectangular_matrices_match_brute_force(rows, cols):
+    rng = np.random.default_rng(rows * 10 + cols)
+    for _ in range(50):
+        cost = rng.uniform(0, 10, size=(rows, cols))
+        assignment = solve_assignment(cost)
+        _assert_valid(cost, assignment)
+        assert assignment_cost(cost, assignment) == pytest.approx(_brute_force_cost(cost), abs=1e-9)
+
+
+def test_more_rows_than_columns_leaves_rows_unassigned():
+    cost = [[5.0, 1.0], [1.0, 5.0], [0.5, 0.5]]
+    assignment = solve_assignment(cost)
+    assert assignment.count(None) == 1
+    assert assignment_cost(cost, assignment) == pytest.approx(1.5)
+
+
+def test_infinite_costs_are_avoided_when_possible():
+    cost = [[math.inf, 2.0], [1.0, math.inf]]
+    assert solve_assignment(cost) == [1, 0]
+
+
+def test_infeasible_matrix_raises():
+    with pytest.raises(ValueError):
+        solve_assignment([[math.inf, math.inf], [1.0, 2.0]])
+
+
+def test_degenerate_shapes():
+    assert solve_assignment([]) == []
+    assert solve_assignment(np.zeros((3, 0))) == [None, None, None]
+
+
+@settings(max_examples=100, deadline=None)
+@given(cost_matrices(max_size=4))
+def test_optimal_assignment_brute_force_path_is_optimal(cost):
+    if cost.shape[0] > cost.shape[1]:
+        cost = cost.T
+    assert assignment_cost(cost, optimal_assignment(cost)) == pytest.approx(_brute_force_cost(cost), abs=1e-9)
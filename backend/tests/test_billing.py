@@ -0,0 +1,142 @@
+import datetime as dt
+import random
+from decimal import Decimal
+
+import pytest
+
+from app import models
+from app.services.billing_service import billing_service
+from app.services.fixed_point import energy_mwh_for_duration, kw_to_w, mwh_to_kwh, timedelta_to_us
+from app.services.tariff_service import tariff_service
+
+UTC = dt.timezone.utc
+
+
+def reference_decimal_bill(start_time, end_time, power_rate_kw, actual_charge_amount, tariffs, service_fee_per_kwh):
+    """The original Decimal implementation of a bill, hour block by hour block."""
+
+    def rate_for(timestamp):
+        for tariff in tariffs:
+            if tariff["start_hour"] <= timestamp.hour < tariff["end_hour"]:
+                return tariff["rate"]
+        return Decimal("0.7")
+
+    charge_fee = Decimal(0)
+    energy_per_second = power_rate_kw / Decimal(3600)
+    current_time = start_time
+    while current_time < end_time:
+        rate = rate_for(current_time)
+        next_hour = (current_time + dt.timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+        boundary_time = min(end_time, next_hour)
+        duration_in_block = (boundary_time - current_time).total_seconds()
+        if duration_in_block > 0:
+            charge_fee += Decimal(duration_in_block) * energy_per_second * rate
+        current_time = boundary_time
+
+    service_fee = actual_charge_amount * service_fee_per_kwh
+    return {
+        "actual_charge_amount": round(actual_charge_amount, 2),
+        "charge_fee": round(charge_fee, 2),
+        "service_fee": round(service_fee, 2),
+        "total_fee": round(charge_fee + service_fee, 2),
+    }
+
+
+@pytest.fixture
+def flat_tariff():
+    """Installs a single all-day rate and service fee from 2000 on; the built-in tariff comes back afterwards."""
+
+    def install(rate: str, service_fee: str):
+        period = models.TariffPeriod(
+            day_kind=models.TariffDayKind.WEEKDAY, start_minute=0, end_minute=24 * 60, rate=Decimal(rate)
+        )
+        version = models.TariffVersion(
+            tariff_id=1,
+            pile_type=None,
+            effective_from=dt.datetime(2000, 1, 1, tzinfo=UTC),
+            service_fee_per_kwh=Decimal(service_fee),
+            periods=[period],
+        )
+        tariff_service.install([version], [])
+
+    yield install
+    tariff_service.install([], [])
+
+
+def random_sessions(count, seed):
+    rng = random.Random(seed)
+    base = dt.datetime(2025, 6, 1, tzinfo=UTC)
+    zones = [dt.timezone(dt.timedelta(minutes=minutes)) for minutes in (0, 60, 330, 480, -300)]
+    for _ in range(count):
+        start_time = base + dt.timedelta(seconds=rng.randint(0, 30 * 86400), microseconds=rng.randint(0, 999999))
+        start_time = start_time.astimezone(rng.choice(zones))
+        end_time = start_time + dt.timedelta(seconds=rng.randint(1, 36 * 3600), microseconds=rng.randint(0, 999999))
+        power_rate = Decimal(rng.choice(["30.00", "7.00", "22.50", "60.00"]))
+        # Half the sessions stop early (arbitrary energy), half complete their requested amount
+        if rng.random() < 0.5:
+            duration_us = timedelta_to_us(end_time - start_time)
+            actual = mwh_to_kwh(energy_mwh_for_duration(duration_us, kw_to_w(power_rate)))
+        else:
+            actual = Decimal(rng.randint(100, 9000)).scaleb(-2)
+        yield start_time, end_time, power_rate, actual
+
+
+@pytest.mark.parametrize("seed", [11, 12, 13, 14])
+def test_fixed_point_bills_match_the_decimal_engine(seed):
+    for session in random_sessions(5000, seed):
+        expected = reference_decimal_bill(*session, billing_service.TOU_TARIFFS, billing_service.SERVICE_FEE_PER_KWH)
+        assert billing_service.calculate_bill(*session) == expected, session
+
+
+def test_sessions_crossing_midnight_and_period_boundaries():
+    start_time = dt.datetime(2025, 6, 1, 22, 30, tzinfo=UTC)
+    for end_time in [
+        dt.datetime(2025, 6, 1, 23, 0, tzinfo=UTC),  # standard -> off-peak boundary
+        dt.datetime(2025, 6, 2, 0, 0, tzinfo=UTC),  # midnight
+        dt.datetime(2025, 6, 2, 7, 15, tzinfo=UTC),  # off-peak -> standard
+        dt.datetime(2025, 6, 3, 10, 0, 1, tzinfo=UTC),  # a whole day and into the peak
+    ]:
+        session = (start_time, end_time, Decimal("30.00"), Decimal("12.34"))
+        expected = reference_decimal_bill(*session, billing_service.TOU_TARIFFS, billing_service.SERVICE_FEE_PER_KWH)
+        assert billing_service.calculate_bill(*session) == expected
+
+
+# Bills round like round(Decimal, 2) in the original engine: exact half fen ties go to the even fen
+@pytest.mark.parametrize(
+    "seconds, expected_charge_fee",
+    [(6, "0.05"), (54, "0.45"), (18, "0.15"), (0.6, "0.00"), (1.8, "0.02"), (3.0, "0.02"), (4.2, "0.04")],
+)
+def test_charge_fee_ties_round_half_to_even(flat_tariff, seconds, expected_charge_fee):
+    # 30 kW at 1.00 Yuan/kWh costs 0.005 Yuan every 0.6 s
+    flat_tariff("1.00", "0.00")
+    start_time = dt.datetime(2025, 6, 2, 12, tzinfo=UTC)
+    end_time = start_time + dt.timedelta(seconds=seconds)
+    bill = billing_service.calculate_bill(start_time, end_time, Decimal("30.00"), Decimal("0"))
+    assert bill["charge_fee"] == Decimal(expected_charge_fee)
+    assert bill["total_fee"] == Decimal(expected_charge_fee)
+
+
+@pytest.mark.parametrize(
+    "amount, expected_service_fee", [("0.01", "0.00"), ("0.03", "0.02"), ("0.05", "0.02"), ("0.07", "0.04")]
+)
+def test_service_fee_ties_round_half_to_even(flat_tariff, amount, expected_service_fee):
+    # 0.50 Yuan/kWh on an odd number of 10 Wh steps is an exact half fen
+    flat_tariff("1.00", "0.50")
+    start_time = dt.datetime(2025, 6, 2, 12, tzinfo=UTC)
+    bill = billing_service.calculate_bill(start_time, start_time, Decimal("30.00"), Decimal(amount))
+    assert bill["charge_fee"] == Decimal("0.00")
+    assert bill["service_fee"] == Decimal(expected_service_fee)
+    assert bill["total_fee"] == Decimal(expected_service_fee)
+
+
+def test_total_fee_rounds_the_exact_sum_once(flat_tariff):
+    # 0.003 + 0.0025 = 0.0055 Yuan: the rounded parts are 0.00 + 0.00, but the total rounds to 0.01
+    flat_tariff("1.00", "0.50")
+    start_time = dt.datetime(2025, 6, 2, 12, tzinfo=UTC)
+    end_time = start_time + dt.timedelta(seconds=0.36)
+    bill = billing_service.calculate_bill(start_time, end_time, Decimal("30.00"), Decimal("0.005"))
+    assert (bill["charge_fee"], bill["service_fee"], bill["total_fee"]) == (
+        Decimal("0.00"),
+        Decimal("0.00"),
+        Decimal("0.01"),
+    )
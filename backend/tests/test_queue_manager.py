@@ -0,0 +1,123 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import crud, models, schemas
+from app.queue_journal import QueueJournal
+from app.queue_manager import WAITING_AREA_FULL, QueueManager, queue_manager
+from app.services.scheduling_service import scheduling_service
+
+FAST, TRICKLE = models.RequestType.FAST, models.RequestType.TRICKLE
+
+
+def new_request(charge_type=FAST, amount="20.00") -> schemas.ChargingRequestCreate:
+    return schemas.ChargingRequestCreate(
+        user_id=1, requested_charge_type=charge_type, requested_charge_amount=Decimal(amount)
+    )
+
+
+def waiting_state(request_id: int):
+    request, queue = queue_manager.waiting_area.find(request_id)
+    return queue.name, request.to_dict(), list(queue).index(request)
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        schemas.ChargingRequestUpdate(requested_charge_amount=Decimal("35.50")),
+        schemas.ChargingRequestUpdate(requested_charge_type=TRICKLE, requested_charge_amount=Decimal("35.50")),
+    ],
+)
+def test_failed_modify_leaves_memory_and_journal_unchanged(station, failing_commit, tmp_path, update):
+    journal = QueueJournal(tmp_path)
+
+    async def scenario(session_factory):
+        async with session_factory() as db:
+            results = await queue_manager.add_requests_to_waiting_queue(db, [new_request(), new_request()])
+        request_id = results[0][0].request_id
+        before = waiting_state(request_id)
+        journal_before = journal.journal_path.read_bytes()
+        version = queue_manager.version
+
+        async with session_factory() as db:
+            failing_commit(db)
+            with pytest.raises(OperationalError):
+                await queue_manager.modify_request(db, request_id, 1, update)
+
+        assert waiting_state(request_id) == before
+        assert journal.journal_path.read_bytes() == journal_before
+        assert queue_manager.version == version
+        async with session_factory() as db:
+            row = await crud.get_request(db, request_id)
+            assert (row.requested_charge_type, row.requested_charge_amount) == (FAST, Decimal("20.00"))
+
+    station(scenario, journal)
+
+
+def test_journal_replays_committed_modifications(station, tmp_path):
+    journal = QueueJournal(tmp_path)
+
+    async def scenario(session_factory):
+        async with session_factory() as db:
+            results = await queue_manager.add_requests_to_waiting_queue(db, [new_request() for _ in range(3)])
+            first, second = results[0][0].request_id, results[1][0].request_id
+            update = schemas.ChargingRequestUpdate(requested_charge_amount=Decimal("7.25"))
+            assert (await queue_manager.modify_request(db, first, 1, update))[1] is None
+            update = schemas.ChargingRequestUpdate(requested_charge_type=TRICKLE)
+            assert (await queue_manager.modify_request(db, second, 1, update))[1] is None
+
+        # A restart after a crash (no shutdown snapshot) replays the journal
+        restored = QueueManager()
+        restored.attach_journal(QueueJournal(tmp_path))
+        async with session_factory() as db:
+            await restored.initialize(db)
+            rows = {row.request_id: row for row in await crud.get_requests(db)}
+        assert restored.export_state() == queue_manager.export_state()
+        for queue in restored.waiting_area.queues:
+            for request in queue:
+                row = rows[request.request_id]
+                assert (request.requested_charge_type, request.requested_charge_amount, request.queue_number) == (
+                    row.requested_charge_type,
+                    row.requested_charge_amount,
+                    row.queue_number,
+                )
+
+    station(scenario, journal)
+
+
+def test_failed_tick_commit_keeps_the_waiting_area_within_capacity(station, failing_commit):
+    async def scenario(session_factory):
+        area = queue_manager.waiting_area
+        area.capacity, area.overflow_capacity = 4, 0
+        async with session_factory() as db:
+            results = await queue_manager.add_requests_to_waiting_queue(db, [new_request() for _ in range(4)])
+        waiting = [request.request_id for request, _ in results]
+
+        # The tick dispatches to the fast piles; admissions arrive while its commit is awaited
+        during_commit = []
+
+        async def admit():
+            for _ in range(4):
+                async with session_factory() as db:
+                    during_commit.append((await queue_manager.add_request_to_waiting_queue(db, new_request()))[1])
+
+        async with session_factory() as db:
+            failing_commit(db, during=admit)
+            with pytest.raises(OperationalError):
+                await scheduling_service.schedule_next_vehicle(db)
+
+        assert during_commit == [WAITING_AREA_FULL] * 4
+        assert len(area) <= area.capacity
+        assert area.reserved == 0
+        assert [request.request_id for request in queue_manager.waiting_queue_fast] == waiting
+        assert not any(queue_manager.pile_queues.values())
+
+        # Once the requests have really left, their places are free again
+        async with session_factory() as db:
+            await scheduling_service.schedule_next_vehicle(db)
+        assert area.reserved == 0
+        async with session_factory() as db:
+            assert (await queue_manager.add_request_to_waiting_queue(db, new_request()))[1] is None
+
+    station(scenario)
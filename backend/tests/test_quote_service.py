@@ -0,0 +1,33 @@
+from decimal import Decimal
+
+from app import crud, models
+from app.services.fault_service import fault_service
+from app.services.quote_service import quote_service
+
+
+def test_quotes_avoid_a_pile_that_faulted_while_they_were_projected(station):
+    async def scenario(session_factory):
+        async with session_factory() as db:
+            piles = [pile for pile in await crud.get_all_piles(db) if pile.type == models.PileType.FAST]
+            faulty = piles[0]
+            quote = await quote_service.quote(db, models.RequestType.FAST, Decimal("10.00"))
+            assert quote.pile_id == faulty.pile_id  # Both fast piles are idle; the first one wins ties
+
+        async with session_factory() as db:
+            commit = db.commit
+
+            async def commit_with_a_quote():
+                # A quote rebuilds its projection while the fault is being committed
+                async with session_factory() as quote_db:
+                    await quote_service.projection(quote_db)
+                await commit()
+
+            db.commit = commit_with_a_quote
+            result = await fault_service.handle_pile_fault(db, faulty.pile_id)
+            assert result["error"] is None
+
+        async with session_factory() as db:
+            quote = await quote_service.quote(db, models.RequestType.FAST, Decimal("10.00"))
+        assert quote.pile_id != faulty.pile_id
+
+    station(scenario)
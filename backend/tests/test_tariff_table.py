@@ -0,0 +1,178 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+from app.services.billing_service import billing_service
+from app.services.fixed_point import US_PER_HOUR, datetime_to_us, timedelta_to_us
+from app.services.tariff_service import tariff_service
+from app.services.tariff_table import (
+    MINUTES_PER_DAY,
+    US_PER_DAY,
+    US_PER_MINUTE,
+    CompiledTariff,
+    CompiledTariffVersion,
+    TariffSchedule,
+)
+
+rates = st.integers(min_value=0, max_value=300)
+hourly_rates = st.lists(rates, min_size=24, max_size=24)
+times_us = st.integers(min_value=-400 * US_PER_DAY, max_value=400 * US_PER_DAY)
+lengths_us = st.one_of(st.integers(0, US_PER_MINUTE), st.integers(0, US_PER_DAY), st.integers(0, 40 * US_PER_DAY))
+
+
+@st.composite
+def minute_rates(draw):
+    """A daily per-minute table: hourly rates with a few single minutes changed."""
+    table = [rate for rate in draw(hourly_rates) for _ in range(60)]
+    for minute, rate in draw(st.lists(st.tuples(st.integers(0, MINUTES_PER_DAY - 1), rates), max_size=30)):
+        table[minute] = rate
+    return table
+
+
+def reference_hourly_units(start_us: int, end_us: int, rate_fen_by_hour) -> int:
+    """The hour-by-hour walk the compiled tables replaced."""
+    units = 0
+    current_us = start_us
+    while current_us < end_us:
+        hour_index = current_us // US_PER_HOUR
+        boundary_us = min(end_us, (hour_index + 1) * US_PER_HOUR)
+        units += (boundary_us - current_us) * rate_fen_by_hour[hour_index % 24]
+        current_us = boundary_us
+    return units
+
+
+def hourly_tariff(rate_fen_by_hour) -> CompiledTariff:
+    return CompiledTariff([rate_fen_by_hour[minute // 60] for minute in range(MINUTES_PER_DAY)])
+
+
+@settings(max_examples=200, deadline=None)
+@given(hourly_rates, times_us, lengths_us)
+def test_compiled_tariff_matches_the_hourly_walk(rate_fen_by_hour, start_us, length_us):
+    tariff = hourly_tariff(rate_fen_by_hour)
+    end_us = start_us + length_us
+    assert tariff.rate_time_units(start_us, end_us) == reference_hourly_units(start_us, end_us, rate_fen_by_hour)
+
+
+@settings(max_examples=200, deadline=None)
+@given(minute_rates(), times_us, lengths_us, st.lists(st.floats(0, 1), max_size=5))
+def test_compiled_tariff_is_additive_over_splits(table, start_us, length_us, fractions):
+    tariff = CompiledTariff(table)
+    end_us = start_us + length_us
+    points = [start_us] + sorted(start_us + int(length_us * fraction) for fraction in fractions) + [end_us]
+    pieces = sum(tariff.rate_time_units(a, b) for a, b in zip(points, points[1:]))
+    assert tariff.rate_time_units(start_us, end_us) == pieces
+
+
+def test_intervals_on_midnight_and_period_boundaries():
+    # 0-7 off-peak, 7-10 standard, 10-15 peak, 15-18 standard, 18-21 peak, 21-24 standard
+    rate_fen_by_hour = [40] * 7 + [70] * 3 + [100] * 5 + [70] * 3 + [100] * 3 + [70] * 3
+    tariff = hourly_tariff(rate_fen_by_hour)
+    midnight = 10 * US_PER_DAY
+    cases = [
+        (midnight - 1, midnight + 1),  # across midnight by a microsecond
+        (midnight - US_PER_HOUR, midnight + US_PER_HOUR),
+        (midnight, midnight + US_PER_DAY),  # exactly one day
+        (midnight + 7 * US_PER_HOUR - 1, midnight + 7 * US_PER_HOUR + 1),  # off-peak -> standard
+        (midnight + 10 * US_PER_HOUR, midnight + 15 * US_PER_HOUR),  # exactly the peak
+        (midnight + 21 * US_PER_HOUR, midnight + 31 * US_PER_HOUR),  # evening through the next morning
+        (midnight + 23 * US_PER_HOUR, midnight + 5 * US_PER_DAY + US_PER_HOUR),
+    ]
+    for start_us, end_us in cases:
+        assert tariff.rate_time_units(start_us, end_us) == reference_hourly_units(start_us, end_us, rate_fen_by_hour)
+    assert tariff.rate_time_units(midnight, midnight + US_PER_DAY) == tariff.cycle_units
+    assert tariff.rate_time_units(midnight - 1, midnight + 1) == 70 + 40
+    assert tariff.rate_time_units(midnight + 5, midnight + 5) == 0
+    assert tariff.rate_time_units(midnight + 5, midnight) == 0
+
+
+@pytest.mark.parametrize("offset_minutes", [0, 60, 330, 480, -300, -570])
+def test_billing_sessions_across_midnight_match_the_hourly_walk(offset_minutes):
+    zone = dt.timezone(dt.timedelta(minutes=offset_minutes))
+    rate_fen_by_hour = [tariff_service.builtin.week.rate_fen_at(hour * US_PER_HOUR) for hour in range(24)]
+    for start_time, end_time in [
+        (dt.datetime(2025, 6, 1, 23, 59, 59, 999999, tzinfo=zone), dt.datetime(2025, 6, 2, 0, 0, 0, 1, tzinfo=zone)),
+        (dt.datetime(2025, 6, 1, 22, 30, tzinfo=zone), dt.datetime(2025, 6, 2, 7, 30, tzinfo=zone)),
+        (dt.datetime(2025, 6, 1, 6, 59, tzinfo=zone), dt.datetime(2025, 6, 4, 10, 1, tzinfo=zone)),
+    ]:
+        offset_us = timedelta_to_us(start_time.utcoffset())
+        expected = 30000 * reference_hourly_units(
+            datetime_to_us(start_time) + offset_us, datetime_to_us(end_time) + offset_us, rate_fen_by_hour
+        )
+        assert billing_service.calculate_charge_fee_units(start_time, end_time, 30000) == expected
+
+
+@settings(max_examples=50, deadline=None)
+@given(minute_rates(), st.lists(st.tuples(times_us, lengths_us), min_size=1, max_size=20))
+def test_compiled_tariff_array_form_matches_scalars(table, intervals):
+    tariff = CompiledTariff(table)
+    start_us = np.array([start for start, _ in intervals], dtype=np.int64)
+    end_us = np.array([start + length for start, length in intervals], dtype=np.int64)
+    expected = [tariff.rate_time_units(int(a), int(b)) for a, b in zip(start_us, end_us)]
+    assert tariff.rate_time_units_array(start_us, end_us).tolist() == expected
+
+
+def test_compiled_tariff_needs_whole_days():
+    with pytest.raises(ValueError):
+        CompiledTariff([])
+    with pytest.raises(ValueError):
+        CompiledTariff([1] * (MINUTES_PER_DAY + 1))
+
+
+@st.composite
+def schedules(draw):
+    """Up to four versions with minute-level weekday, weekend and holiday tables over 20 days."""
+    holidays = draw(st.lists(st.integers(0, 19), max_size=5, unique=True))
+    versions = []
+    for version_id in range(draw(st.integers(1, 4))):
+        effective_from_us = None
+        if version_id:
+            effective_from_us = draw(st.integers(0, 20 * MINUTES_PER_DAY)) * US_PER_MINUTE
+        weekday, weekend, holiday = draw(minute_rates()), draw(minute_rates()), draw(minute_rates())
+        service_fee = draw(st.integers(0, 200))
+        versions.append(
+            CompiledTariffVersion(version_id, effective_from_us, weekday, weekend, holiday, holidays, service_fee)
+        )
+    return TariffSchedule(versions)
+
+
+minute_intervals = st.tuples(st.integers(0, 20 * MINUTES_PER_DAY), st.integers(0, 3 * MINUTES_PER_DAY))
+
+
+@settings(max_examples=30, deadline=None)
+@given(schedules(), minute_intervals)
+def test_schedule_segments_match_the_minute_walk(schedule, interval):
+    # Minute-aligned on UTC, so every minute of the walk has a single version and day kind
+    start_us, end_us = interval[0] * US_PER_MINUTE, (interval[0] + interval[1]) * US_PER_MINUTE
+    expected = sum(
+        schedule.version_at(minute_us).rate_fen_at(minute_us) * US_PER_MINUTE
+        for minute_us in range(start_us, end_us, US_PER_MINUTE)
+    )
+    segments = list(schedule.segments(start_us, end_us))
+    assert sum(version.rate_time_units(a, b) for version, a, b in segments) == expected
+    assert segments[0][1] == start_us and segments[-1][2] == end_us
+    assert all(a <= b for _, a, b in segments)
+
+
+@settings(max_examples=30, deadline=None)
+@given(
+    schedules(),
+    st.lists(
+        st.tuples(st.integers(0, 20 * US_PER_DAY), st.integers(0, 3 * US_PER_DAY), st.integers(-12, 14)),
+        min_size=1,
+        max_size=20,
+    ),
+)
+def test_schedule_array_form_matches_segments(schedule, sessions):
+    start_us = np.array([start for start, _, _ in sessions], dtype=np.int64)
+    end_us = np.array([start + length for start, length, _ in sessions], dtype=np.int64)
+    offset_us = np.array([hours * US_PER_HOUR for _, _, hours in sessions], dtype=np.int64)
+    rate_units, fee_units = schedule.integrate_array(start_us, end_us, offset_us)
+    for row, (start, end, offset) in enumerate(zip(start_us.tolist(), end_us.tolist(), offset_us.tolist())):
+        segments = list(schedule.segments(start, end))
+        assert rate_units[row] == sum(version.rate_time_units(a + offset, b + offset) for version, a, b in segments)
+        assert fee_units[row] == sum((b - a) * version.service_fee_fen_per_kwh for version, a, b in segments)
+    fees = schedule.service_fee_at_array(start_us)
+    assert fees.tolist() == [schedule.version_at(start).service_fee_fen_per_kwh for start in start_us.tolist()]